@@ -6,8 +6,7 @@ from flask_login import login_required
 from models import db, Company, Market, Payment, PurchaseContainer, Sale
 from datetime import datetime
 from decimal import Decimal
-from sqlalchemy import or_
-import pandas as pd
+from sqlalchemy import or_, case, func, literal, select, tuple_, union_all
 from io import BytesIO
 
 bp = Blueprint('companies', __name__)
@@ -135,9 +134,215 @@ def delete_company(company_id):
     
     return jsonify({'success': True})
 
+def _statement_lines(company, market_id, start_date_obj=None, end_date_obj=None, before_date_obj=None):
+    """All lines of a company statement as one UNION ALL subquery.
+    
+    Columns: date, kind (source order within a day), ref_id, line (a purchase comes
+    before its expense 1), type, ref (container/invoice number or payment notes),
+    debit, credit, currency. Amounts are in original currency, as in Company.get_balance.
+    """
+    def dated(query, date_column):
+        if start_date_obj:
+            query = query.where(date_column >= start_date_obj)
+        if end_date_obj:
+            query = query.where(date_column <= end_date_obj)
+        if before_date_obj:
+            query = query.where(date_column < before_date_obj)
+        return query
+    
+    zero = literal(0, db.Numeric(10, 2))
+    selects = []
+    
+    if company.category == 'Supplier':
+        # Purchases (debit) - items only, expense1 is a separate line
+        selects.append(dated(select(
+            PurchaseContainer.date.label('date'),
+            literal(0).label('kind'),
+            PurchaseContainer.id.label('ref_id'),
+            literal(0).label('line'),
+            literal('Purchase').label('type'),
+            PurchaseContainer.container_number.label('ref'),
+            PurchaseContainer.items_total.label('debit'),
+            zero.label('credit'),
+            PurchaseContainer.currency.label('currency')
+        ).where(
+            PurchaseContainer.market_id == market_id,
+            PurchaseContainer.supplier_id == company.id
+        ), PurchaseContainer.date))
+        # Expense1 is always in container currency (same as supplier currency), use amount directly
+        selects.append(dated(select(
+            PurchaseContainer.date,
+            literal(0),
+            PurchaseContainer.id,
+            literal(1),
+            literal('Expense 1'),
+            PurchaseContainer.container_number,
+            PurchaseContainer.expense1_amount,
+            zero,
+            func.coalesce(func.nullif(PurchaseContainer.expense1_currency, ''), PurchaseContainer.currency)
+        ).where(
+            PurchaseContainer.market_id == market_id,
+            PurchaseContainer.supplier_id == company.id,
+            PurchaseContainer.expense1_amount > 0
+        ), PurchaseContainer.date))
+    elif company.category == 'Service Company':
+        # Expense2 (debit) from purchase containers
+        selects.append(dated(select(
+            PurchaseContainer.date.label('date'),
+            literal(0).label('kind'),
+            PurchaseContainer.id.label('ref_id'),
+            literal(0).label('line'),
+            literal('Expense 2').label('type'),
+            PurchaseContainer.container_number.label('ref'),
+            (PurchaseContainer.expense2_amount * func.coalesce(PurchaseContainer.expense2_exchange_rate, 1)).label('debit'),
+            zero.label('credit'),
+            func.coalesce(func.nullif(PurchaseContainer.expense2_currency, ''), PurchaseContainer.currency).label('currency')
+        ).where(
+            PurchaseContainer.market_id == market_id,
+            PurchaseContainer.expense2_service_company_id == company.id,
+            PurchaseContainer.expense2_amount > 0
+        ), PurchaseContainer.date))
+    else:
+        # Sales (debit) - use total_amount since payments are tracked separately
+        selects.append(dated(select(
+            Sale.date.label('date'),
+            literal(0).label('kind'),
+            Sale.id.label('ref_id'),
+            literal(0).label('line'),
+            literal('Sale').label('type'),
+            Sale.invoice_number.label('ref'),
+            Sale.total_amount.label('debit'),
+            zero.label('credit'),
+            literal(company.currency).label('currency')
+        ).where(
+            Sale.market_id == market_id,
+            Sale.customer_id == company.id
+        ), Sale.date))
+    
+    if company.category in ('Supplier', 'Service Company'):
+        # Regular payments are credit, loans are debit.
+        # IMPORTANT: Loan payments can be 'In' or 'Out', so both are included
+        is_debit = Payment.loan.is_(True)
+        payment_type = case((is_debit, 'Loan'), else_='Payment')
+        payment_filter = or_(Payment.payment_type == 'Out', Payment.loan.is_(True))
+    else:
+        # In payments = credit (reduces balance), Out payments = debit (increases balance)
+        is_debit = Payment.payment_type == 'Out'
+        payment_type = case((is_debit, 'Payment (Out)'), else_='Payment (In)')
+        payment_filter = Payment.payment_type.in_(['In', 'Out'])
+    selects.append(dated(select(
+        Payment.date,
+        literal(1),
+        Payment.id,
+        literal(0),
+        payment_type,
+        Payment.notes,
+        case((is_debit, Payment.amount), else_=zero),
+        case((is_debit, zero), else_=Payment.amount),
+        Payment.currency
+    ).where(
+        Payment.market_id == market_id,
+        Payment.company_id == company.id,
+        payment_filter
+    ), Payment.date))
+    
+    return union_all(*selects).subquery()
+
+
+def _statement_balance(company, market_id, before_date_obj=None):
+    """Company balance from one aggregate over the statement lines (all time, or before a date)."""
+    lines = _statement_lines(company, market_id, before_date_obj=before_date_obj)
+    total = db.session.query(func.coalesce(func.sum(lines.c.debit - lines.c.credit), 0)).scalar()
+    return Decimal(str(total))
+
+
+def _statement_query(company, market_id, start_date_obj=None, end_date_obj=None):
+    """In-range statement lines in order, with the running net and the range totals
+    (window SUMs). Returns (query, keys); keys are the ordering/paging columns."""
+    lines = _statement_lines(company, market_id, start_date_obj, end_date_obj)
+    order = (lines.c.date, lines.c.kind, lines.c.ref_id, lines.c.line)
+    ranked = db.session.query(
+        lines,
+        func.sum(lines.c.debit - lines.c.credit).over(order_by=order).label('net'),
+        func.sum(lines.c.debit).over().label('range_debit'),
+        func.sum(lines.c.credit).over().label('range_credit')
+    ).subquery()
+    keys = (ranked.c.date, ranked.c.kind, ranked.c.ref_id, ranked.c.line)
+    return db.session.query(ranked).order_by(*keys), keys
+
+
+_STATEMENT_DEFAULT_NOTES = {
+    ('Supplier', 'Loan'): 'Loan from supplier',
+    ('Supplier', 'Payment'): 'Payment to supplier',
+    ('Service Company', 'Loan'): 'Loan from service company',
+    ('Service Company', 'Payment'): 'Payment to service company',
+    ('Customer', 'Payment (In)'): 'Payment from customer',
+    ('Customer', 'Payment (Out)'): 'Payment to customer',
+}
+
+
+def _statement_entry(company, row, opening_balance):
+    if row.type == 'Purchase':
+        description = f'Container {row.ref}'
+    elif row.type in ('Expense 1', 'Expense 2'):
+        description = f'Container {row.ref} - {row.type}'
+    elif row.type == 'Sale':
+        description = f'Invoice {row.ref}'
+    else:
+        category = company.category if company.category in ('Supplier', 'Service Company') else 'Customer'
+        description = row.ref or _STATEMENT_DEFAULT_NOTES.get((category, row.type), '')
+    
+    return {
+        'date': row.date.isoformat(),
+        'type': row.type,
+        'description': description,
+        'debit': float(row.debit or 0),
+        'credit': float(row.credit or 0),
+        'currency': row.currency,
+        'affect_balance': True,
+        'balance': float(opening_balance + Decimal(str(row.net or 0)))
+    }
+
+
+def _statement_opening_entry(company, start_date, opening_balance):
+    return {
+        'date': start_date,
+        'type': 'Opening Balance',
+        'description': f'Balance as of {start_date}',
+        'debit': float(opening_balance) if opening_balance > 0 else 0,
+        'credit': float(-opening_balance) if opening_balance < 0 else 0,
+        'currency': company.currency,
+        'affect_balance': True,
+        'balance': float(opening_balance)
+    }
+
+
+def _statement_total_entry(company, opening_balance, last_row):
+    """Totals row: opening balance plus the in-range debit/credit (from the window totals)."""
+    total_debit = max(opening_balance, Decimal('0'))
+    total_credit = max(-opening_balance, Decimal('0'))
+    balance = opening_balance
+    if last_row is not None:
+        total_debit += Decimal(str(last_row.range_debit or 0))
+        total_credit += Decimal(str(last_row.range_credit or 0))
+        balance += Decimal(str(last_row.net or 0))
+    return {
+        'date': '',
+        'type': 'Total',
+        'description': 'Total Debit and Credit',
+        'debit': float(total_debit),
+        'credit': float(total_credit),
+        'currency': company.currency,
+        'affect_balance': False,  # Don't affect balance calculation
+        'balance': float(balance)
+    }
+
+
 @bp.route('/<int:company_id>/statement', methods=['GET'])
 @login_required
 def get_statement(company_id):
+    """Company statement. Optional paging: limit (lines per page) and cursor
+    (next_cursor from the previous page). The totals row comes with the last page."""
     market_id = session.get('current_market_id')
     company = Company.query.filter_by(id=company_id, market_id=market_id).first()
     
@@ -146,313 +351,46 @@ def get_statement(company_id):
     
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', type=int)
+    
+    start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+    end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
     
     statement = []
     
-    # Calculate opening balance if start_date is provided
+    # Opening balance: one aggregate over everything before start_date
     opening_balance = Decimal('0')
-    if start_date:
-        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-        
-        if company.category == 'Supplier':
-            # Calculate balance from purchases and payments before start_date
-            purchases_before = PurchaseContainer.query.filter_by(
-                supplier_id=company_id, market_id=market_id
-            ).filter(PurchaseContainer.date < start_date_obj).all()
-            
-            total_debit = sum(p.total_amount for p in purchases_before)
-            # Expense1 is always in container currency (same as supplier currency), use amount directly
-            total_debit += sum(p.expense1_amount for p in purchases_before if p.expense1_amount and p.expense1_amount > 0)
-            
-            # IMPORTANT: Include both 'Out' payments and loans (which can be 'In' or 'Out')
-            payments_before = Payment.query.filter_by(
-                company_id=company_id, market_id=market_id
-            ).filter(
-                or_(
-                    Payment.payment_type == 'Out',  # Regular payments
-                    Payment.loan.is_(True)  # Loan payments
-                )
-            ).filter(Payment.date < start_date_obj).all()
-            
-            # Use original currency amounts for opening balance (NOT base currency)
-            # Regular payments are credit, loans are debit
-            total_credit = sum(p.amount for p in payments_before if p.loan is not True)
-            total_loan_debit = sum(p.amount for p in payments_before if p.loan is True)
-            opening_balance = total_debit + total_loan_debit - total_credit
-            
-        elif company.category == 'Service Company':
-            # Calculate balance from expense2 and payments before start_date
-            purchases_before = PurchaseContainer.query.filter_by(
-                expense2_service_company_id=company_id, market_id=market_id
-            ).filter(PurchaseContainer.date < start_date_obj).all()
-            
-            total_debit = sum(p.expense2_base_currency for p in purchases_before if p.expense2_amount and p.expense2_amount > 0)
-            
-            # IMPORTANT: Include both 'Out' payments and loans (which can be 'In' or 'Out')
-            payments_before = Payment.query.filter_by(
-                company_id=company_id, market_id=market_id
-            ).filter(
-                or_(
-                    Payment.payment_type == 'Out',  # Regular payments
-                    Payment.loan.is_(True)  # Loan payments
-                )
-            ).filter(Payment.date < start_date_obj).all()
-            
-            # Use original currency amounts for opening balance (NOT base currency)
-            # Regular payments are credit, loans are debit
-            total_credit = sum(p.amount for p in payments_before if p.loan is not True)
-            total_loan_debit = sum(p.amount for p in payments_before if p.loan is True)
-            opening_balance = total_debit + total_loan_debit - total_credit
-            
-        else:  # Customer
-            # Calculate balance from sales and payments before start_date
-            sales_before = Sale.query.filter_by(
-                customer_id=company_id, market_id=market_id
-            ).filter(Sale.date < start_date_obj).all()
-            
-            total_debit = sum(s.total_amount for s in sales_before)
-            
-            # Get all payments (both In and Out) before start_date
-            payments_before = Payment.query.filter_by(
-                company_id=company_id, market_id=market_id
-            ).filter(Payment.date < start_date_obj).all()
-            
-            # Use original currency amounts for opening balance (NOT base currency)
-            # In payments = credit (reduces balance), Out payments = debit (increases balance)
-            total_credit = sum(p.amount for p in payments_before if p.payment_type == 'In')
-            total_debit_from_payments = sum(p.amount for p in payments_before if p.payment_type == 'Out')
-            opening_balance = total_debit + total_debit_from_payments - total_credit
-        
-        # Add opening balance row at the beginning
-        statement.append({
-            'date': start_date,
-            'type': 'Opening Balance',
-            'description': f'Balance as of {start_date}',
-            'debit': float(opening_balance) if opening_balance > 0 else 0,
-            'credit': float(-opening_balance) if opening_balance < 0 else 0,
-            'currency': company.currency,
-            'affect_balance': True,
-            'balance': float(opening_balance)
-        })
+    if start_date_obj:
+        opening_balance = _statement_balance(company, market_id, before_date_obj=start_date_obj)
+        if not cursor:
+            statement.append(_statement_opening_entry(company, start_date, opening_balance))
+    
+    query, keys = _statement_query(company, market_id, start_date_obj, end_date_obj)
+    if cursor:
+        try:
+            cursor_date, kind, ref_id, line = cursor.split(':')
+            cursor_key = (datetime.strptime(cursor_date, '%Y-%m-%d').date(), int(kind), int(ref_id), int(line))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(tuple_(*keys) > tuple_(*cursor_key))
+    
+    if limit:
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        rows = query.all()
+        has_more = False
     
-    if company.category == 'Supplier':
-        # Purchases (debit) - includes expense1
-        purchases = PurchaseContainer.query.filter_by(supplier_id=company_id, market_id=market_id)
-        if start_date:
-            purchases = purchases.filter(PurchaseContainer.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            purchases = purchases.filter(PurchaseContainer.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for p in purchases.all():
-            statement.append({
-                'date': p.date.isoformat(),
-                'type': 'Purchase',
-                'description': f'Container {p.container_number}',
-                'debit': float(p.total_amount),  # Items only (excludes expense1, which is shown separately)
-                'credit': 0,
-                'currency': p.currency,
-                'affect_balance': True
-            })
-            
-            # Add expense1 separately if exists (affects balance)
-            if p.expense1_amount and p.expense1_amount > 0:
-                # Expense1 is always in container currency (same as supplier currency), use amount directly
-                statement.append({
-                    'date': p.date.isoformat(),
-                    'type': 'Expense 1',
-                    'description': f'Container {p.container_number} - Expense 1',
-                    'debit': float(p.expense1_amount),
-                    'credit': 0,
-                    'currency': p.expense1_currency or p.currency,
-                    'affect_balance': True  # Include in balance calculation
-                })
-        
-        # Payments (credit) and Loans (debit)
-        # IMPORTANT: Loan payments have payment_type='In' but should be shown as debit in supplier statement
-        # So we need to query for both 'Out' (regular payments) and loans (which can be 'In' or 'Out')
-        payments = Payment.query.filter_by(company_id=company_id, market_id=market_id).filter(
-            or_(
-                Payment.payment_type == 'Out',  # Regular payments to supplier
-                Payment.loan.is_(True)  # Loan payments (can be 'In' or 'Out')
-            )
-        )
-        if start_date:
-            payments = payments.filter(Payment.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            payments = payments.filter(Payment.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for p in payments.all():
-            # Check if this is a loan payment (explicitly check for True)
-            if p.loan is True:
-                # Loan from supplier = debit (you owe them)
-                # Use original currency amount for both display and balance calculation
-                statement.append({
-                    'date': p.date.isoformat(),
-                    'type': 'Loan',
-                    'description': p.notes or 'Loan from supplier',
-                    'debit': float(p.amount),  # Original currency amount (NOT multiplied by rate)
-                    'credit': 0,
-                    'currency': p.currency,
-                    'affect_balance': True
-                })
-            else:
-                # Regular payment = credit (you paid them)
-                # Use original currency amount for both display and balance calculation
-                statement.append({
-                    'date': p.date.isoformat(),
-                    'type': 'Payment',
-                    'description': p.notes or 'Payment to supplier',
-                    'debit': 0,
-                    'credit': float(p.amount),  # Original currency amount (NOT multiplied by rate)
-                    'currency': p.currency,
-                    'affect_balance': True
-                })
+    statement.extend(_statement_entry(company, row, opening_balance) for row in rows)
     
-    elif company.category == 'Service Company':
-        # Expense2 (debit) from purchase containers
-        purchases = PurchaseContainer.query.filter_by(expense2_service_company_id=company_id, market_id=market_id)
-        if start_date:
-            purchases = purchases.filter(PurchaseContainer.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            purchases = purchases.filter(PurchaseContainer.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for p in purchases.all():
-            if p.expense2_amount and p.expense2_amount > 0:
-                statement.append({
-                    'date': p.date.isoformat(),
-                    'type': 'Expense 2',
-                    'description': f'Container {p.container_number} - Expense 2',
-                    'debit': float(p.expense2_base_currency),
-                    'credit': 0,
-                    'currency': p.expense2_currency or p.currency,
-                    'affect_balance': True
-                })
-        
-        # Payments (credit) and Loans (debit)
-        # IMPORTANT: Loan payments have payment_type='In' but should be shown as debit in service company statement
-        payments = Payment.query.filter_by(company_id=company_id, market_id=market_id).filter(
-            or_(
-                Payment.payment_type == 'Out',  # Regular payments to service company
-                Payment.loan.is_(True)  # Loan payments (can be 'In' or 'Out')
-            )
-        )
-        if start_date:
-            payments = payments.filter(Payment.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            payments = payments.filter(Payment.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for p in payments.all():
-            if p.loan is True:
-                # Loan from service company = debit (you owe them)
-                # Use original currency amount for both display and balance calculation
-                statement.append({
-                    'date': p.date.isoformat(),
-                    'type': 'Loan',
-                    'description': p.notes or 'Loan from service company',
-                    'debit': float(p.amount),  # Original currency amount (NOT multiplied by rate)
-                    'credit': 0,
-                    'currency': p.currency,
-                    'affect_balance': True
-                })
-            else:
-                # Regular payment = credit (you paid them)
-                # Use original currency amount for both display and balance calculation
-                statement.append({
-                    'date': p.date.isoformat(),
-                    'type': 'Payment',
-                    'description': p.notes or 'Payment to service company',
-                    'debit': 0,
-                    'credit': float(p.amount),  # Original currency amount (NOT multiplied by rate)
-                    'currency': p.currency,
-                    'affect_balance': True
-                })
-    
-    else:  # Customer
-        # Sales (debit) - use total_amount since payments are tracked separately
-        sales = Sale.query.filter_by(customer_id=company_id, market_id=market_id)
-        if start_date:
-            sales = sales.filter(Sale.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            sales = sales.filter(Sale.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for s in sales.all():
-            statement.append({
-                'date': s.date.isoformat(),
-                'type': 'Sale',
-                'description': f'Invoice {s.invoice_number}',
-                'debit': float(s.total_amount),  # Use total_amount, not balance
-                'credit': 0,
-                'currency': company.currency,
-                'affect_balance': True
-            })
-        
-        # Payments - both In (credit) and Out (debit)
-        payments = Payment.query.filter_by(company_id=company_id, market_id=market_id)
-        if start_date:
-            payments = payments.filter(Payment.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            payments = payments.filter(Payment.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for p in payments.all():
-            if p.payment_type == 'In':
-                # In payment = credit (reduces customer balance)
-                statement.append({
-                    'date': p.date.isoformat(),
-                    'type': 'Payment (In)',
-                    'description': p.notes or 'Payment from customer',
-                    'debit': 0,
-                    'credit': float(p.amount),
-                    'currency': p.currency,
-                    'affect_balance': True
-                })
-            elif p.payment_type == 'Out':
-                # Out payment = debit (increases customer balance - refund, return, etc.)
-                statement.append({
-                    'date': p.date.isoformat(),
-                    'type': 'Payment (Out)',
-                    'description': p.notes or 'Payment to customer',
-                    'debit': float(p.amount),
-                    'credit': 0,
-                    'currency': p.currency,
-                    'affect_balance': True
-                })
-    
-    # Sort by date
-    statement.sort(key=lambda x: x['date'])
-    
-    # Calculate running balance (excluding entries marked as not affecting balance)
-    # Start from opening balance if it exists, otherwise start from 0
-    balance = float(opening_balance) if start_date else 0
-    total_debit = 0
-    total_credit = 0
-    
-    for entry in statement:
-        # Skip opening balance entry in calculation (it's already set)
-        if entry.get('type') == 'Opening Balance':
-            # Include opening balance in totals
-            total_debit += entry.get('debit', 0)
-            total_credit += entry.get('credit', 0)
-            continue
-        # Only add to balance if affect_balance is not False
-        if entry.get('affect_balance', True):
-            # Use original currency amounts for balance calculation (NOT base currency)
-            # Base currency is only used for safe movements, not for company statement balance
-            balance += entry.get('debit', 0) - entry.get('credit', 0)
-            total_debit += entry.get('debit', 0)
-            total_credit += entry.get('credit', 0)
-        entry['balance'] = balance
-    
-    # Add totals row at the end
-    statement.append({
-        'date': '',
-        'type': 'Total',
-        'description': 'Total Debit and Credit',
-        'debit': total_debit,
-        'credit': total_credit,
-        'currency': company.currency,
-        'affect_balance': False,  # Don't affect balance calculation
-        'balance': balance
-    })
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = f'{last.date.isoformat()}:{last.kind}:{last.ref_id}:{last.line}'
+    else:
+        statement.append(_statement_total_entry(company, opening_balance, rows[-1] if rows else None))
     
     return jsonify({
         'company': {
@@ -462,7 +400,8 @@ def get_statement(company_id):
             'currency': company.currency
         },
         'statement': statement,
-        'current_balance': float(company.get_balance(market_id))
+        'next_cursor': next_cursor,
+        'current_balance': float(_statement_balance(company, market_id))
     })
 
 @bp.route('/<int:company_id>/statement/export', methods=['GET'])
@@ -477,296 +416,34 @@ def export_statement(company_id):
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    statement = []
+    start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+    end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+    
+    # Rows are written as they are fetched, same lines as the statement endpoint
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Statement')
+    columns = ['Date', 'Type', 'Description', 'Debit', 'Credit', 'Balance']
+    worksheet.append(columns)
+    
+    def write(entry):
+        worksheet.append([entry[col.lower()] for col in columns])
     
-    # Calculate opening balance if start_date is provided
     opening_balance = Decimal('0')
-    if start_date:
-        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-        
-        if company.category == 'Supplier':
-            # Calculate balance from purchases and payments before start_date
-            purchases_before = PurchaseContainer.query.filter_by(
-                supplier_id=company_id, market_id=market_id
-            ).filter(PurchaseContainer.date < start_date_obj).all()
-            
-            total_debit = sum(p.total_amount for p in purchases_before)
-            # Expense1 is always in container currency (same as supplier currency), use amount directly
-            total_debit += sum(p.expense1_amount for p in purchases_before if p.expense1_amount and p.expense1_amount > 0)
-            
-            # IMPORTANT: Include both 'Out' payments and loans (which can be 'In' or 'Out')
-            payments_before = Payment.query.filter_by(
-                company_id=company_id, market_id=market_id
-            ).filter(
-                or_(
-                    Payment.payment_type == 'Out',  # Regular payments
-                    Payment.loan.is_(True)  # Loan payments
-                )
-            ).filter(Payment.date < start_date_obj).all()
-            
-            # Use original currency amounts for opening balance (NOT base currency)
-            # Regular payments are credit, loans are debit
-            total_credit = sum(p.amount for p in payments_before if p.loan is not True)
-            total_loan_debit = sum(p.amount for p in payments_before if p.loan is True)
-            opening_balance = total_debit + total_loan_debit - total_credit
-            
-        elif company.category == 'Service Company':
-            # Calculate balance from expense2 and payments before start_date
-            purchases_before = PurchaseContainer.query.filter_by(
-                expense2_service_company_id=company_id, market_id=market_id
-            ).filter(PurchaseContainer.date < start_date_obj).all()
-            
-            total_debit = sum(p.expense2_base_currency for p in purchases_before if p.expense2_amount and p.expense2_amount > 0)
-            
-            # IMPORTANT: Include both 'Out' payments and loans (which can be 'In' or 'Out')
-            payments_before = Payment.query.filter_by(
-                company_id=company_id, market_id=market_id
-            ).filter(
-                or_(
-                    Payment.payment_type == 'Out',  # Regular payments
-                    Payment.loan.is_(True)  # Loan payments
-                )
-            ).filter(Payment.date < start_date_obj).all()
-            
-            # Use original currency amounts for opening balance (NOT base currency)
-            # Regular payments are credit, loans are debit
-            total_credit = sum(p.amount for p in payments_before if p.loan is not True)
-            total_loan_debit = sum(p.amount for p in payments_before if p.loan is True)
-            opening_balance = total_debit + total_loan_debit - total_credit
-            
-        else:  # Customer
-            # Calculate balance from sales and payments before start_date
-            sales_before = Sale.query.filter_by(
-                customer_id=company_id, market_id=market_id
-            ).filter(Sale.date < start_date_obj).all()
-            
-            total_debit = sum(s.total_amount for s in sales_before)
-            
-            # Get all payments (both In and Out) before start_date
-            payments_before = Payment.query.filter_by(
-                company_id=company_id, market_id=market_id
-            ).filter(Payment.date < start_date_obj).all()
-            
-            # Use original currency amounts for opening balance (NOT base currency)
-            # In payments = credit (reduces balance), Out payments = debit (increases balance)
-            total_credit = sum(p.amount for p in payments_before if p.payment_type == 'In')
-            total_debit_from_payments = sum(p.amount for p in payments_before if p.payment_type == 'Out')
-            opening_balance = total_debit + total_debit_from_payments - total_credit
-        
-        # Add opening balance row at the beginning
-        statement.append({
-            'Date': start_date,
-            'Type': 'Opening Balance',
-            'Description': f'Balance as of {start_date}',
-            'Debit': float(opening_balance) if opening_balance > 0 else 0,
-            'Credit': float(-opening_balance) if opening_balance < 0 else 0,
-            'Balance': float(opening_balance),
-            'affect_balance': True
-        })
+    if start_date_obj:
+        opening_balance = _statement_balance(company, market_id, before_date_obj=start_date_obj)
+        write(_statement_opening_entry(company, start_date, opening_balance))
     
-    if company.category == 'Supplier':
-        purchases = PurchaseContainer.query.filter_by(supplier_id=company_id, market_id=market_id)
-        if start_date:
-            purchases = purchases.filter(PurchaseContainer.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            purchases = purchases.filter(PurchaseContainer.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for p in purchases.all():
-            statement.append({
-                'Date': p.date.isoformat(),
-                'Type': 'Purchase',
-                'Description': f'Container {p.container_number}',
-                'Debit': float(p.total_amount),
-                'Credit': 0,
-                'Balance': 0,
-                'affect_balance': True
-            })
-            
-            # Add expense1 separately if exists (affects balance)
-            if p.expense1_amount and p.expense1_amount > 0:
-                # Expense1 is always in container currency (same as supplier currency), use amount directly
-                statement.append({
-                    'Date': p.date.isoformat(),
-                    'Type': 'Expense 1',
-                    'Description': f'Container {p.container_number} - Expense 1',
-                    'Debit': float(p.expense1_amount),
-                    'Credit': 0,
-                    'Balance': 0,
-                    'affect_balance': True  # Include in balance calculation
-                })
-        
-        # IMPORTANT: Loan payments have payment_type='In' but should be shown as debit in supplier statement
-        payments = Payment.query.filter_by(company_id=company_id, market_id=market_id).filter(
-            or_(
-                Payment.payment_type == 'Out',  # Regular payments to supplier
-                Payment.loan.is_(True)  # Loan payments (can be 'In' or 'Out')
-            )
-        )
-        if start_date:
-            payments = payments.filter(Payment.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            payments = payments.filter(Payment.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for p in payments.all():
-            if p.loan is True:
-                # Loan from supplier = debit (you owe them)
-                # Use original currency amount for both display and balance calculation
-                statement.append({
-                    'Date': p.date.isoformat(),
-                    'Type': 'Loan',
-                    'Description': p.notes or 'Loan from supplier',
-                    'Debit': float(p.amount),  # Original currency amount (NOT multiplied by rate)
-                    'Credit': 0,
-                    'Balance': 0,
-                    'affect_balance': True
-                })
-            else:
-                # Regular payment = credit (you paid them)
-                # Use original currency amount for both display and balance calculation
-                statement.append({
-                    'Date': p.date.isoformat(),
-                    'Type': 'Payment',
-                    'Description': p.notes or 'Payment to supplier',
-                    'Debit': 0,
-                    'Credit': float(p.amount),  # Original currency amount (NOT multiplied by rate)
-                    'Balance': 0,
-                    'affect_balance': True
-                })
-    elif company.category == 'Service Company':
-        # Expense2 (debit) from purchase containers
-        purchases = PurchaseContainer.query.filter_by(expense2_service_company_id=company_id, market_id=market_id)
-        if start_date:
-            purchases = purchases.filter(PurchaseContainer.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            purchases = purchases.filter(PurchaseContainer.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for p in purchases.all():
-            if p.expense2_amount and p.expense2_amount > 0:
-                statement.append({
-                    'Date': p.date.isoformat(),
-                    'Type': 'Expense 2',
-                    'Description': f'Container {p.container_number} - Expense 2',
-                    'Debit': float(p.expense2_base_currency),
-                    'Credit': 0,
-                    'Balance': 0,
-                    'affect_balance': True
-                })
-        
-        # Payments (credit) and Loans (debit)
-        # IMPORTANT: Loan payments have payment_type='In' but should be shown as debit in service company statement
-        payments = Payment.query.filter_by(company_id=company_id, market_id=market_id).filter(
-            or_(
-                Payment.payment_type == 'Out',  # Regular payments to service company
-                Payment.loan.is_(True)  # Loan payments (can be 'In' or 'Out')
-            )
-        )
-        if start_date:
-            payments = payments.filter(Payment.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            payments = payments.filter(Payment.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for p in payments.all():
-            if p.loan is True:
-                # Loan from service company = debit (you owe them)
-                # Use original currency amount for both display and balance calculation
-                statement.append({
-                    'Date': p.date.isoformat(),
-                    'Type': 'Loan',
-                    'Description': p.notes or 'Loan from service company',
-                    'Debit': float(p.amount),  # Original currency amount (NOT multiplied by rate)
-                    'Credit': 0,
-                    'Balance': 0,
-                    'affect_balance': True
-                })
-            else:
-                # Regular payment = credit (you paid them)
-                # Use original currency amount for both display and balance calculation
-                statement.append({
-                    'Date': p.date.isoformat(),
-                    'Type': 'Payment',
-                    'Description': p.notes or 'Payment to service company',
-                    'Debit': 0,
-                    'Credit': float(p.amount),  # Original currency amount (NOT multiplied by rate)
-                    'Balance': 0,
-                    'affect_balance': True
-                })
-    else:
-        sales = Sale.query.filter_by(customer_id=company_id, market_id=market_id)
-        if start_date:
-            sales = sales.filter(Sale.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            sales = sales.filter(Sale.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for s in sales.all():
-            statement.append({
-                'Date': s.date.isoformat(),
-                'Type': 'Sale',
-                'Description': f'Invoice {s.invoice_number}',
-                'Debit': float(s.total_amount),
-                'Credit': 0,
-                'Balance': 0,
-                'affect_balance': True
-            })
-        
-        payments = Payment.query.filter_by(company_id=company_id, market_id=market_id, payment_type='In')
-        if start_date:
-            payments = payments.filter(Payment.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            payments = payments.filter(Payment.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for p in payments.all():
-            statement.append({
-                'Date': p.date.isoformat(),
-                'Type': 'Payment',
-                'Description': p.notes or 'Payment from customer',
-                'Debit': 0,
-                'Credit': float(p.amount),
-                'Balance': 0,
-                'affect_balance': True
-            })
-    
-    statement.sort(key=lambda x: x['Date'])
-    
-    # Calculate running balance (excluding entries marked as not affecting balance)
-    # Start from opening balance if it exists, otherwise start from 0
-    balance = float(opening_balance) if start_date else 0
-    total_debit = 0
-    total_credit = 0
-    
-    for entry in statement:
-        # Skip opening balance entry in calculation (it's already set)
-        if entry.get('Type') == 'Opening Balance':
-            # Include opening balance in totals
-            total_debit += entry.get('Debit', 0)
-            total_credit += entry.get('Credit', 0)
-            continue
-        # Only add to balance if affect_balance is not False
-        if entry.get('affect_balance', True):
-            # Use original currency amounts for balance calculation (NOT base currency)
-            # Base currency is only used for safe movements, not for company statement balance
-            balance += entry.get('Debit', 0) - entry.get('Credit', 0)
-            total_debit += entry.get('Debit', 0)
-            total_credit += entry.get('Credit', 0)
-        entry['Balance'] = balance
-    
-    # Add totals row at the end
-    statement.append({
-        'Date': '',
-        'Type': 'Total',
-        'Description': 'Total Debit and Credit',
-        'Debit': total_debit,
-        'Credit': total_credit,
-        'Balance': balance,
-        'affect_balance': False  # Don't affect balance calculation
-    })
+    query, _ = _statement_query(company, market_id, start_date_obj, end_date_obj)
+    last_row = None
+    for row in query.yield_per(1000):
+        write(_statement_entry(company, row, opening_balance))
+        last_row = row
+    write(_statement_total_entry(company, opening_balance, last_row))
     
-    df = pd.DataFrame(statement)
     output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Statement', index=False)
-    
+    workbook.save(output)
     output.seek(0)
     filename = f'statement_{company.name.replace(" ", "_")}_{start_date or "all"}_{end_date or "all"}.xlsx'
     return send_file(output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
                     as_attachment=True, download_name=filename)
-
@@ -0,0 +1,82 @@
+"""
+Debug API endpoints (per-request SQL statistics, saved request profiles)
+"""
+from flask import Blueprint, request, jsonify, current_app, send_file
+from flask_login import login_required
+
+bp = Blueprint('debug', __name__)
+
+@bp.route('/sql', methods=['GET'])
+@login_required
+def get_sql_stats():
+    """Query count, DB time and repeated statements of the latest requests served by this worker.
+    Optional filters: path (prefix), min_queries. Administrators only (PROFILING_ADMINS)."""
+    from instrumentation import recent_requests
+    from profiling import is_profiling_admin
+    if not is_profiling_admin():
+        return jsonify({'error': 'Administrator access required'}), 403
+    
+    path = request.args.get('path')
+    min_queries = request.args.get('min_queries', type=int)
+    
+    requests_data = recent_requests()
+    if path:
+        requests_data = [r for r in requests_data if r['path'].startswith(path)]
+    if min_queries:
+        requests_data = [r for r in requests_data if r['queries'] >= min_queries]
+    
+    return jsonify({
+        'enabled': current_app.config.get('SQL_INSTRUMENTATION', False),
+        'repeat_warning_threshold': current_app.config.get('SQL_REPEAT_WARNING_THRESHOLD'),
+        'requests': requests_data
+    })
+
+@bp.route('/profiles', methods=['GET'])
+@login_required
+def get_profiles():
+    """Request profiles saved with ?_profile=1, newest first (see profiling.py)."""
+    from profiling import is_profiling_admin, list_profiles
+    if not is_profiling_admin():
+        return jsonify({'error': 'Administrator access required'}), 403
+    
+    return jsonify({
+        'enabled': current_app.config.get('PROFILING_ENABLED', False),
+        'profiles': list_profiles()
+    })
+
+@bp.route('/profiles/<profile_id>', methods=['GET'])
+@login_required
+def get_profile(profile_id):
+    """One profile with its call tree and SQL timeline."""
+    from profiling import is_profiling_admin, load_profile
+    if not is_profiling_admin():
+        return jsonify({'error': 'Administrator access required'}), 403
+    
+    profile = load_profile(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return jsonify(profile)
+
+@bp.route('/profiles/<profile_id>/download', methods=['GET'])
+@login_required
+def download_profile(profile_id):
+    """Raw profiler output: pyinstrument HTML or a cProfile .prof file (snakeviz, pstats)."""
+    from profiling import is_profiling_admin, profile_download_path
+    if not is_profiling_admin():
+        return jsonify({'error': 'Administrator access required'}), 403
+    
+    path = profile_download_path(profile_id)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, as_attachment=True)
+
+@bp.route('/profiles/<profile_id>', methods=['DELETE'])
+@login_required
+def delete_profile(profile_id):
+    from profiling import is_profiling_admin, delete_profile as remove_profile
+    if not is_profiling_admin():
+        return jsonify({'error': 'Administrator access required'}), 403
+    
+    if not remove_profile(profile_id):
+        return jsonify({'error': 'Profile not found'}), 404
+    return jsonify({'success': True})
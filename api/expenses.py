@@ -4,14 +4,18 @@ General Expenses API endpoints
 from flask import Blueprint, request, jsonify, session, send_file
 from flask_login import login_required
 from models import db, GeneralExpense, SafeTransaction, Market
+from api.pagination import page_args, fetch_page, text_search
+from api.safe import post_safe_transaction, lock_safe_ledger, recalc_safe_balances_from
+from sqlalchemy import func
 from decimal import Decimal
 from datetime import datetime
-import pandas as pd
 from io import BytesIO
-from openpyxl.utils import get_column_letter
 
 bp = Blueprint('expenses', __name__)
 
+# Rows per INSERT batch for bulk imports
+IMPORT_BATCH_SIZE = 500
+
 @bp.route('', methods=['GET'])
 @login_required
 def get_expenses():
@@ -22,6 +26,16 @@ def get_expenses():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     category = request.args.get('category')
+    search = request.args.get('q', '').strip()
+    
+    try:
+        page = page_args({
+            'date': GeneralExpense.date,
+            'amount': GeneralExpense.amount,
+            'category': GeneralExpense.category,
+        }, 'date')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     query = GeneralExpense.query.filter_by(market_id=market_id)
     
@@ -31,11 +45,19 @@ def get_expenses():
         query = query.filter(GeneralExpense.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
     if end_date:
         query = query.filter(GeneralExpense.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    if search:
+        query = query.filter(text_search(search, GeneralExpense.description, GeneralExpense.category))
     
-    expenses = query.order_by(GeneralExpense.date.desc(), GeneralExpense.id.desc()).all()
+    # Totals of all matching expenses (first page only; later pages are appended to it)
+    totals = {}
+    if not page.cursor:
+        count, total_base_currency = query.with_entities(
+            func.count(GeneralExpense.id),
+            func.coalesce(func.sum(GeneralExpense.amount * GeneralExpense.exchange_rate), 0),
+        ).one()
+        totals = {'total_base_currency': float(total_base_currency), 'count': count}
     
-    # Calculate total in base currency
-    total_base_currency = sum(e.amount_base_currency for e in expenses)
+    expenses, next_cursor = fetch_page(query, page, GeneralExpense.id)
     
     return jsonify({
         'expenses': [{
@@ -48,8 +70,8 @@ def get_expenses():
             'exchange_rate': float(e.exchange_rate),
             'amount_base_currency': float(e.amount_base_currency)
         } for e in expenses],
-        'total_base_currency': float(total_base_currency),
-        'count': len(expenses)
+        'next_cursor': next_cursor,
+        **totals
     })
 
 @bp.route('/categories', methods=['GET'])
@@ -90,13 +112,6 @@ def create_expense():
     db.session.flush()
     
     # Create safe transaction (outflow)
-    last_transaction = SafeTransaction.query.filter_by(market_id=market_id).order_by(
-        SafeTransaction.date.desc(), SafeTransaction.id.desc()
-    ).first()
-    
-    balance_before = last_transaction.balance_after if last_transaction else Decimal('0')
-    balance_after = balance_before - expense.amount_base_currency
-    
     # Calculate exact base currency amount
     exact_base_amount = expense.amount * expense.exchange_rate
     
@@ -109,17 +124,12 @@ def create_expense():
         amount_base_currency_stored=exact_base_amount,  # Store exact value directly
         date=expense.date,
         description=f'General Expense - {expense.category}: {expense.description}',
-        general_expense_id=expense.id,
-        balance_after=balance_after
+        general_expense_id=expense.id
     )
     
-    db.session.add(safe_transaction)
+    post_safe_transaction(safe_transaction)
     db.session.commit()
     
-    # Recalculate balances
-    from api.safe import recalc_safe_balances
-    recalc_safe_balances(market_id)
-    
     return jsonify({
         'id': expense.id,
         'date': expense.date.isoformat(),
@@ -226,6 +236,7 @@ def delete_expense(expense_id):
 @bp.route('/import', methods=['POST'])
 @login_required
 def import_expenses():
+    import pandas as pd
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -258,11 +269,10 @@ def import_expenses():
         if missing_cols:
             return jsonify({'error': f'Missing columns: {", ".join(missing_cols)}. Found: {", ".join(df.columns.tolist())}'}), 400
         
-        market = Market.query.get(market_id)
         errors = []
-        created_expenses = 0
+        parsed_rows = []
         
-        for idx, row in df.iterrows():
+        for idx, row in enumerate(df.to_dict('records')):
             try:
                 date_val = pd.to_datetime(row['Date']).date()
                 description = str(row['Description']).strip()
@@ -279,7 +289,7 @@ def import_expenses():
                     errors.append(f'Row {idx + 2}: Category is required')
                     continue
                 
-                expense = GeneralExpense(
+                parsed_rows.append(GeneralExpense(
                     market_id=market_id,
                     date=date_val,
                     description=description,
@@ -287,51 +297,48 @@ def import_expenses():
                     amount=amount,
                     currency=currency,
                     exchange_rate=exchange_rate
-                )
-                
-                db.session.add(expense)
-                db.session.flush()
-                
-                # Create safe transaction (outflow)
-                last_transaction = SafeTransaction.query.filter_by(market_id=market_id).order_by(
-                    SafeTransaction.date.desc(), SafeTransaction.id.desc()
-                ).first()
-                
-                balance_before = last_transaction.balance_after if last_transaction else Decimal('0')
-                balance_after = balance_before - expense.amount_base_currency
-                
-                # Calculate exact base currency amount
-                exact_base_amount = expense.amount * expense.exchange_rate
-                
-                safe_transaction = SafeTransaction(
-                    market_id=market_id,
-                    transaction_type='Outflow',
-                    amount=expense.amount,
-                    currency=expense.currency,
-                    exchange_rate=expense.exchange_rate,
-                    amount_base_currency_stored=exact_base_amount,  # Store exact value directly
-                    date=expense.date,
-                    description=f'General Expense - {expense.category}: {expense.description}',
-                    general_expense_id=expense.id,
-                    balance_after=balance_after
-                )
-                
-                db.session.add(safe_transaction)
-                created_expenses += 1
+                ))
             
             except Exception as e:
                 errors.append(f'Row {idx + 2}: {str(e)}')
                 continue
         
-        db.session.commit()
+        if not parsed_rows:
+            return jsonify({
+                'success': True,
+                'expenses_created': 0,
+                'errors': errors
+            })
+        
+        # Insert expenses and their safe outflows in batches; flushing a batch
+        # assigns the expense ids the safe transactions link to. The ledger lock
+        # serializes with the other safe writers until the running-balance pass commits
+        lock_safe_ledger(market_id)
+        for i in range(0, len(parsed_rows), IMPORT_BATCH_SIZE):
+            batch = parsed_rows[i:i + IMPORT_BATCH_SIZE]
+            db.session.add_all(batch)
+            db.session.flush()
+            
+            db.session.add_all([SafeTransaction(
+                market_id=market_id,
+                transaction_type='Outflow',
+                amount=expense.amount,
+                currency=expense.currency,
+                exchange_rate=expense.exchange_rate,
+                amount_base_currency_stored=expense.amount * expense.exchange_rate,  # Store exact value directly
+                date=expense.date,
+                description=f'General Expense - {expense.category}: {expense.description}',
+                general_expense_id=expense.id,
+                balance_after=Decimal('0')  # Set by the running-balance pass below
+            ) for expense in batch])
+            db.session.flush()
         
-        # Recalculate balances
-        from api.safe import recalc_safe_balances
-        recalc_safe_balances(market_id)
+        # Recalculate balances from the earliest imported date only, committed with the inserts
+        recalc_safe_balances_from(market_id, min(expense.date for expense in parsed_rows))
         
         return jsonify({
             'success': True,
-            'expenses_created': created_expenses,
+            'expenses_created': len(parsed_rows),
             'errors': errors
         })
     
@@ -345,6 +352,8 @@ def export_expenses():
     """Export general expenses to Excel - formatted for import to another market
     Format matches import requirements: Date, Description, Category, Amount, Currency, ExchangeRate
     """
+    import pandas as pd
+    from openpyxl.utils import get_column_letter
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
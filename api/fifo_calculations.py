@@ -8,67 +8,55 @@ from decimal import Decimal
 from datetime import datetime
 from sqlalchemy import func, case
 from sqlalchemy.orm import joinedload
+from metrics import timed
 
 
-def create_inventory_batches_for_container(container_id):
-    """Create inventory batches when a container is added (for FIFO)"""
-    container = PurchaseContainer.query.get(container_id)
-    if not container:
-        return
-    
-    # Check if batches already exist for this container
-    existing_batches = InventoryBatch.query.filter_by(container_id=container_id).first()
-    if existing_batches:
-        return  # Already created
-    
-    # Calculate expenses in container's original currency (same logic as Average method)
-    # Convert each expense to container currency if needed
-    expense1_in_container_currency = Decimal('0')
-    if container.expense1_amount and container.expense1_amount > 0:
-        if container.expense1_currency == container.currency:
-            expense1_in_container_currency = container.expense1_amount
-        else:
-            # Convert to base currency first, then to container currency
-            expense1_base = container.expense1_amount * (container.expense1_exchange_rate or 1)
-            container_rate = container.exchange_rate or 1
-            if container_rate > 0:
-                expense1_in_container_currency = expense1_base / container_rate
-    
-    expense2_in_container_currency = Decimal('0')
-    if container.expense2_amount and container.expense2_amount > 0:
-        if container.expense2_currency == container.currency:
-            expense2_in_container_currency = container.expense2_amount
-        else:
-            # Convert to base currency first, then to container currency
-            expense2_base = container.expense2_amount * (container.expense2_exchange_rate or 1)
-            container_rate = container.exchange_rate or 1
-            if container_rate > 0:
-                expense2_in_container_currency = expense2_base / container_rate
-    
-    expense3_in_container_currency = Decimal('0')
-    if container.expense3_amount and container.expense3_amount > 0:
-        if container.expense3_currency == container.currency:
-            expense3_in_container_currency = container.expense3_amount
-        else:
-            # Convert to base currency first, then to container currency
-            expense3_base = container.expense3_amount * (container.expense3_exchange_rate or 1)
-            container_rate = container.exchange_rate or 1
-            if container_rate > 0:
-                expense3_in_container_currency = expense3_base / container_rate
-    
-    # Total expenses in container currency
-    sum_expenses = expense1_in_container_currency + expense2_in_container_currency + expense3_in_container_currency
-    
+class InsufficientInventoryError(Exception):
+    """A sale line needs more of an item than its inventory batches have available."""
+
+    def __init__(self, item_id, needed, available):
+        self.item_id = item_id
+        self.needed = needed
+        self.available = available
+        super().__init__(f'Insufficient inventory for item {item_id}: needed {needed}, available {available}')
+
+
+def container_expenses_in_container_currency(container):
+    """Sum of expense 1/2/3 converted to the container's currency"""
+    def _convert(amount, currency, rate):
+        if not amount or amount <= 0:
+            return Decimal('0')
+        if currency == container.currency:
+            return amount
+        # Convert to base currency first, then to container currency
+        expense_base = amount * (rate or 1)
+        container_rate = container.exchange_rate or 1
+        if container_rate > 0:
+            return expense_base / container_rate
+        return Decimal('0')
+
+    return (
+        _convert(container.expense1_amount, container.expense1_currency, container.expense1_exchange_rate) +
+        _convert(container.expense2_amount, container.expense2_currency, container.expense2_exchange_rate) +
+        _convert(container.expense3_amount, container.expense3_currency, container.expense3_exchange_rate)
+    )
+
+
+def calculate_landed_costs(container, lines):
+    """Landed cost for each purchase line of a container.
+
+    lines is a list of (quantity, unit_price, item_weight) tuples covering the whole container.
+    Returns a list of (cog_per_unit, cost_per_unit) in the same order, in container currency.
+    """
+    sum_expenses = container_expenses_in_container_currency(container)
+
     # Calculate total quantity and total weight for the container
-    total_quantity = sum(item.quantity for item in container.items)
-    total_weight = sum((item.item.weight or Decimal('0')) * item.quantity 
-                      for item in container.items)
-    
-    for purchase_item in container.items:
-        item = purchase_item.item
-        item_weight = item.weight or Decimal('0')
-        
-        # Calculate COG per unit using the exact formula:
+    total_quantity = sum(qty for qty, _, _ in lines)
+    total_weight = sum((weight or Decimal('0')) * qty for qty, _, weight in lines)
+
+    costs = []
+    for qty, unit_price, weight in lines:
+        item_weight = weight or Decimal('0')
         # COG Per Unit = (Total Expenses ÷ 2 ÷ Total Container Quantity) + (Total Expenses ÷ 2 ÷ Total Container Weight × Item Weight)
         if total_quantity > 0 and total_weight > 0:
             cog_per_unit = (sum_expenses / Decimal('2') / total_quantity) + \
@@ -78,16 +66,28 @@ def create_inventory_batches_for_container(container_id):
             cog_per_unit = sum_expenses / total_quantity
         else:
             cog_per_unit = Decimal('0')
-        
         # Cost per unit = Unit Purchase Price + COG Per Unit
-        cost_per_unit = purchase_item.unit_price + cog_per_unit
-        
-        # Create inventory batch (batch code = container number)
-        batch = InventoryBatch(
+        costs.append((cog_per_unit, unit_price + cog_per_unit))
+    return costs
+
+
+def build_inventory_batches(container, purchase_items, weights_by_item_id):
+    """Build (unsaved) inventory batches for a container's purchase items.
+
+    purchase_items must be flushed (have ids); weights_by_item_id maps item_id -> item weight so
+    no relationship is loaded per line.
+    """
+    costs = calculate_landed_costs(container, [
+        (pi.quantity, pi.unit_price, weights_by_item_id[pi.item_id]) for pi in purchase_items
+    ])
+    batches = []
+    for purchase_item, (cog_per_unit, cost_per_unit) in zip(purchase_items, costs):
+        # Batch code = container number
+        batches.append(InventoryBatch(
             market_id=container.market_id,
             item_id=purchase_item.item_id,
             purchase_item_id=purchase_item.id,
-            container_id=container_id,
+            container_id=container.id,
             purchase_date=container.date,
             original_quantity=purchase_item.quantity,
             available_quantity=purchase_item.quantity,
@@ -96,72 +96,102 @@ def create_inventory_batches_for_container(container_id):
             cost_per_unit=cost_per_unit,  # Unit Price + COG Per Unit
             currency=container.currency,
             exchange_rate=container.exchange_rate
-        )
-        db.session.add(batch)
+        ))
+    return batches
+
+
+@timed('fifo_allocation_duration_seconds', operation='create_batches')
+def create_inventory_batches_for_container(container_id):
+    """Create inventory batches when a container is added (for FIFO)"""
+    container = PurchaseContainer.query.get(container_id)
+    if not container:
+        return
+    
+    # Check if batches already exist for this container
+    existing_batches = InventoryBatch.query.filter_by(container_id=container_id).first()
+    if existing_batches:
+        return  # Already created
     
+    purchase_items = PurchaseItem.query.options(joinedload(PurchaseItem.item)).filter_by(container_id=container_id).all()
+    weights_by_item_id = {pi.item_id: pi.item.weight for pi in purchase_items}
+    db.session.add_all(build_inventory_batches(container, purchase_items, weights_by_item_id))
     db.session.commit()
 
 
-def allocate_sale_item_fifo(sale_item):
-    """Allocate sale item to oldest inventory batches (FIFO)"""
-    item_id = sale_item.item_id
-    quantity_needed = sale_item.quantity
-    sale_date = sale_item.sale.date
+@timed('fifo_allocation_duration_seconds', operation='allocate_sale_items')
+def allocate_sale_items_fifo(market_id, sale_items):
+    """Allocate the flushed items of a sale to the oldest inventory batches (FIFO).
+
+    The available batches of every item on the sale are loaded in one query and locked
+    (SELECT ... FOR UPDATE, in item/purchase order) so a concurrent sale of the same item waits
+    instead of allocating the same stock. Does not commit: the allocations belong to the
+    caller's transaction. Returns the total cost in base currency.
+
+    Raises InsufficientInventoryError if a line cannot be fully allocated; the caller rolls back.
+    """
+    item_ids = sorted({sale_item.item_id for sale_item in sale_items})
+    if not item_ids:
+        return Decimal('0')
     
     # Get available batches ordered by purchase date (oldest first)
-    batches = InventoryBatch.query.filter_by(
-        market_id=sale_item.sale.market_id,
-        item_id=item_id
-    ).filter(
+    batches = InventoryBatch.query.filter(
+        InventoryBatch.market_id == market_id,
+        InventoryBatch.item_id.in_(item_ids),
         InventoryBatch.available_quantity > 0
     ).order_by(
+        InventoryBatch.item_id.asc(),
         InventoryBatch.purchase_date.asc(),
         InventoryBatch.id.asc()  # For batches on same date
-    ).all()
+    ).with_for_update().all()
+    batches_by_item = {}
+    for batch in batches:
+        batches_by_item.setdefault(batch.item_id, []).append(batch)
     
-    remaining_quantity = quantity_needed
     total_cost = Decimal('0')
-    
-    for batch in batches:
-        if remaining_quantity <= 0:
-            break
-        
-        # Calculate how much to take from this batch
-        quantity_from_batch = min(remaining_quantity, batch.available_quantity)
-        
-        # Convert cost to base currency
-        # Cost Per Unit (Base) = Cost Per Unit (Container Currency) × Exchange Rate
-        # Cost Per Unit = Unit Purchase Price + COG Per Unit
-        # Exchange Rate: 1 unit of container currency = exchange_rate units of base currency
-        if batch.exchange_rate and batch.exchange_rate > 0:
-            cost_per_unit_base = batch.cost_per_unit * batch.exchange_rate
-        else:
-            cost_per_unit_base = batch.cost_per_unit
-        total_cost_batch = cost_per_unit_base * quantity_from_batch
+    for sale_item in sale_items:
+        quantity_needed = sale_item.quantity
+        remaining_quantity = quantity_needed
         
-        # Create allocation record
-        allocation = SaleItemAllocation(
-            sale_item_id=sale_item.id,
-            batch_id=batch.id,
-            quantity=quantity_from_batch,
-            cost_per_unit=cost_per_unit_base,
-            total_cost=total_cost_batch
-        )
-        db.session.add(allocation)
-        
-        # Update batch available quantity
-        batch.available_quantity -= quantity_from_batch
+        for batch in batches_by_item.get(sale_item.item_id, []):
+            if remaining_quantity <= 0:
+                break
+            # Drained by an earlier line of the same sale
+            if batch.available_quantity <= 0:
+                continue
+            
+            # Calculate how much to take from this batch
+            quantity_from_batch = min(remaining_quantity, batch.available_quantity)
+            
+            # Convert cost to base currency
+            # Cost Per Unit (Base) = Cost Per Unit (Container Currency) × Exchange Rate
+            # Cost Per Unit = Unit Purchase Price + COG Per Unit
+            # Exchange Rate: 1 unit of container currency = exchange_rate units of base currency
+            if batch.exchange_rate and batch.exchange_rate > 0:
+                cost_per_unit_base = batch.cost_per_unit * batch.exchange_rate
+            else:
+                cost_per_unit_base = batch.cost_per_unit
+            total_cost_batch = cost_per_unit_base * quantity_from_batch
+            
+            # Create allocation record
+            allocation = SaleItemAllocation(
+                sale_item_id=sale_item.id,
+                batch_id=batch.id,
+                quantity=quantity_from_batch,
+                cost_per_unit=cost_per_unit_base,
+                total_cost=total_cost_batch
+            )
+            db.session.add(allocation)
+            
+            # Update batch available quantity
+            batch.available_quantity -= quantity_from_batch
+            
+            remaining_quantity -= quantity_from_batch
+            total_cost += total_cost_batch
         
-        remaining_quantity -= quantity_from_batch
-        total_cost += total_cost_batch
+        if remaining_quantity > 0:
+            raise InsufficientInventoryError(sale_item.item_id, quantity_needed,
+                                             quantity_needed - remaining_quantity)
     
-    if remaining_quantity > 0:
-        # Not enough inventory - this should be handled by validation before sale creation
-        # For now, we'll log it but continue
-        print(f"Warning: Insufficient inventory for item {sale_item.item.code}. "
-              f"Needed: {quantity_needed}, Available: {quantity_needed - remaining_quantity}")
-    
-    db.session.commit()
     return total_cost
 
 
@@ -456,6 +486,7 @@ def get_stock_by_supplier_fifo(market_id):
     }
 
 
+@timed('fifo_allocation_duration_seconds', operation='backfill_batches')
 def backfill_fifo_batches(market_id):
     """Create batches for all existing purchases (historical data backfill)"""
     containers = PurchaseContainer.query.filter_by(market_id=market_id).all()
@@ -470,6 +501,7 @@ def backfill_fifo_batches(market_id):
     
     return created_count
 
+@timed('fifo_allocation_duration_seconds', operation='backfill_allocations')
 def backfill_fifo_allocations(market_id):
     """Allocate all existing sales to inventory batches (historical data backfill)"""
     from models import Sale, SaleItem
@@ -4,9 +4,11 @@ Inventory Adjustments API endpoints
 from flask import Blueprint, request, jsonify, session
 from flask_login import login_required
 from models import db, InventoryAdjustment, Item, Market
+from api.pagination import page_args, fetch_page, text_search
+from sqlalchemy import func, or_
+from sqlalchemy.orm import joinedload
 from decimal import Decimal
 from datetime import datetime
-import pandas as pd
 from io import BytesIO
 
 bp = Blueprint('inventory', __name__)
@@ -20,14 +22,34 @@ def get_adjustments():
         return jsonify({'error': 'No market selected'}), 400
     
     item_id = request.args.get('item_id', type=int)
+    adjustment_type = request.args.get('adjustment_type')  # Increase, Decrease
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    search = request.args.get('q', '').strip()
+    
+    try:
+        page = page_args({'date': InventoryAdjustment.date, 'quantity': InventoryAdjustment.quantity}, 'date')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     query = InventoryAdjustment.query.filter_by(market_id=market_id)
     if item_id:
         query = query.filter_by(item_id=item_id)
-    
-    adjustments = query.order_by(InventoryAdjustment.date.desc(), InventoryAdjustment.id.desc()).all()
-    
-    return jsonify([{
+    if adjustment_type:
+        query = query.filter_by(adjustment_type=adjustment_type)
+    if start_date:
+        query = query.filter(InventoryAdjustment.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+    if end_date:
+        query = query.filter(InventoryAdjustment.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    if search:
+        matching_items = db.select(Item.id).where(text_search(search, Item.code, Item.name))
+        query = query.filter(or_(text_search(search, InventoryAdjustment.reason, InventoryAdjustment.notes),
+                                 InventoryAdjustment.item_id.in_(matching_items)))
+    
+    adjustments, next_cursor = fetch_page(query.options(joinedload(InventoryAdjustment.item).load_only(Item.code, Item.name)),
+                                          page, InventoryAdjustment.id)
+    
+    rows = [{
         'id': adj.id,
         'item_id': adj.item_id,
         'item_code': adj.item.code,
@@ -38,7 +60,14 @@ def get_adjustments():
         'reason': adj.reason,
         'notes': adj.notes,
         'created_at': adj.created_at.isoformat() if adj.created_at else None
-    } for adj in adjustments])
+    } for adj in adjustments]
+    if not page.limit:
+        return jsonify(rows)
+    
+    result = {'adjustments': rows, 'next_cursor': next_cursor}
+    if not page.cursor:
+        result['count'] = query.with_entities(func.count(InventoryAdjustment.id)).scalar()
+    return jsonify(result)
 
 @bp.route('/adjustments', methods=['POST'])
 @login_required
@@ -256,7 +285,10 @@ def process_physical_count():
     1. Calculate current inventory for each item (purchases - sales + adjustments)
     2. Calculate difference: real_count - current_inventory
     3. Automatically create Increase or Decrease adjustments to match real count
+    
+    Send form field dry_run=true to preview the differences without saving anything.
     """
+    import pandas as pd
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -288,177 +320,133 @@ def process_physical_count():
         if missing_cols:
             return jsonify({'error': f'Missing columns: {", ".join(missing_cols)}. Found columns: {", ".join(df.columns.tolist())}'}), 400
         
+        dry_run = str(request.form.get('dry_run', '')).lower() in ['1', 'true', 'yes']
+        
         # Get all items for this market
         items = Item.query.filter_by(market_id=market_id).all()
         items_by_code = {item.code: item for item in items}
         
-        # Calculate inventory for all items (by snapshot date)
-        from models import PurchaseItem, SaleItem, PurchaseContainer, Sale
-        from sqlalchemy import func, case
+        # Normalize the sheet column-wise
+        df['__row'] = df.index + 2
+        df['__code'] = df['ItemCode'].fillna('').astype(str).str.strip()
+        df['__count_date'] = pd.to_datetime(df['Date'], errors='coerce')
+        df['__qty'] = pd.to_numeric(df['Quantity'], errors='coerce')
+        df['__item_id'] = df['__code'].map(lambda c: items_by_code[c].id if c in items_by_code else None)
         
-        # Parse and normalize count dates up front
-        df['__count_date'] = pd.to_datetime(df['Date']).dt.date
-        unique_dates = sorted(df['__count_date'].dropna().unique())
+        checks = [
+            (lambda d: d['__count_date'].isna(), lambda r: f'Row {r["__row"]}: Date is invalid'),
+            (lambda d: d['__code'] == '', lambda r: f'Row {r["__row"]}: ItemCode is empty'),
+            (lambda d: d['__qty'].isna(), lambda r: f'Row {r["__row"]}: Quantity is invalid'),
+            (lambda d: d['__qty'] < 0, lambda r: f'Row {r["__row"]}: Quantity cannot be negative'),
+            (lambda d: d['__item_id'].isna(), lambda r: f'Row {r["__row"]}: Item code "{r["__code"]}" not found'),
+        ]
+        row_errors = []
+        for check, message in checks:
+            mask = check(df)
+            row_errors.extend((r['__row'], message(r)) for r in df[mask].to_dict('records'))
+            df = df[~mask]
+        errors = [message for _, message in sorted(row_errors, key=lambda e: e[0])]
         
-        # Only consider items included in the file
-        item_codes = [str(code).strip() for code in df['ItemCode'].tolist()]
-        item_ids = [items_by_code[code].id for code in item_codes if code in items_by_code]
+        results = []
+        adjustments = []
         
-        # Build inventory snapshots per date (purchases - sales + adjustments up to date)
-        inventory_by_date = {}
-        for snapshot_date in unique_dates:
-            # Get purchases per item up to snapshot date
-            purchase_q = db.session.query(
-                PurchaseItem.item_id,
-                func.coalesce(func.sum(PurchaseItem.quantity), 0).label('total_purchases')
-            ).join(PurchaseContainer, PurchaseItem.container_id == PurchaseContainer.id) \
-             .filter(
-                PurchaseContainer.market_id == market_id,
-                PurchaseContainer.date <= snapshot_date,
-                PurchaseItem.item_id.in_(item_ids) if item_ids else True
-            ) \
-             .group_by(PurchaseItem.item_id).all()
-            purchase_map = {item_id: Decimal(str(qty)) for item_id, qty in purchase_q}
+        if not df.empty:
+            df = df.copy()
+            df['__item_id'] = df['__item_id'].astype(int)
+            item_ids = [int(i) for i in df['__item_id'].unique()]
             
-            # Get sales per item up to snapshot date
-            sales_q = db.session.query(
-                SaleItem.item_id,
-                func.coalesce(func.sum(SaleItem.quantity), 0).label('total_sales')
-            ).join(Sale, SaleItem.sale_id == Sale.id) \
-             .filter(
-                Sale.market_id == market_id,
-                Sale.date <= snapshot_date,
-                SaleItem.item_id.in_(item_ids) if item_ids else True
-            ) \
-             .group_by(SaleItem.item_id).all()
-            sales_map = {item_id: Decimal(str(qty)) for item_id, qty in sales_q}
+            # System quantity as of every count date in one query: net daily movements per
+            # item (purchases - sales + adjustments) with a running total window
+            from models import PurchaseItem, SaleItem, PurchaseContainer, Sale
+            from sqlalchemy import func, case, select, union_all
             
-            # Get adjustments per item up to snapshot date
-            adjustments_q = db.session.query(
-                InventoryAdjustment.item_id,
-                func.sum(
-                    case(
-                        (InventoryAdjustment.adjustment_type == 'Increase', InventoryAdjustment.quantity),
-                        else_=-InventoryAdjustment.quantity
-                    )
-                ).label('net_adjustments')
-            ).filter(
-                InventoryAdjustment.market_id == market_id,
-                InventoryAdjustment.date <= snapshot_date,
-                InventoryAdjustment.item_id.in_(item_ids) if item_ids else True
-            ) \
-             .group_by(InventoryAdjustment.item_id).all()
-            adjustments_map = {item_id: Decimal(str(qty)) if qty else Decimal('0') for item_id, qty in adjustments_q}
+            max_date = df['__count_date'].max().date()
+            movements = union_all(
+                select(PurchaseItem.item_id.label('item_id'), PurchaseContainer.date.label('date'),
+                       PurchaseItem.quantity.label('qty'))
+                .join(PurchaseContainer, PurchaseItem.container_id == PurchaseContainer.id)
+                .where(PurchaseContainer.market_id == market_id, PurchaseContainer.date <= max_date,
+                       PurchaseItem.item_id.in_(item_ids)),
+                select(SaleItem.item_id, Sale.date, -SaleItem.quantity)
+                .join(Sale, SaleItem.sale_id == Sale.id)
+                .where(Sale.market_id == market_id, Sale.date <= max_date, SaleItem.item_id.in_(item_ids)),
+                select(InventoryAdjustment.item_id, InventoryAdjustment.date,
+                       case((InventoryAdjustment.adjustment_type == 'Increase', InventoryAdjustment.quantity),
+                            else_=-InventoryAdjustment.quantity))
+                .where(InventoryAdjustment.market_id == market_id, InventoryAdjustment.date <= max_date,
+                       InventoryAdjustment.item_id.in_(item_ids))
+            ).subquery()
+            daily = select(
+                movements.c.item_id, movements.c.date, func.sum(movements.c.qty).label('net')
+            ).group_by(movements.c.item_id, movements.c.date).subquery()
+            ledger_rows = db.session.execute(select(
+                daily.c.item_id, daily.c.date,
+                func.sum(daily.c.net).over(partition_by=daily.c.item_id, order_by=daily.c.date).label('on_hand')
+            )).all()
             
-            inventory_by_date[snapshot_date] = {
-                'purchase_map': purchase_map,
-                'sales_map': sales_map,
-                'adjustments_map': adjustments_map
-            }
-        
-        # Process each row
-        results = []
-        errors = []
-        adjustments_created = 0
-        
-        for idx, row in df.iterrows():
-            try:
-                item_code = str(row['ItemCode']).strip()
-                real_count = Decimal(str(row['Quantity']))
-                count_date = row['__count_date']
-                if pd.isna(count_date):
-                    errors.append(f'Row {idx + 2}: Date is invalid')
-                    continue
-                
-                # Validate data
-                if not item_code:
-                    errors.append(f'Row {idx + 2}: ItemCode is empty')
-                    continue
-                
-                if real_count < 0:
-                    errors.append(f'Row {idx + 2}: Quantity cannot be negative')
-                    continue
-                
-                # Find item
-                item = items_by_code.get(item_code)
-                if not item:
-                    errors.append(f'Row {idx + 2}: Item code "{item_code}" not found')
-                    continue
-                
-                # Calculate current inventory
-                snapshot_maps = inventory_by_date.get(count_date)
-                if not snapshot_maps:
-                    errors.append(f'Row {idx + 2}: No inventory snapshot for date {count_date}')
-                    continue
-                
-                purchases_qty = snapshot_maps['purchase_map'].get(item.id, Decimal('0'))
-                sales_qty = snapshot_maps['sales_map'].get(item.id, Decimal('0'))
-                adjustment_qty = snapshot_maps['adjustments_map'].get(item.id, Decimal('0'))
-                current_inventory = purchases_qty - sales_qty + adjustment_qty
-                
-                # Calculate difference
+            ledger = pd.DataFrame(ledger_rows, columns=['__item_id', '__ledger_date', 'on_hand'])
+            ledger['__item_id'] = ledger['__item_id'].astype(int)
+            ledger['__ledger_date'] = pd.to_datetime(ledger['__ledger_date'])
+            
+            # As-of merge: latest running total on or before each count date
+            merged = pd.merge_asof(
+                df.sort_values('__count_date'), ledger.sort_values('__ledger_date'),
+                left_on='__count_date', right_on='__ledger_date', by='__item_id', direction='backward'
+            ).sort_values('__row')
+            
+            for r in merged.to_dict('records'):
+                item = items_by_code[r['__code']]
+                real_count = Decimal(str(r['Quantity']))
+                current_inventory = Decimal(str(r['on_hand'])) if pd.notna(r['on_hand']) else Decimal('0')
+                count_date = r['__count_date'].date()
                 difference = real_count - current_inventory
                 
-                # Create adjustment if there's a difference
-                if abs(difference) > Decimal('0.01'):  # Only adjust if difference is significant (> 0.01)
-                    if difference > 0:
-                        adjustment_type = 'Increase'
-                        adjustment_qty = difference
-                    else:
-                        adjustment_type = 'Decrease'
-                        adjustment_qty = abs(difference)
-                    
-                    # Create adjustment
-                    adjustment = InventoryAdjustment(
-                        market_id=market_id,
-                        item_id=item.id,
-                        adjustment_type=adjustment_type,
-                        quantity=adjustment_qty,
-                        date=count_date,
-                        reason=f'Physical count adjustment (Count: {real_count}, System: {current_inventory})',
-                        notes=f'Auto-adjusted from physical count on {count_date.isoformat()}'
-                    )
-                    
-                    db.session.add(adjustment)
-                    adjustments_created += 1
-                    
-                    results.append({
-                        'item_code': item_code,
-                        'item_name': item.name,
-                        'current_inventory': float(current_inventory),
-                        'real_count': float(real_count),
-                        'difference': float(difference),
+                # Only adjust if difference is significant (> 0.01)
+                if abs(difference) > Decimal('0.01'):
+                    adjustment_type = 'Increase' if difference > 0 else 'Decrease'
+                    adjustment_qty = abs(difference)
+                    adjustments.append({
+                        'market_id': market_id,
+                        'item_id': item.id,
                         'adjustment_type': adjustment_type,
-                        'adjustment_quantity': float(adjustment_qty),
-                        'status': 'Adjusted'
+                        'quantity': adjustment_qty,
+                        'date': count_date,
+                        'reason': f'Physical count adjustment (Count: {real_count}, System: {current_inventory})',
+                        'notes': f'Auto-adjusted from physical count on {count_date.isoformat()}'
                     })
+                    status = 'Pending' if dry_run else 'Adjusted'
                 else:
-                    # No adjustment needed
-                    results.append({
-                        'item_code': item_code,
-                        'item_name': item.name,
-                        'current_inventory': float(current_inventory),
-                        'real_count': float(real_count),
-                        'difference': float(difference),
-                        'adjustment_type': None,
-                        'adjustment_quantity': 0,
-                        'status': 'No adjustment needed'
-                    })
+                    adjustment_type = None
+                    adjustment_qty = 0
+                    status = 'No adjustment needed'
                 
-            except Exception as e:
-                errors.append(f'Row {idx + 2}: {str(e)}')
-                continue
+                results.append({
+                    'item_code': r['__code'],
+                    'item_name': item.name,
+                    'count_date': count_date.isoformat(),
+                    'current_inventory': float(current_inventory),
+                    'real_count': float(real_count),
+                    'difference': float(difference),
+                    'adjustment_type': adjustment_type,
+                    'adjustment_quantity': float(adjustment_qty),
+                    'status': status
+                })
         
-        # Commit all adjustments
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'error': f'Error saving adjustments: {str(e)}'}), 400
+        # Bulk insert all adjustments (skipped for a dry-run preview)
+        if adjustments and not dry_run:
+            from sqlalchemy import insert
+            try:
+                db.session.execute(insert(InventoryAdjustment), adjustments)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                return jsonify({'error': f'Error saving adjustments: {str(e)}'}), 400
         
         return jsonify({
             'success': True,
-            'adjustments_created': adjustments_created,
+            'dry_run': dry_run,
+            'adjustments_created': 0 if dry_run else len(adjustments),
+            'adjustments_pending': len(adjustments) if dry_run else 0,
             'items_processed': len(results),
             'results': results,
             'errors': errors
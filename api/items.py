@@ -4,8 +4,8 @@ Items API endpoints
 from flask import Blueprint, request, jsonify, session, send_file
 from flask_login import login_required
 from models import db, Item, Market, PurchaseItem, SaleItem, PurchaseContainer, Sale
+from api.pagination import page_args, fetch_page, text_search
 from decimal import Decimal
-import pandas as pd
 from io import BytesIO
 from sqlalchemy import func, or_, case
 
@@ -22,6 +22,13 @@ def get_items():
     include_all = request.args.get('include_all', type=bool, default=False)
     # For sales: if True, include items without supplier_id when a supplier is selected
     include_no_supplier = request.args.get('include_no_supplier', type=bool, default=False)
+    category1 = request.args.get('category1')
+    search = request.args.get('q', '').strip()
+    
+    try:
+        page = page_args({'code': Item.code, 'name': Item.name}, 'code', 'asc')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     query = Item.query.filter_by(market_id=market_id)
     if supplier_id is not None and not include_all:
@@ -35,9 +42,13 @@ def get_items():
                 query = query.filter(or_(Item.supplier_id == supplier_id, Item.supplier_id.is_(None)))
             else:
                 query = query.filter_by(supplier_id=supplier_id)
+    if category1:
+        query = query.filter(Item.category1 == category1)
+    if search:
+        query = query.filter(text_search(search, Item.code, Item.name))
     
-    items = query.all()
-    return jsonify([{
+    items, next_cursor = fetch_page(query, page, Item.id)
+    rows = [{
         'id': i.id,
         'code': i.code,
         'name': i.name,
@@ -46,7 +57,14 @@ def get_items():
         'category1': i.category1,
         'category2': i.category2,
         'supplier_id': i.supplier_id
-    } for i in items])
+    } for i in items]
+    if not page.limit:
+        return jsonify(rows)
+    
+    result = {'items': rows, 'next_cursor': next_cursor}
+    if not page.cursor:
+        result['count'] = query.with_entities(func.count(Item.id)).scalar()
+    return jsonify(result)
 
 @bp.route('/summary', methods=['GET'])
 @login_required
@@ -248,6 +266,7 @@ def delete_item(item_id):
 @bp.route('/import', methods=['POST'])
 @login_required
 def import_items():
+    import pandas as pd
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -289,6 +308,9 @@ def import_items():
         if missing_cols:
             return jsonify({'error': f'Missing columns: {", ".join(missing_cols)}. Found columns: {", ".join(df.columns.tolist())}'}), 400
         
+        if request.form.get('mode') == 'upsert':
+            return _import_items_upsert(df, market_id)
+        
         errors = []
         imported = []
         codes_seen_in_file = {}  # Track codes we've seen in this import to detect duplicates within file
@@ -379,27 +401,144 @@ def import_items():
         db.session.rollback()
         return jsonify({'error': f'Error reading file: {str(e)}'}), 400
 
-@bp.route('/stock-movement', methods=['GET'])
-@login_required
-def get_stock_movement():
-    market_id = session.get('current_market_id')
-    if not market_id:
-        return jsonify({'error': 'No market selected'}), 400
+def _import_items_upsert(df, market_id):
+    """Upsert mode for the item import: insert new items and update changed ones in bulk.
+    Existing keys are (market_id, supplier_id, code); rows already matching are left unchanged.
+    """
+    import pandas as pd
+    from models import Company
+    from sqlalchemy import update
+    
+    errors = []
+    
+    # Normalize the sheet column-wise
+    df = df.copy()
+    df['row_number'] = df.index + 2
+    df['code'] = df['Code'].fillna('').astype(str).str.strip()
+    df['name'] = df['Name'].fillna('').astype(str).str.strip()
+    df['weight'] = pd.to_numeric(df['Weight'], errors='coerce')
+    for col, key in [('Grade', 'grade'), ('Category1', 'category1'), ('Category2', 'category2')]:
+        if col in df.columns:
+            df[key] = df[col].map(lambda v: str(v).strip() if pd.notna(v) else None)
+        else:
+            df[key] = None
+    
+    suppliers = Company.query.filter_by(market_id=market_id, category='Supplier').all()
+    supplier_ids = {c.name: c.id for c in suppliers}
+    if 'Supplier' in df.columns:
+        df['supplier_name'] = df['Supplier'].map(lambda v: str(v).strip() if pd.notna(v) else None)
+        df['supplier_id'] = df['supplier_name'].map(lambda n: supplier_ids.get(n) if n else None)
+        unknown = df[df['supplier_name'].notna() & df['supplier_id'].isna()]
+        for r in unknown.itertuples():
+            errors.append(f'Row {r.row_number}: Supplier "{r.supplier_name}" not found')
+        df = df.drop(unknown.index)
+    else:
+        df['supplier_id'] = None
+    
+    invalid = df[(df['code'] == '') | (df['name'] == '')]
+    for r in invalid.itertuples():
+        errors.append(f'Row {r.row_number}: Missing code or name')
+    df = df.drop(invalid.index)
+    
+    bad_weight = df[df['weight'].isna()]
+    for r in bad_weight.itertuples():
+        errors.append(f'Row {r.row_number}: Invalid weight')
+    df = df.drop(bad_weight.index)
+    
+    dupes = df[df.duplicated(subset=['supplier_id', 'code'], keep='first')]
+    for r in dupes.itertuples():
+        errors.append(f'Row {r.row_number}: Duplicate code "{r.code}" in Excel file')
+    df = df.drop(dupes.index)
+    
+    # Existing keys for this market in one query
+    existing = {
+        (row.supplier_id, row.code): row
+        for row in db.session.query(
+            Item.id, Item.supplier_id, Item.code, Item.name, Item.weight,
+            Item.grade, Item.category1, Item.category2
+        ).filter(Item.market_id == market_id).all()
+    }
+    
+    to_insert = []
+    to_update = []
+    unchanged = 0
+    for r in df.to_dict('records'):
+        supplier_id = int(r['supplier_id']) if pd.notna(r['supplier_id']) else None
+        values = {
+            'market_id': market_id,
+            'supplier_id': supplier_id,
+            'code': r['code'],
+            'name': r['name'],
+            'weight': Decimal(str(r['weight'])).quantize(Decimal('0.01')),
+            'grade': r['grade'],
+            'category1': r['category1'],
+            'category2': r['category2']
+        }
+        current = existing.get((supplier_id, r['code']))
+        if current is None:
+            to_insert.append(values)
+        elif (current.name, Decimal(str(current.weight)), current.grade, current.category1, current.category2) == \
+                (values['name'], values['weight'], values['grade'], values['category1'], values['category2']):
+            unchanged += 1
+        else:
+            values['id'] = current.id
+            to_update.append(values)
     
-    item_id = request.args.get('item_id', type=int)
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    movement_type = request.args.get('type')  # 'purchases', 'sales', 'both'
+    try:
+        dialect = db.engine.dialect.name
+        if to_insert:
+            if dialect in ('postgresql', 'sqlite'):
+                if dialect == 'postgresql':
+                    from sqlalchemy.dialects.postgresql import insert
+                else:
+                    from sqlalchemy.dialects.sqlite import insert
+                stmt = insert(Item.__table__)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['market_id', 'supplier_id', 'code'],
+                    set_={c: stmt.excluded[c] for c in ['name', 'weight', 'grade', 'category1', 'category2']}
+                )
+                db.session.execute(stmt, to_insert)
+            else:
+                db.session.execute(Item.__table__.insert(), to_insert)
+        if to_update:
+            # ORM bulk UPDATE by primary key (also covers items without a supplier,
+            # which the unique constraint cannot match because NULLs are distinct)
+            db.session.execute(update(Item), to_update)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Error committing to database: {str(e)}'}), 400
     
+    return jsonify({
+        'success': True,
+        'inserted': len(to_insert),
+        'updated': len(to_update),
+        'unchanged': unchanged,
+        'imported': len(to_insert) + len(to_update),
+        'errors': errors,
+        'imported_codes': [v['code'] for v in to_insert + to_update]
+    })
+
+def _stock_movements(market_id, item_id, start_date, end_date, movement_type):
+    """Purchase and sale lines of the market, oldest first, as plain column rows.
+    Each side is one query joined to its item (and the customer for sales), so the
+    number of queries does not grow with the number of lines."""
     from datetime import datetime
-    from models import PurchaseItem, SaleItem, PurchaseContainer, Sale
+    from models import Company
     
     movements = []
     
     # Purchases
     if movement_type in [None, 'purchases', 'both']:
-        query = db.session.query(PurchaseItem, PurchaseContainer).join(
+        query = db.session.query(
+            PurchaseContainer.date, Item.code, Item.name,
+            PurchaseItem.quantity, PurchaseItem.unit_price, PurchaseItem.total_price,
+            PurchaseContainer.container_number, PurchaseContainer.id.label('container_id'),
+            PurchaseContainer.currency
+        ).select_from(PurchaseItem).join(
             PurchaseContainer, PurchaseItem.container_id == PurchaseContainer.id
+        ).join(
+            Item, PurchaseItem.item_id == Item.id
         ).filter(PurchaseContainer.market_id == market_id)
         
         if item_id:
@@ -409,24 +548,32 @@ def get_stock_movement():
         if end_date:
             query = query.filter(PurchaseContainer.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
         
-        for item, container in query.all():
+        for row in query.all():
             movements.append({
-                'date': container.date.isoformat(),
+                'date': row.date.isoformat(),
                 'type': 'Purchase',
-                'item_code': item.item.code,
-                'item_name': item.item.name,
-                'quantity': float(item.quantity),
-                'unit_price': float(item.unit_price),
-                'total_price': float(item.total_price),
-                'container_number': container.container_number,
-                'container_id': container.id,
-                'currency': container.currency
+                'item_code': row.code,
+                'item_name': row.name,
+                'quantity': float(row.quantity),
+                'unit_price': float(row.unit_price),
+                'total_price': float(row.total_price),
+                'container_number': row.container_number,
+                'container_id': row.container_id,
+                'currency': row.currency
             })
     
     # Sales
     if movement_type in [None, 'sales', 'both']:
-        query = db.session.query(SaleItem, Sale).join(
+        query = db.session.query(
+            Sale.date, Item.code, Item.name,
+            SaleItem.quantity, SaleItem.unit_price, SaleItem.total_price,
+            Sale.invoice_number, Sale.id.label('sale_id'), Company.currency
+        ).select_from(SaleItem).join(
             Sale, SaleItem.sale_id == Sale.id
+        ).join(
+            Company, Sale.customer_id == Company.id
+        ).join(
+            Item, SaleItem.item_id == Item.id
         ).filter(Sale.market_id == market_id)
         
         if item_id:
@@ -436,24 +583,37 @@ def get_stock_movement():
         if end_date:
             query = query.filter(Sale.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
         
-        for item, sale in query.all():
+        for row in query.all():
             movements.append({
-                'date': sale.date.isoformat(),
+                'date': row.date.isoformat(),
                 'type': 'Sale',
-                'item_code': item.item.code,
-                'item_name': item.item.name,
-                'quantity': float(item.quantity),
-                'unit_price': float(item.unit_price),
-                'total_price': float(item.total_price),
-                'invoice_number': sale.invoice_number,
-                'sale_id': sale.id,
-                'currency': sale.customer.currency
+                'item_code': row.code,
+                'item_name': row.name,
+                'quantity': float(row.quantity),
+                'unit_price': float(row.unit_price),
+                'total_price': float(row.total_price),
+                'invoice_number': row.invoice_number,
+                'sale_id': row.sale_id,
+                'currency': row.currency
             })
     
     # Sort by date
     movements.sort(key=lambda x: x['date'])
+    return movements
+
+@bp.route('/stock-movement', methods=['GET'])
+@login_required
+def get_stock_movement():
+    market_id = session.get('current_market_id')
+    if not market_id:
+        return jsonify({'error': 'No market selected'}), 400
     
-    return jsonify(movements)
+    item_id = request.args.get('item_id', type=int)
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    movement_type = request.args.get('type')  # 'purchases', 'sales', 'both'
+    
+    return jsonify(_stock_movements(market_id, item_id, start_date, end_date, movement_type))
 
 @bp.route('/<int:item_id>/price-breakdown', methods=['GET'])
 @login_required
@@ -554,6 +714,7 @@ def get_item_price_breakdown(item_id):
 @bp.route('/stock-movement/export', methods=['GET'])
 @login_required
 def export_stock_movement():
+    import pandas as pd
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -563,62 +724,23 @@ def export_stock_movement():
     end_date = request.args.get('end_date')
     movement_type = request.args.get('type')
     
-    from datetime import datetime
-    from models import PurchaseItem, SaleItem, PurchaseContainer, Sale
-    
     movements = []
-    
-    if movement_type in [None, 'purchases', 'both']:
-        query = db.session.query(PurchaseItem, PurchaseContainer).join(
-            PurchaseContainer, PurchaseItem.container_id == PurchaseContainer.id
-        ).filter(PurchaseContainer.market_id == market_id)
-        
-        if item_id:
-            query = query.filter(PurchaseItem.item_id == item_id)
-        if start_date:
-            query = query.filter(PurchaseContainer.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            query = query.filter(PurchaseContainer.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for item, container in query.all():
-            movements.append({
-                'Date': container.date.isoformat(),
-                'Type': 'Purchase',
-                'Item Code': item.item.code,
-                'Item Name': item.item.name,
-                'Quantity': float(item.quantity),
-                'Unit Price': float(item.unit_price),
-                'Total Price': float(item.total_price),
-                'Container Number': container.container_number,
-                'Currency': container.currency
-            })
-    
-    if movement_type in [None, 'sales', 'both']:
-        query = db.session.query(SaleItem, Sale).join(
-            Sale, SaleItem.sale_id == Sale.id
-        ).filter(Sale.market_id == market_id)
-        
-        if item_id:
-            query = query.filter(SaleItem.item_id == item_id)
-        if start_date:
-            query = query.filter(Sale.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-        if end_date:
-            query = query.filter(Sale.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-        
-        for item, sale in query.all():
-            movements.append({
-                'Date': sale.date.isoformat(),
-                'Type': 'Sale',
-                'Item Code': item.item.code,
-                'Item Name': item.item.name,
-                'Quantity': float(item.quantity),
-                'Unit Price': float(item.unit_price),
-                'Total Price': float(item.total_price),
-                'Invoice Number': sale.invoice_number,
-                'Currency': sale.customer.currency
-            })
-    
-    movements.sort(key=lambda x: x['Date'])
+    for m in _stock_movements(market_id, item_id, start_date, end_date, movement_type):
+        row = {
+            'Date': m['date'],
+            'Type': m['type'],
+            'Item Code': m['item_code'],
+            'Item Name': m['item_name'],
+            'Quantity': m['quantity'],
+            'Unit Price': m['unit_price'],
+            'Total Price': m['total_price'],
+        }
+        if m['type'] == 'Purchase':
+            row['Container Number'] = m['container_number']
+        else:
+            row['Invoice Number'] = m['invoice_number']
+        row['Currency'] = m['currency']
+        movements.append(row)
     
     df = pd.DataFrame(movements)
     output = BytesIO()
@@ -634,6 +756,7 @@ def export_stock_movement():
 @login_required
 def export_items():
     """Export items summary to Excel"""
+    import pandas as pd
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
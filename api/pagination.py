@@ -0,0 +1,102 @@
+"""
+Keyset pagination, sorting and text search shared by the list endpoints.
+
+Paging is opt-in: without limit a list endpoint returns every matching row as before. With
+limit, rows are ordered by the requested sort column(s) and then id, and next_cursor holds the
+sort values and id of the last row, ":"-separated and percent-encoded ("2025-03-01:1234"). The
+next page starts strictly after that row with a row-value comparison, (sort, id) > (value, id),
+which the (market_id, date, ...) indexes answer directly, so a page deep in the history costs the
+same as the first one (unlike OFFSET).
+
+Query parameters: limit (at most MAX_PAGE_SIZE), cursor, sort (one of the endpoint's sort
+names), order (asc/desc) and, where supported, q (case-insensitive text search).
+"""
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal
+
+from urllib.parse import quote, unquote
+
+from flask import request
+from sqlalchemy import literal, or_, tuple_
+
+MAX_PAGE_SIZE = 500
+
+# columns is the tuple of sort columns (id is always the final tie-breaker); cursor is the
+# decoded (sort values, id) of the last row of the previous page, or None
+PageArgs = namedtuple('PageArgs', 'limit cursor sort columns descending')
+
+def page_args(sorts, default_sort, default_order='desc'):
+    """Paging and sort parameters of the request; sorts maps sort names to a (non-null) column or
+    a tuple of columns ordered in turn.
+    Raises ValueError for an unknown sort or order, or a malformed cursor."""
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    sort = request.args.get('sort') or default_sort
+    if sort not in sorts:
+        raise ValueError(f'Invalid sort "{sort}". Use one of: {", ".join(sorts)}')
+    order = (request.args.get('order') or default_order).lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError('Invalid order. Use asc or desc')
+
+    columns = sorts[sort] if isinstance(sorts[sort], tuple) else (sorts[sort],)
+    cursor = request.args.get('cursor')
+    cursor = decode_cursor(cursor, columns) if cursor else None
+
+    return PageArgs(limit, cursor, sort, columns, order == 'desc')
+
+def encode_cursor(values, row_id):
+    parts = [value.isoformat() if isinstance(value, date) else str(value) for value in values]
+    return ':'.join(quote(part, safe='') for part in parts + [str(row_id)])
+
+def decode_cursor(cursor, columns):
+    """(sort values, id) of a cursor, with each value converted to its column's Python type."""
+    parts = [unquote(part) for part in cursor.split(':')]
+    if len(parts) != len(columns) + 1:
+        raise ValueError('Invalid cursor')
+    try:
+        values = []
+        for value, column in zip(parts, columns):
+            python_type = column.type.python_type
+            if python_type is date:
+                value = date.fromisoformat(value)
+            elif python_type is Decimal:
+                value = Decimal(value)
+            elif python_type is not str:
+                value = python_type(value)
+            values.append(value)
+        return tuple(values), int(parts[-1])
+    except (ValueError, ArithmeticError):
+        raise ValueError('Invalid cursor')
+
+def fetch_page(query, args, id_column):
+    """Order the query, apply the cursor and limit; returns (rows, next_cursor).
+    Rows must expose the sort columns and id under their column names (entities or labelled rows)."""
+    order_columns = args.columns + (id_column,)
+    if args.descending:
+        query = query.order_by(*(column.desc() for column in order_columns))
+    else:
+        query = query.order_by(*(column.asc() for column in order_columns))
+
+    if args.cursor:
+        values, row_id = args.cursor
+        position = tuple_(*order_columns)
+        after = tuple_(*(literal(value, column.type) for value, column in zip(values + (row_id,), order_columns)))
+        query = query.filter(position < after if args.descending else position > after)
+
+    if not args.limit:
+        return query.all(), None
+
+    rows = query.limit(args.limit + 1).all()
+    if len(rows) <= args.limit:
+        return rows, None
+    rows = rows[:args.limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, column.key) for column in args.columns], getattr(last, id_column.key))
+
+def text_search(term, *columns):
+    """Case-insensitive "contains" condition over the columns (LIKE wildcards in term are literal)."""
+    escaped = term.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return or_(*(column.ilike(f'%{escaped}%', escape='\\') for column in columns))
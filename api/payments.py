@@ -3,30 +3,19 @@ Payments API endpoints
 """
 from flask import Blueprint, request, jsonify, session, send_file
 from flask_login import login_required
-from models import db, Payment, Sale, Company, Market, SafeTransaction
+from models import db, Payment, Sale, Company, SafeTransaction
+from api.pagination import page_args, fetch_page, text_search
+from api.safe import post_safe_transaction, lock_safe_ledger, recalc_safe_balances, recalc_safe_balances_from
+from sqlalchemy import case, func, or_
+from sqlalchemy.orm import joinedload
 from decimal import Decimal
 from datetime import datetime
-import pandas as pd
 from io import BytesIO
-from openpyxl.utils import get_column_letter
 
 bp = Blueprint('payments', __name__)
 
-
-def recalc_safe_balances(market_id):
-    """Recalculate balance_after for all safe transactions in order."""
-    txns = SafeTransaction.query.filter_by(market_id=market_id).order_by(
-        SafeTransaction.date.asc(), SafeTransaction.id.asc()
-    ).all()
-    balance = Decimal('0')
-    for t in txns:
-        if t.transaction_type in ['Opening', 'Inflow']:
-            balance += t.amount_base_currency
-        elif t.transaction_type == 'Outflow':
-            balance -= t.amount_base_currency
-        t.balance_after = balance
-    db.session.commit()
-
+# Rows per INSERT batch / IN-list chunk for bulk imports
+IMPORT_BATCH_SIZE = 500
 
 def derive_payment_type(company, provided_type, is_loan=False):
     """Determine payment type based on company category, but allow manual override."""
@@ -56,6 +45,12 @@ def get_payments():
     payment_type = request.args.get('payment_type')  # In, Out
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    search = request.args.get('q', '').strip()
+    
+    try:
+        page = page_args({'date': Payment.date, 'amount': Payment.amount}, 'date')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     query = Payment.query.filter_by(market_id=market_id)
     
@@ -70,10 +65,17 @@ def get_payments():
         query = query.filter(Payment.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
     if end_date:
         query = query.filter(Payment.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    if search:
+        matching_companies = db.select(Company.id).where(text_search(search, Company.name))
+        query = query.filter(or_(text_search(search, Payment.notes), Payment.company_id.in_(matching_companies)))
     
-    payments = query.order_by(Payment.date.desc(), Payment.id.desc()).all()
+    # Company and invoice number come in the same query (no lazy load per row)
+    payments, next_cursor = fetch_page(query.options(
+        joinedload(Payment.company),
+        joinedload(Payment.sale).load_only(Sale.invoice_number),
+    ), page, Payment.id)
     
-    return jsonify([{
+    rows = [{
         'id': p.id,
         'company_id': p.company_id,
         'company_name': p.company.name,
@@ -87,7 +89,22 @@ def get_payments():
         'amount_base_currency': float(p.amount_base_currency),
         'date': p.date.isoformat(),
         'notes': p.notes
-    } for p in payments])
+    } for p in payments]
+    if not page.limit:
+        return jsonify(rows)
+    
+    result = {'payments': rows, 'next_cursor': next_cursor}
+    if not page.cursor:
+        # Totals of all matching payments, on the first page only
+        base_amount = func.coalesce(Payment.amount_base_currency_stored, Payment.amount * Payment.exchange_rate)
+        incoming = or_(Payment.loan.is_(True), Payment.payment_type == 'In')
+        count, total_in, total_out = query.with_entities(
+            func.count(Payment.id),
+            func.coalesce(func.sum(case((incoming, base_amount), else_=0)), 0),
+            func.coalesce(func.sum(case((incoming, 0), else_=base_amount)), 0),
+        ).one()
+        result.update(count=count, total_in_base_currency=float(total_in), total_out_base_currency=float(total_out))
+    return jsonify(result)
 
 @bp.route('/<int:payment_id>', methods=['GET'])
 @login_required
@@ -159,6 +176,7 @@ def create_payment():
     )
     
     db.session.add(payment)
+    db.session.flush()
     
     # Update sale if linked (only for In payments - Out payments are refunds/returns, not payments on sales)
     if payment.sale_id and payment.payment_type == 'In':
@@ -168,27 +186,17 @@ def create_payment():
             sale.update_status()
     
     # Record in safe
-    market = Market.query.get(market_id)
-    last_transaction = SafeTransaction.query.filter_by(market_id=market_id).order_by(
-        SafeTransaction.date.desc(), SafeTransaction.id.desc()
-    ).first()
-    
-    balance_before = last_transaction.balance_after if last_transaction else Decimal('0')
-    
     # Get exact base currency amount from payment (stored value)
     exact_base_amount = payment.amount_base_currency
     
     # Handle loans: all loans are inflows (money received)
     if payment.loan:
-        balance_after = balance_before + exact_base_amount
         transaction_type = 'Inflow'
         description = f'Loan from {payment.company.name}'
     elif payment.payment_type == 'In':
-        balance_after = balance_before + exact_base_amount
         transaction_type = 'Inflow'
         description = f'Payment from {payment.company.name}'
     else:
-        balance_after = balance_before - exact_base_amount
         transaction_type = 'Outflow'
         description = f'Payment to {payment.company.name}'
     
@@ -208,13 +216,11 @@ def create_payment():
         date=payment.date,
         description=description,
         payment_id=payment.id,
-        sale_id=payment.sale_id,
-        balance_after=balance_after
+        sale_id=payment.sale_id
     )
-    db.session.add(safe_transaction)
+    post_safe_transaction(safe_transaction)
     
     db.session.commit()
-    recalc_safe_balances(market_id)
     
     return jsonify({
         'id': payment.id,
@@ -248,7 +254,8 @@ def delete_payment(payment_id):
             sale.update_status()
     
     # Delete safe transaction
-    SafeTransaction.query.filter_by(payment_id=payment_id).delete()
+    for safe_txn in SafeTransaction.query.filter_by(payment_id=payment_id).all():
+        db.session.delete(safe_txn)
     
     db.session.delete(payment)
     db.session.commit()
@@ -393,6 +400,7 @@ def update_payment(payment_id):
 @bp.route('/import', methods=['POST'])
 @login_required
 def import_payments():
+    import pandas as pd
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -436,9 +444,10 @@ def import_payments():
         companies_by_name = {c.name.strip().lower(): c for c in companies}
         
         errors = []
-        created_payments = 0
+        parsed_rows = []
         
-        for idx, row in df.iterrows():
+        # Validate every row first; nothing touches the database in this pass
+        for idx, row in enumerate(df.to_dict('records')):
             company_name = str(row['Company']).strip()
             company = companies_by_name.get(company_name.lower())
             if not company:
@@ -456,7 +465,7 @@ def import_payments():
                 currency = str(row['Currency']).strip()
                 
                 # Support both new format (AmountBaseCurrency) and old format (ExchangeRate)
-                if 'AmountBaseCurrency' in df.columns and pd.notna(row.get('AmountBaseCurrency')):
+                if has_base_currency and pd.notna(row.get('AmountBaseCurrency')):
                     # New format: AmountBaseCurrency is provided directly
                     amount_base_currency = Decimal(str(row['AmountBaseCurrency']))
                     if amount <= 0:
@@ -466,7 +475,7 @@ def import_payments():
                         errors.append(f'Row {idx + 2}: AmountBaseCurrency must be greater than zero')
                         continue
                     exchange_rate = amount_base_currency / amount
-                elif 'ExchangeRate' in df.columns and pd.notna(row.get('ExchangeRate')):
+                elif has_exchange_rate and pd.notna(row.get('ExchangeRate')):
                     # Backward compatibility: ExchangeRate is provided
                     exchange_rate = Decimal(str(row['ExchangeRate']))
                     amount_base_currency = amount * exchange_rate
@@ -474,14 +483,10 @@ def import_payments():
                     errors.append(f'Row {idx + 2}: Either AmountBaseCurrency or ExchangeRate must be provided')
                     continue
                 
-                sale_id = None
-                
-                # Optional invoice link
+                # Optional invoice link (resolved in bulk below)
+                invoice_number = None
                 if 'InvoiceNumber' in df.columns and pd.notna(row.get('InvoiceNumber')):
                     invoice_number = str(row['InvoiceNumber']).strip()
-                    sale = Sale.query.filter_by(market_id=market_id, invoice_number=invoice_number).first()
-                    if sale:
-                        sale_id = sale.id
                 
                 notes = str(row.get('Notes', '')).strip() if 'Notes' in df.columns and pd.notna(row.get('Notes')) else ''
                 
@@ -491,60 +496,93 @@ def import_payments():
                     loan_value = str(row['Loan']).strip().lower()
                     is_loan = loan_value in ['true', '1', 'yes', 'y']
                 
-                payment_type = derive_payment_type(company, provided_type, is_loan=is_loan)
+                parsed_rows.append({
+                    'company': company,
+                    'payment_type': derive_payment_type(company, provided_type, is_loan=is_loan),
+                    'amount': amount,
+                    'currency': currency,
+                    'exchange_rate': exchange_rate,
+                    'amount_base_currency': amount_base_currency,
+                    'date': date_val,
+                    'invoice_number': invoice_number,
+                    'notes': notes,
+                    'loan': is_loan
+                })
+            
+            except Exception as e:
+                errors.append(f'Row {idx + 2}: {str(e)}')
+                continue
+        
+        if not parsed_rows:
+            return jsonify({
+                'success': True,
+                'payments_created': 0,
+                'errors': errors
+            })
+        
+        # Resolve all invoice numbers with IN queries instead of one lookup per row
+        invoice_numbers = list({r['invoice_number'] for r in parsed_rows if r['invoice_number']})
+        sales_by_invoice = {}
+        for i in range(0, len(invoice_numbers), IMPORT_BATCH_SIZE):
+            chunk = invoice_numbers[i:i + IMPORT_BATCH_SIZE]
+            for sale in Sale.query.filter(Sale.market_id == market_id, Sale.invoice_number.in_(chunk)).all():
+                sales_by_invoice[sale.invoice_number] = sale
+        
+        # Insert payments and their safe postings in batches; flushing a batch
+        # assigns payment ids so each safe transaction is linked to its payment
+        # Serialize with the other safe writers until the running-balance pass commits
+        lock_safe_ledger(market_id)
+        for i in range(0, len(parsed_rows), IMPORT_BATCH_SIZE):
+            batch = parsed_rows[i:i + IMPORT_BATCH_SIZE]
+            payments = []
+            for r in batch:
+                sale = sales_by_invoice.get(r['invoice_number']) if r['invoice_number'] else None
                 payment = Payment(
                     market_id=market_id,
-                    company_id=company.id,
-                    sale_id=sale_id,
-                    payment_type=payment_type,
-                    amount=amount,
-                    currency=currency,
-                    exchange_rate=exchange_rate,
-                    amount_base_currency_stored=amount_base_currency,  # Store exact value entered
-                    date=date_val,
-                    notes=notes,
-                    loan=is_loan
+                    company_id=r['company'].id,
+                    sale_id=sale.id if sale else None,
+                    payment_type=r['payment_type'],
+                    amount=r['amount'],
+                    currency=r['currency'],
+                    exchange_rate=r['exchange_rate'],
+                    amount_base_currency_stored=r['amount_base_currency'],  # Store exact value entered
+                    date=r['date'],
+                    notes=r['notes'],
+                    loan=r['loan']
                 )
-                db.session.add(payment)
+                payments.append((payment, r['company'], sale))
                 
                 # Update sale if linked
-                if sale_id:
-                    sale = Sale.query.get(sale_id)
-                    if sale:
-                        sale.paid_amount += payment.amount_base_currency
-                        sale.update_status()
-                
-                # Record in safe
+                if sale:
+                    sale.paid_amount += r['amount_base_currency']
+                    sale.update_status()
+            
+            db.session.add_all([p for p, _, _ in payments])
+            db.session.flush()
+            
+            safe_transactions = []
+            for payment, company, sale in payments:
                 # Get exact base currency amount from payment (stored value)
                 exact_base_amount = payment.amount_base_currency
                 
                 # Calculate exchange_rate for SafeTransaction (for display/reference)
                 safe_exchange_rate = exact_base_amount / payment.amount if payment.amount > 0 else payment.exchange_rate
                 
-                last_transaction = SafeTransaction.query.filter_by(market_id=market_id).order_by(
-                    SafeTransaction.date.desc(), SafeTransaction.id.desc()
-                ).first()
-                
-                balance_before = last_transaction.balance_after if last_transaction else Decimal('0')
-                
                 # Handle loans: all loans are inflows
                 if payment.loan:
-                    balance_after = balance_before + exact_base_amount
                     transaction_type = 'Inflow'
-                    description = f'Loan from {payment.company.name}'
+                    description = f'Loan from {company.name}'
                 elif payment.payment_type == 'In':
-                    balance_after = balance_before + exact_base_amount
                     transaction_type = 'Inflow'
-                    description = f'Payment from {payment.company.name}'
+                    description = f'Payment from {company.name}'
                 else:
-                    balance_after = balance_before - exact_base_amount
                     transaction_type = 'Outflow'
-                    description = f'Payment to {payment.company.name}'
+                    description = f'Payment to {company.name}'
                 
-                if sale_id and sale:
+                if sale:
                     description += f' - Invoice {sale.invoice_number}'
                 
-                safe_transaction = SafeTransaction(
+                safe_transactions.append(SafeTransaction(
                     market_id=market_id,
                     transaction_type=transaction_type,
                     amount=payment.amount,
@@ -555,21 +593,19 @@ def import_payments():
                     description=description,
                     payment_id=payment.id,
                     sale_id=payment.sale_id,
-                    balance_after=balance_after
-                )
-                db.session.add(safe_transaction)
-                created_payments += 1
+                    balance_after=Decimal('0')  # Set by the running-balance pass below
+                ))
             
-            except Exception as e:
-                errors.append(f'Row {idx + 2}: {str(e)}')
-                continue
+            db.session.add_all(safe_transactions)
+            db.session.flush()
         
-        db.session.commit()
-        recalc_safe_balances(market_id)
+        # One ordered pass from the earliest imported date, committed with the inserts;
+        # earlier balances are unchanged
+        recalc_safe_balances_from(market_id, min(r['date'] for r in parsed_rows))
         
         return jsonify({
             'success': True,
-            'payments_created': created_payments,
+            'payments_created': len(parsed_rows),
             'errors': errors
         })
     
@@ -584,6 +620,8 @@ def export_payments():
     Format matches import requirements: Date, Company, PaymentType, Amount, Currency, AmountBaseCurrency
     Optional: InvoiceNumber, Notes, Loan
     """
+    import pandas as pd
+    from openpyxl.utils import get_column_letter
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
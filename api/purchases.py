@@ -4,13 +4,77 @@ Purchases API endpoints
 from flask import Blueprint, request, jsonify, session, send_file
 from flask_login import login_required
 from models import db, PurchaseContainer, PurchaseItem, Item, Market, Company, SafeTransaction
+from api.pagination import page_args, fetch_page, text_search
+from api.safe import post_safe_transaction
 from decimal import Decimal
 from datetime import datetime
-import pandas as pd
 from io import BytesIO
+import time
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.orm import joinedload
 
 bp = Blueprint('purchases', __name__)
 
+# Containers inserted and committed per transaction during import
+IMPORT_CHUNK_SIZE = 50
+
+# Containers updated per statement when refreshing stored totals
+TOTALS_REFRESH_CHUNK = 500
+
+def refresh_container_totals(connection, container_ids=None):
+    """Recompute items_total/items_total_base_currency from purchase_items.
+    Only the given containers, or every container when container_ids is None."""
+    containers = PurchaseContainer.__table__
+    items = PurchaseItem.__table__
+    items_total = select(
+        func.coalesce(func.sum(items.c.total_price), 0)
+    ).where(items.c.container_id == containers.c.id).scalar_subquery()
+    stmt = update(containers).values(
+        items_total=items_total,
+        items_total_base_currency=items_total * containers.c.exchange_rate
+    )
+    
+    if container_ids is None:
+        return connection.execute(stmt).rowcount
+    
+    ids = sorted(container_ids)
+    updated = 0
+    for start in range(0, len(ids), TOTALS_REFRESH_CHUNK):
+        chunk = ids[start:start + TOTALS_REFRESH_CHUNK]
+        updated += connection.execute(stmt.where(containers.c.id.in_(chunk))).rowcount
+    return updated
+
+@event.listens_for(db.session, 'after_flush')
+def _refresh_container_totals_after_flush(flush_session, flush_context):
+    """Keep the stored container totals in step with every flushed purchase item change."""
+    container_ids = set()
+    for obj in list(flush_session.new) + list(flush_session.deleted):
+        if isinstance(obj, PurchaseItem):
+            container_ids.add(obj.container_id)
+    for obj in flush_session.dirty:
+        if isinstance(obj, PurchaseItem):
+            state = inspect(obj)
+            if state.attrs['total_price'].history.has_changes() or state.attrs['container_id'].history.has_changes():
+                container_ids.add(obj.container_id)
+                container_ids.update(state.attrs['container_id'].history.deleted)
+        elif isinstance(obj, PurchaseContainer):
+            if inspect(obj).attrs['exchange_rate'].history.has_changes():
+                container_ids.add(obj.id)
+    container_ids.discard(None)
+    
+    if container_ids:
+        refresh_container_totals(flush_session.connection(), container_ids)
+        flush_session.info.setdefault('refreshed_container_ids', set()).update(container_ids)
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def _expire_refreshed_container_totals(flush_session, flush_context):
+    """Loaded containers reload their totals after the UPDATE above."""
+    for container_id in flush_session.info.pop('refreshed_container_ids', ()):
+        container = flush_session.identity_map.get(identity_key(PurchaseContainer, container_id))
+        if container is not None:
+            flush_session.expire(container, ['items_total', 'items_total_base_currency'])
+
 @bp.route('/containers', methods=['GET'])
 @login_required
 def get_containers():
@@ -19,14 +83,33 @@ def get_containers():
         return jsonify({'error': 'No market selected'}), 400
     
     supplier_id = request.args.get('supplier_id', type=int)
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    search = request.args.get('q', '').strip()
+    
+    try:
+        page = page_args({
+            'date': PurchaseContainer.date,
+            'container_number': PurchaseContainer.container_number,
+            'total_amount': PurchaseContainer.items_total,
+        }, 'date')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     query = PurchaseContainer.query.filter_by(market_id=market_id)
     if supplier_id:
         query = query.filter_by(supplier_id=supplier_id)
+    if start_date:
+        query = query.filter(PurchaseContainer.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+    if end_date:
+        query = query.filter(PurchaseContainer.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    if search:
+        query = query.filter(text_search(search, PurchaseContainer.container_number, PurchaseContainer.notes))
     
-    containers = query.order_by(PurchaseContainer.date.desc(), PurchaseContainer.id.desc()).all()
+    containers, next_cursor = fetch_page(query.options(joinedload(PurchaseContainer.supplier).load_only(Company.name)),
+                                         page, PurchaseContainer.id)
     
-    return jsonify([{
+    rows = [{
         'id': c.id,
         'container_number': c.container_number,
         'supplier_id': c.supplier_id,
@@ -36,7 +119,18 @@ def get_containers():
         'date': c.date.isoformat(),
         'total_amount': float(c.total_amount),
         'notes': c.notes
-    } for c in containers])
+    } for c in containers]
+    if not page.limit:
+        return jsonify(rows)
+    
+    result = {'containers': rows, 'next_cursor': next_cursor}
+    if not page.cursor:
+        count, total_base_currency = query.with_entities(
+            func.count(PurchaseContainer.id),
+            func.coalesce(func.sum(PurchaseContainer.items_total_base_currency), 0),
+        ).one()
+        result.update(count=count, total_base_currency=float(total_base_currency))
+    return jsonify(result)
 
 @bp.route('/containers', methods=['POST'])
 @login_required
@@ -91,10 +185,12 @@ def create_container():
     db.session.add(container)
     db.session.flush()
     
-    # Add items
+    # Add items (resolve all referenced items in one query)
+    item_ids = {item_data['item_id'] for item_data in data.get('items', [])}
+    items_by_id = {i.id: i for i in Item.query.filter(Item.id.in_(item_ids)).all()} if item_ids else {}
     for item_data in data.get('items', []):
         # Ensure item belongs to this supplier
-        item_obj = Item.query.get(item_data['item_id'])
+        item_obj = items_by_id.get(item_data['item_id'])
         if item_obj:
             # Update item's supplier_id if not set or different
             if not item_obj.supplier_id or item_obj.supplier_id != container.supplier_id:
@@ -111,14 +207,6 @@ def create_container():
     
     # Record expense3 (cash expense) in safe if exists
     if container.expense3_amount and container.expense3_amount > 0:
-        market = Market.query.get(market_id)
-        last_transaction = SafeTransaction.query.filter_by(market_id=market_id).order_by(
-            SafeTransaction.date.desc(), SafeTransaction.id.desc()
-        ).first()
-        
-        balance_before = last_transaction.balance_after if last_transaction else Decimal('0')
-        balance_after = balance_before - container.expense3_base_currency
-        
         # Calculate exact base currency amount
         expense3_rate = container.expense3_exchange_rate or container.exchange_rate
         exact_base_amount = container.expense3_amount * expense3_rate
@@ -131,10 +219,9 @@ def create_container():
             exchange_rate=expense3_rate,
             amount_base_currency_stored=exact_base_amount,  # Store exact value directly
             date=container.date,
-            description=f'Container {container.container_number} - Expense 3 (Cash Expense)',
-            balance_after=balance_after
+            description=f'Container {container.container_number} - Expense 3 (Cash Expense)'
         )
-        db.session.add(safe_transaction)
+        post_safe_transaction(safe_transaction)
     
     db.session.commit()
     
@@ -311,8 +398,9 @@ def update_container(container_id):
         
         # Update items if provided
         if 'items' in data:
-            # Delete existing items
-            PurchaseItem.query.filter_by(container_id=container_id).delete()
+            # Delete existing items (through the session so the container totals follow)
+            for old_item in PurchaseItem.query.filter_by(container_id=container_id).all():
+                db.session.delete(old_item)
             
             # Add new items
             for item_data in data['items']:
@@ -508,7 +596,11 @@ def import_containers():
     - Quantity
     - UnitPrice
     - Notes (optional)
+    Optional form field chunk_size: containers committed per transaction (at least 1).
+    Chunks are committed one by one; if one fails, the response reports what the earlier
+    chunks already created and the index of the failing chunk.
     """
+    import pandas as pd
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -523,6 +615,14 @@ def import_containers():
     if not (file.filename.endswith('.xlsx') or file.filename.endswith('.xls')):
         return jsonify({'error': 'Invalid file type. Please upload an Excel file (.xlsx or .xls)'}), 400
 
+    chunk_size = request.form.get('chunk_size', IMPORT_CHUNK_SIZE, type=int) or IMPORT_CHUNK_SIZE
+    if chunk_size < 1:
+        return jsonify({'error': 'chunk_size must be at least 1'}), 400
+
+    created_containers = 0
+    created_items = 0
+    created_batches = 0
+    chunk_index = None
     try:
         try:
             if file.filename.endswith('.xlsx'):
@@ -541,18 +641,26 @@ def import_containers():
         if missing:
             return jsonify({'error': f'Missing columns: {", ".join(missing)}. Found: {", ".join(df.columns.tolist())}'}), 400
 
-        errors = []
-        created_containers = 0
-        created_items = 0
+        started = time.perf_counter()
 
-        # Cache lookups
-        suppliers_by_name = {s.name: s for s in Company.query.filter_by(market_id=market_id, category='Supplier').all()}
-        items_by_code = {i.code: i for i in Item.query.filter_by(market_id=market_id).all()}
+        errors = []
 
-        # Group rows by container number to create once
-        grouped = df.groupby('ContainerNumber')
+        market = Market.query.get(market_id)
+        use_fifo = market and getattr(market, 'calculation_method', 'Average') == 'FIFO'
 
-        for container_number, group in grouped:
+        # Resolve suppliers and every item code in the sheet up front
+        suppliers_by_name = {s.name: s for s in Company.query.filter_by(market_id=market_id, category='Supplier').all()}
+        codes = list({str(c).strip() for c in df['ItemCode'].dropna()})
+        items_by_code = {}
+        for i in range(0, len(codes), 500):
+            for item in Item.query.filter(Item.market_id == market_id, Item.code.in_(codes[i:i + 500])).all():
+                items_by_code.setdefault(item.code, []).append(item)
+        # Plain values: the per-chunk commits expire the Item objects
+        weights_by_item_id = {item.id: item.weight for items in items_by_code.values() for item in items}
+
+        # Validate and build containers with their lines in memory first
+        pending = []
+        for container_number, group in df.groupby('ContainerNumber'):
             first_row = group.iloc[0]
             supplier_name = str(first_row['Supplier']).strip()
             supplier = suppliers_by_name.get(supplier_name)
@@ -577,7 +685,6 @@ def import_containers():
 
             notes = str(first_row['Notes']).strip() if 'Notes' in group.columns and pd.notna(first_row.get('Notes')) else ''
 
-            # Create container
             container = PurchaseContainer(
                 market_id=market_id,
                 container_number=str(container_number).strip(),
@@ -587,17 +694,16 @@ def import_containers():
                 date=date_val,
                 notes=notes
             )
-            db.session.add(container)
-            db.session.flush()
-            created_containers += 1
 
-            # Add items
-            for idx, row in group.iterrows():
+            lines = []
+            for idx, row in zip(group.index, group.to_dict('records')):
                 code = str(row['ItemCode']).strip()
-                item = items_by_code.get(code)
-                if not item:
+                candidates = items_by_code.get(code)
+                if not candidates:
                     errors.append(f'Container {container_number}: Item code "{code}" not found (row {idx + 2})')
                     continue
+                # Prefer the item registered under this supplier when the code is shared
+                item = next((c for c in candidates if c.supplier_id == supplier.id), candidates[0])
 
                 try:
                     qty = Decimal(str(row['Quantity']))
@@ -610,33 +716,70 @@ def import_containers():
                 if not item.supplier_id or item.supplier_id != supplier.id:
                     item.supplier_id = supplier.id
 
-                purchase_item = PurchaseItem(
-                    container_id=container.id,
+                lines.append(PurchaseItem(
                     item_id=item.id,
                     quantity=qty,
                     unit_price=price,
                     total_price=qty * price
-                )
-                db.session.add(purchase_item)
-                created_items += 1
+                ))
 
-        db.session.commit()
+            pending.append((container, lines))
+
+        # Insert in chunks of containers, committing after each chunk
+        for chunk_index, i in enumerate(range(0, len(pending), chunk_size)):
+            chunk = pending[i:i + chunk_size]
+            db.session.add_all([container for container, _ in chunk])
+            db.session.flush()
+
+            for container, lines in chunk:
+                for line in lines:
+                    line.container_id = container.id
+            db.session.add_all([line for _, lines in chunk for line in lines])
+            db.session.flush()
+
+            if use_fifo:
+                from api.fifo_calculations import build_inventory_batches
+                batches = []
+                for container, lines in chunk:
+                    batches.extend(build_inventory_batches(container, lines, weights_by_item_id))
+                db.session.add_all(batches)
+                created_batches += len(batches)
+
+            db.session.commit()
+            created_containers += len(chunk)
+            created_items += sum(len(lines) for _, lines in chunk)
+        chunk_index = None
+
+        elapsed = time.perf_counter() - started
 
         return jsonify({
             'success': True,
             'containers_created': created_containers,
             'items_created': created_items,
-            'errors': errors
+            'batches_created': created_batches,
+            'errors': errors,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(len(df) / elapsed, 1) if elapsed > 0 else None
         })
 
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': f'Import failed: {str(e)}'}), 400
+        if chunk_index is None:
+            return jsonify({'error': f'Import failed: {str(e)}'}), 400
+        # Earlier chunks are already committed: report them so a retry can skip those containers
+        return jsonify({
+            'error': f'Import failed in chunk {chunk_index}: {str(e)}',
+            'failed_chunk': chunk_index,
+            'containers_created': created_containers,
+            'items_created': created_items,
+            'batches_created': created_batches
+        }), 400
 
 @bp.route('/export', methods=['GET'])
 @login_required
 def export_purchases():
     """Export purchases to Excel"""
+    import pandas as pd
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -6,111 +6,205 @@ from flask_login import login_required
 from models import db, Item, SaleItem, PurchaseItem, Sale, PurchaseContainer, Company, SafeTransaction, SafeStatementRealBalance, Market, InventoryAdjustment, InventoryBatch, SaleItemAllocation, Payment, GeneralExpense
 from decimal import Decimal
 from datetime import datetime
-import pandas as pd
 from io import BytesIO
-from openpyxl.utils import get_column_letter
-from sqlalchemy import func, case
-from sqlalchemy.orm import joinedload
+from sqlalchemy import func, case, and_
+from sqlalchemy.orm import aliased, joinedload
 
 bp = Blueprint('reports', __name__)
 
 @bp.route('/daily-sales', methods=['GET'])
 @login_required
 def get_daily_sales():
-    """Get daily sales grouped by date, with all sales for each day combined into one invoice"""
+    """Get daily sales grouped by date, with all sales for each day combined into one invoice.
+    summary=true returns the day totals only (no sales or lines); fetch the lines of one day
+    with start_date = end_date = that day."""
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
     
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    summary = request.args.get('summary', '').lower() in ('1', 'true', 'yes')
     
-    # Build query
-    query = Sale.query.filter_by(market_id=market_id)
-    
+    filters = [Sale.market_id == market_id]
     if start_date:
-        query = query.filter(Sale.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+        filters.append(Sale.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
     if end_date:
-        query = query.filter(Sale.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-    
-    sales = query.order_by(Sale.date.asc(), Sale.id.asc()).all()
+        filters.append(Sale.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    
+    customer = aliased(Company)
+    supplier = aliased(Company)
+    
+    if summary:
+        return jsonify(_daily_sales_totals(filters, customer, supplier))
+    
+    # One projection over sales, their lines, items, customer and supplier, in date/sale/line
+    # order; rows are streamed and grouped as they arrive (sales without lines still appear)
+    rows = db.session.query(
+        Sale.id, Sale.date, Sale.invoice_number, Sale.customer_id, Sale.supplier_id,
+        Sale.total_amount, Sale.paid_amount, Sale.balance, Sale.payment_type, Sale.status,
+        customer.name.label('customer_name'), supplier.name.label('supplier_name'),
+        SaleItem.id.label('line_id'), SaleItem.item_id, Item.code.label('item_code'), Item.name.label('item_name'),
+        SaleItem.quantity, SaleItem.unit_price, SaleItem.total_price
+    ).join(
+        customer, Sale.customer_id == customer.id
+    ).outerjoin(
+        supplier, Sale.supplier_id == supplier.id
+    ).outerjoin(
+        SaleItem, SaleItem.sale_id == Sale.id
+    ).outerjoin(
+        Item, SaleItem.item_id == Item.id
+    ).filter(*filters).order_by(Sale.date, Sale.id, SaleItem.id).yield_per(2000)
     
-    # Group sales by date
-    daily_sales = {}
-    for sale in sales:
-        sale_date = sale.date.isoformat()
-        
-        if sale_date not in daily_sales:
-            daily_sales[sale_date] = {
-                'date': sale_date,
-                'sales': [],
+    result = []
+    day = sale = None
+    for row in rows:
+        if day is None or day['date'] != row.date.isoformat():
+            day = {
+                'date': row.date.isoformat(),
                 'total_amount': Decimal('0'),
                 'total_paid': Decimal('0'),
                 'total_balance': Decimal('0'),
-                'customers': set(),
-                'suppliers': set()
+                'customers': [],
+                'suppliers': [],
+                'sales': []
             }
+            result.append(day)
         
-        # Get sale items
-        items = [{
-            'id': i.id,
-            'item_id': i.item_id,
-            'item_code': i.item.code,
-            'item_name': i.item.name,
-            'quantity': float(i.quantity),
-            'unit_price': float(i.unit_price),
-            'total_price': float(i.total_price),
-            'customer_name': sale.customer.name,
-            'supplier_name': sale.supplier.name if sale.supplier else None
-        } for i in sale.items]
-        
-        # Get supplier name
-        supplier_name = None
-        if sale.supplier_id:
-            supplier = Company.query.get(sale.supplier_id)
-            supplier_name = supplier.name if supplier else None
-        
-        daily_sales[sale_date]['sales'].append({
-            'id': sale.id,
-            'invoice_number': sale.invoice_number,
-            'customer_id': sale.customer_id,
-            'customer_name': sale.customer.name,
-            'supplier_id': sale.supplier_id,
-            'supplier_name': supplier_name,
-            'total_amount': float(sale.total_amount),
-            'paid_amount': float(sale.paid_amount),
-            'balance': float(sale.balance),
-            'payment_type': sale.payment_type,
-            'status': sale.status,
-            'items': items
-        })
+        if sale is None or sale['id'] != row.id:
+            sale = {
+                'id': row.id,
+                'invoice_number': row.invoice_number,
+                'customer_id': row.customer_id,
+                'customer_name': row.customer_name,
+                'supplier_id': row.supplier_id,
+                'supplier_name': row.supplier_name,
+                'total_amount': float(row.total_amount),
+                'paid_amount': float(row.paid_amount or 0),
+                'balance': float(row.balance),
+                'payment_type': row.payment_type,
+                'status': row.status,
+                'items': []
+            }
+            day['sales'].append(sale)
+            day['total_amount'] += row.total_amount
+            day['total_paid'] += row.paid_amount or 0
+            day['total_balance'] += row.balance
+            if row.customer_name not in day['customers']:
+                day['customers'].append(row.customer_name)
+            if row.supplier_name and row.supplier_name not in day['suppliers']:
+                day['suppliers'].append(row.supplier_name)
         
-        daily_sales[sale_date]['total_amount'] += sale.total_amount
-        daily_sales[sale_date]['total_paid'] += sale.paid_amount
-        daily_sales[sale_date]['total_balance'] += sale.balance
-        daily_sales[sale_date]['customers'].add(sale.customer.name)
-        if supplier_name:
-            daily_sales[sale_date]['suppliers'].add(supplier_name)
-    
-    # Convert to list format
-    result = []
-    for date, data in sorted(daily_sales.items()):
-        result.append({
-            'date': data['date'],
-            'total_amount': float(data['total_amount']),
-            'total_paid': float(data['total_paid']),
-            'total_balance': float(data['total_balance']),
-            'customers': list(data['customers']),
-            'suppliers': list(data['suppliers']),
-            'sales': data['sales']
-        })
+        if row.line_id is not None:
+            sale['items'].append({
+                'id': row.line_id,
+                'item_id': row.item_id,
+                'item_code': row.item_code,
+                'item_name': row.item_name,
+                'quantity': float(row.quantity),
+                'unit_price': float(row.unit_price),
+                'total_price': float(row.total_price),
+                'customer_name': row.customer_name,
+                'supplier_name': row.supplier_name
+            })
     
+    for day in result:
+        for key in ('total_amount', 'total_paid', 'total_balance'):
+            day[key] = float(day[key])
     return jsonify(result)
 
+def _daily_sales_totals(filters, customer, supplier):
+    """Day-level totals of the daily sales report: one GROUP BY query for the amounts and one
+    for the distinct customer/supplier names of each day."""
+    totals = db.session.query(
+        Sale.date,
+        func.count(Sale.id),
+        func.sum(Sale.total_amount),
+        func.sum(func.coalesce(Sale.paid_amount, 0)),
+        func.sum(Sale.balance)
+    ).filter(*filters).group_by(Sale.date).order_by(Sale.date).all()
+    
+    names = db.session.query(
+        Sale.date, customer.name, supplier.name
+    ).join(
+        customer, Sale.customer_id == customer.id
+    ).outerjoin(
+        supplier, Sale.supplier_id == supplier.id
+    ).filter(*filters).distinct().order_by(Sale.date, customer.name, supplier.name).all()
+    
+    customers, suppliers = {}, {}
+    for sale_date, customer_name, supplier_name in names:
+        day_customers = customers.setdefault(sale_date, [])
+        if customer_name not in day_customers:
+            day_customers.append(customer_name)
+        if supplier_name:
+            day_suppliers = suppliers.setdefault(sale_date, [])
+            if supplier_name not in day_suppliers:
+                day_suppliers.append(supplier_name)
+    
+    return [{
+        'date': sale_date.isoformat(),
+        'sale_count': count,
+        'total_amount': float(total_amount or 0),
+        'total_paid': float(total_paid or 0),
+        'total_balance': float(total_balance or 0),
+        'customers': customers.get(sale_date, []),
+        'suppliers': suppliers.get(sale_date, [])
+    } for sale_date, count, total_amount, total_paid, total_balance in totals]
+
+def _safe_statement_select(market_id, start_date_obj=None, end_date_obj=None):
+    """Daily IN/OUT totals with a running net (window SUM over date), joined to real balances.
+    The running net starts at zero on the first day of the range; add the opening balance."""
+    amount_base = func.coalesce(
+        SafeTransaction.amount_base_currency_stored,
+        SafeTransaction.amount * SafeTransaction.exchange_rate
+    )
+    daily = db.session.query(
+        SafeTransaction.date.label('date'),
+        func.sum(case((SafeTransaction.transaction_type.in_(['Opening', 'Inflow']), amount_base), else_=0)).label('total_in'),
+        func.sum(case((SafeTransaction.transaction_type == 'Outflow', amount_base), else_=0)).label('total_out')
+    ).filter(SafeTransaction.market_id == market_id)
+    if start_date_obj:
+        daily = daily.filter(SafeTransaction.date >= start_date_obj)
+    if end_date_obj:
+        daily = daily.filter(SafeTransaction.date <= end_date_obj)
+    daily = daily.group_by(SafeTransaction.date).subquery()
+    
+    running = db.session.query(
+        daily.c.date,
+        daily.c.total_in,
+        daily.c.total_out,
+        func.sum(daily.c.total_in - daily.c.total_out).over(order_by=daily.c.date).label('net')
+    ).subquery()
+    
+    return db.session.query(
+        running.c.date,
+        running.c.total_in,
+        running.c.total_out,
+        running.c.net,
+        SafeStatementRealBalance.real_balance
+    ).outerjoin(
+        SafeStatementRealBalance,
+        and_(SafeStatementRealBalance.market_id == market_id, SafeStatementRealBalance.date == running.c.date)
+    ), running
+
+
+def _safe_statement_row(row, opening_balance):
+    return {
+        'date': row.date.isoformat(),
+        'total_in': float(row.total_in or 0),
+        'total_out': float(row.total_out or 0),
+        'balance': float(opening_balance + Decimal(str(row.net or 0))),
+        'real_balance': float(row.real_balance) if row.real_balance else None
+    }
+
+
 @bp.route('/safe-statement', methods=['GET'])
 @login_required
 def get_safe_statement():
-    """Get safe statement with daily totals (IN/OUT) and real balance"""
+    """Get safe statement with daily totals (IN/OUT) and real balance.
+    Optional paging: limit (days per page) and cursor (last date of the previous page)."""
+    from openpyxl.utils import get_column_letter
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -118,88 +212,64 @@ def get_safe_statement():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     export_excel = request.args.get('export') == 'excel'
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', type=int)
     
-    # Get all transactions in date range
-    query = SafeTransaction.query.filter_by(market_id=market_id)
+    cursor_date = None
+    if cursor:
+        try:
+            cursor_date = datetime.strptime(cursor, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
     
-    if start_date:
-        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-        query = query.filter(SafeTransaction.date >= start_date_obj)
-    if end_date:
-        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-        query = query.filter(SafeTransaction.date <= end_date_obj)
-    
-    transactions = query.order_by(SafeTransaction.date.asc(), SafeTransaction.id.asc()).all()
-    
-    # Group by date
-    daily_totals = {}
-    for txn in transactions:
-        date_str = txn.date.isoformat()
-        if date_str not in daily_totals:
-            daily_totals[date_str] = {
-                'date': date_str,
-                'total_in': Decimal('0'),
-                'total_out': Decimal('0'),
-                'balance': Decimal('0'),
-                'real_balance': None
-            }
-        
-        if txn.transaction_type in ['Opening', 'Inflow']:
-            daily_totals[date_str]['total_in'] += txn.amount_base_currency
-        elif txn.transaction_type == 'Outflow':
-            daily_totals[date_str]['total_out'] += txn.amount_base_currency
-        
-        # Balance is the balance_after from the last transaction of the day
-        daily_totals[date_str]['balance'] = txn.balance_after
-    
-    # Get real balances from SafeStatementRealBalance
-    if daily_totals:
-        date_list = list(daily_totals.keys())
-        real_balances = SafeStatementRealBalance.query.filter_by(
-            market_id=market_id
-        ).filter(
-            SafeStatementRealBalance.date.in_([datetime.strptime(d, '%Y-%m-%d').date() for d in date_list])
-        ).all()
-        
-        for rb in real_balances:
-            date_str = rb.date.isoformat()
-            if date_str in daily_totals:
-                daily_totals[date_str]['real_balance'] = float(rb.real_balance) if rb.real_balance else None
-    
-    # Convert to list and sort by date
-    statement = []
-    for date_str in sorted(daily_totals.keys()):
-        data = daily_totals[date_str]
-        statement.append({
-            'date': data['date'],
-            'total_in': float(data['total_in']),
-            'total_out': float(data['total_out']),
-            'balance': float(data['balance']),
-            'real_balance': data['real_balance']
-        })
+    start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+    end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+    
+    # Balance carried into the range
+    opening_balance = Decimal('0')
+    if start_date_obj:
+        from api.safe import get_safe_balance_before
+        opening_balance = get_safe_balance_before(market_id, start_date_obj, commit=False)
     
-    # Export to Excel if requested
+    query, running = _safe_statement_select(market_id, start_date_obj, end_date_obj)
+    query = query.order_by(running.c.date.asc())
+    
+    # Export to Excel if requested: rows are written as they are fetched
     if export_excel:
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df = pd.DataFrame(statement)
-            df.to_excel(writer, index=False, sheet_name='Safe Statement')
-            
-            # Format columns
-            worksheet = writer.sheets['Safe Statement']
-            for idx, col in enumerate(df.columns):
-                max_length = max(
-                    df[col].astype(str).apply(len).max(),
-                    len(str(col))
-                )
-                worksheet.column_dimensions[get_column_letter(idx + 1)].width = min(max_length + 2, 50)
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet('Safe Statement')
+        columns = ['date', 'total_in', 'total_out', 'balance', 'real_balance']
+        for idx, col in enumerate(columns):
+            worksheet.column_dimensions[get_column_letter(idx + 1)].width = 16
+        worksheet.append(columns)
+        for row in query.yield_per(1000):
+            data = _safe_statement_row(row, opening_balance)
+            worksheet.append([data[col] for col in columns])
         
+        output = BytesIO()
+        workbook.save(output)
         output.seek(0)
         filename = f'safe_statement_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
         return send_file(output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 
                          as_attachment=True, download_name=filename)
     
-    return jsonify({'statement': statement})
+    if cursor_date:
+        query = query.filter(running.c.date > cursor_date)
+    if limit:
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        rows = query.all()
+        has_more = False
+    
+    statement = [_safe_statement_row(row, opening_balance) for row in rows]
+    
+    return jsonify({
+        'statement': statement,
+        'next_cursor': statement[-1]['date'] if has_more else None
+    })
 
 @bp.route('/safe-statement/real-balance', methods=['GET', 'PUT'])
 @login_required
@@ -643,6 +713,8 @@ def get_sales_report():
 @login_required
 def export_sales_report():
     """Export sales report to Excel"""
+    import pandas as pd
+    from openpyxl.utils import get_column_letter
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -1172,6 +1244,8 @@ def get_stock_value_details():
 @login_required
 def export_stock_value_details():
     """Export stock value details report to Excel"""
+    import pandas as pd
+    from openpyxl.utils import get_column_letter
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -1534,6 +1608,8 @@ def _get_average_sale_price_data(market_id, start_date, end_date, supplier_id, c
 @login_required
 def export_average_sale_price():
     """Export Average Sale Price report to Excel"""
+    import pandas as pd
+    from openpyxl.utils import get_column_letter
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -1575,6 +1651,41 @@ def export_average_sale_price():
     return send_file(output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
                      as_attachment=True, download_name=filename)
 
+def _last_purchases(market_id, supplier_id=None, item_id=None):
+    """Most recent purchase line of every item, in one query: ROW_NUMBER() over the purchase
+    lines of each item, newest container first, keeping row 1. Ordered by item code and name."""
+    ranked = db.session.query(
+        PurchaseItem.item_id,
+        PurchaseItem.unit_price,
+        PurchaseItem.quantity,
+        PurchaseItem.total_price,
+        PurchaseContainer.date,
+        PurchaseContainer.container_number,
+        PurchaseContainer.currency,
+        PurchaseContainer.supplier_id,
+        func.row_number().over(
+            partition_by=PurchaseItem.item_id,
+            order_by=(PurchaseContainer.date.desc(), PurchaseContainer.id.desc(), PurchaseItem.id.desc())
+        ).label('rn')
+    ).join(
+        PurchaseContainer, PurchaseItem.container_id == PurchaseContainer.id
+    ).join(
+        Item, PurchaseItem.item_id == Item.id
+    ).filter(PurchaseContainer.market_id == market_id)
+    if supplier_id:
+        ranked = ranked.filter(Item.supplier_id == supplier_id)
+    if item_id:
+        ranked = ranked.filter(PurchaseItem.item_id == item_id)
+    ranked = ranked.subquery()
+
+    return db.session.query(
+        ranked, Item.code, Item.name, Company.name.label('supplier_name')
+    ).join(
+        Item, ranked.c.item_id == Item.id
+    ).outerjoin(
+        Company, ranked.c.supplier_id == Company.id
+    ).filter(ranked.c.rn == 1).order_by(Item.code, Item.name).all()
+
 @bp.route('/last-purchase-price', methods=['GET'])
 @login_required
 def get_last_purchase_price():
@@ -1586,43 +1697,18 @@ def get_last_purchase_price():
     supplier_id = request.args.get('supplier_id', type=int)
     item_id = request.args.get('item_id', type=int)
 
-    # Get items that have purchases (with optional filters)
-    items_query = Item.query.filter_by(market_id=market_id)
-    if supplier_id:
-        items_query = items_query.filter(Item.supplier_id == supplier_id)
-    if item_id:
-        items_query = items_query.filter(Item.id == item_id)
-
-    items_list = []
-    for item in items_query.all():
-        # Get most recent purchase for this item
-        last_purchase = db.session.query(PurchaseItem, PurchaseContainer).join(
-            PurchaseContainer, PurchaseItem.container_id == PurchaseContainer.id
-        ).filter(
-            PurchaseContainer.market_id == market_id,
-            PurchaseItem.item_id == item.id
-        ).order_by(PurchaseContainer.date.desc(), PurchaseContainer.id.desc()).first()
-
-        if not last_purchase:
-            continue
-
-        pi, container = last_purchase
-        supplier = container.supplier if container else None
-
-        items_list.append({
-            'item_id': item.id,
-            'item_code': item.code,
-            'item_name': item.name,
-            'supplier_name': supplier.name if supplier else None,
-            'last_purchase_price': float(pi.unit_price),
-            'last_purchase_date': container.date.isoformat() if container.date else None,
-            'container_number': container.container_number if container else None,
-            'quantity': float(pi.quantity),
-            'total_price': float(pi.total_price),
-            'currency': container.currency if container else None
-        })
-
-    items_list.sort(key=lambda x: (x['item_code'] or '', x['item_name'] or ''))
+    items_list = [{
+        'item_id': row.item_id,
+        'item_code': row.code,
+        'item_name': row.name,
+        'supplier_name': row.supplier_name,
+        'last_purchase_price': float(row.unit_price),
+        'last_purchase_date': row.date.isoformat() if row.date else None,
+        'container_number': row.container_number,
+        'quantity': float(row.quantity),
+        'total_price': float(row.total_price),
+        'currency': row.currency
+    } for row in _last_purchases(market_id, supplier_id, item_id)]
 
     return jsonify({
         'items': items_list,
@@ -1633,6 +1719,8 @@ def get_last_purchase_price():
 @login_required
 def export_last_purchase_price():
     """Export Last Purchase Price report to Excel"""
+    import pandas as pd
+    from openpyxl.utils import get_column_letter
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -1640,40 +1728,17 @@ def export_last_purchase_price():
     supplier_id = request.args.get('supplier_id', type=int)
     item_id = request.args.get('item_id', type=int)
 
-    items_query = Item.query.filter_by(market_id=market_id)
-    if supplier_id:
-        items_query = items_query.filter(Item.supplier_id == supplier_id)
-    if item_id:
-        items_query = items_query.filter(Item.id == item_id)
-
-    export_data = []
-    for item in items_query.all():
-        last_purchase = db.session.query(PurchaseItem, PurchaseContainer).join(
-            PurchaseContainer, PurchaseItem.container_id == PurchaseContainer.id
-        ).filter(
-            PurchaseContainer.market_id == market_id,
-            PurchaseItem.item_id == item.id
-        ).order_by(PurchaseContainer.date.desc(), PurchaseContainer.id.desc()).first()
-
-        if not last_purchase:
-            continue
-
-        pi, container = last_purchase
-        supplier = container.supplier if container else None
-
-        export_data.append({
-            'Item Code': item.code,
-            'Item Name': item.name,
-            'Supplier': supplier.name if supplier else '',
-            'Last Purchase Price': float(pi.unit_price),
-            'Last Purchase Date': container.date.isoformat() if container.date else '',
-            'Container Number': container.container_number if container else '',
-            'Quantity': float(pi.quantity),
-            'Total Price': float(pi.total_price),
-            'Currency': container.currency if container else '',
-        })
-
-    export_data.sort(key=lambda x: (x['Item Code'] or '', x['Item Name'] or ''))
+    export_data = [{
+        'Item Code': row.code,
+        'Item Name': row.name,
+        'Supplier': row.supplier_name or '',
+        'Last Purchase Price': float(row.unit_price),
+        'Last Purchase Date': row.date.isoformat() if row.date else '',
+        'Container Number': row.container_number or '',
+        'Quantity': float(row.quantity),
+        'Total Price': float(row.total_price),
+        'Currency': row.currency or '',
+    } for row in _last_purchases(market_id, supplier_id, item_id)]
 
     output = BytesIO()
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
@@ -1693,77 +1758,131 @@ def export_last_purchase_price():
     return send_file(output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
                      as_attachment=True, download_name=filename)
 
+# Largest N accepted by the average-of-last-N-sales report
+MAX_LAST_N = 100
+
+def _last_n_values(value):
+    """Sorted distinct N values from "10" or "5,10,20" (default 10). Raises ValueError."""
+    try:
+        values = sorted({int(part) for part in (value or '10').split(',') if part.strip()})
+    except ValueError:
+        raise ValueError('n must be a number or a comma separated list of numbers')
+    if not values or values[0] < 1 or values[-1] > MAX_LAST_N:
+        raise ValueError(f'n must be between 1 and {MAX_LAST_N}')
+    return values
+
+def _last_n_sales(market_id, max_n, supplier_id=None, item_id=None):
+    """The last max_n sale lines of every item, in one query: ROW_NUMBER() over the sale lines
+    of each item, newest sale first, keeping rows 1..max_n. Returns (item row, lines) pairs
+    ordered by item code and name, lines newest first."""
+    customer = aliased(Company)
+    supplier = aliased(Company)
+
+    ranked = db.session.query(
+        SaleItem.item_id,
+        SaleItem.quantity,
+        SaleItem.unit_price,
+        SaleItem.total_price,
+        Sale.date,
+        Sale.invoice_number,
+        Sale.customer_id,
+        func.row_number().over(
+            partition_by=SaleItem.item_id,
+            order_by=(Sale.date.desc(), Sale.id.desc(), SaleItem.id.desc())
+        ).label('rn')
+    ).join(
+        Sale, SaleItem.sale_id == Sale.id
+    ).join(
+        Item, SaleItem.item_id == Item.id
+    ).filter(Sale.market_id == market_id)
+    if supplier_id:
+        ranked = ranked.filter(Item.supplier_id == supplier_id)
+    if item_id:
+        ranked = ranked.filter(SaleItem.item_id == item_id)
+    ranked = ranked.subquery()
+
+    rows = db.session.query(
+        ranked,
+        Item.code,
+        Item.name,
+        supplier.name.label('supplier_name'),
+        customer.name.label('customer_name'),
+        customer.currency.label('customer_currency')
+    ).join(
+        Item, ranked.c.item_id == Item.id
+    ).outerjoin(
+        supplier, Item.supplier_id == supplier.id
+    ).outerjoin(
+        customer, ranked.c.customer_id == customer.id
+    ).filter(ranked.c.rn <= max_n).order_by(Item.code, Item.name, Item.id, ranked.c.rn).all()
+
+    grouped = []
+    for row in rows:
+        if not grouped or grouped[-1][0].item_id != row.item_id:
+            grouped.append((row, []))
+        grouped[-1][1].append(row)
+    return grouped
+
+def _average_of(lines):
+    """(average price, total quantity, total revenue) of sale lines: revenue ÷ quantity."""
+    total_qty = sum(float(line.quantity) for line in lines)
+    total_rev = sum(float(line.total_price) for line in lines)
+    return (total_rev / total_qty if total_qty > 0 else 0), total_qty, total_rev
+
 @bp.route('/average-last-n-sales', methods=['GET'])
 @login_required
 def get_average_last_n_sales():
-    """Average of last N sales per item (N=10, or 9, 8, ... if fewer available).
-    For each item: take the last 10 sale line items (most recent), or all if fewer than 10.
-    Average = Total Revenue ÷ Total Quantity from those transactions."""
+    """Average of last N sales per item (N=10 by default, or fewer if fewer available).
+    For each item: take the last N sale line items (most recent), or all if fewer than N.
+    Average = Total Revenue ÷ Total Quantity from those transactions.
+    n may list several values (n=5,10,20): the main figures use the largest and
+    'averages' holds the figures for each N."""
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
 
     supplier_id = request.args.get('supplier_id', type=int)
     item_id = request.args.get('item_id', type=int)
-    max_n = 10
-
-    # Get all items that have sales (optional: filter by supplier/item)
-    items_query = Item.query.filter_by(market_id=market_id)
-    if supplier_id:
-        items_query = items_query.filter(Item.supplier_id == supplier_id)
-    if item_id:
-        items_query = items_query.filter(Item.id == item_id)
+    try:
+        n_values = _last_n_values(request.args.get('n'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    max_n = n_values[-1]
 
     items_list = []
-    for item in items_query.all():
-        # Get sale items for this item, most recent first
-        q = db.session.query(SaleItem, Sale).join(
-            Sale, SaleItem.sale_id == Sale.id
-        ).filter(
-            Sale.market_id == market_id,
-            SaleItem.item_id == item.id
-        ).options(joinedload(Sale.customer)).order_by(Sale.date.desc(), Sale.id.desc())
-
-        rows = q.limit(max_n).all()
-
-        if not rows:
-            continue
-
-        total_qty = sum(float(si.quantity) for si, _ in rows)
-        total_rev = sum(float(si.total_price) for si, _ in rows)
-        n_used = len(rows)
-        avg_price = total_rev / total_qty if total_qty > 0 else 0
-
-        sales_detail = []
-        for si, sale in rows:
-            sales_detail.append({
-                'date': sale.date.isoformat(),
-                'invoice_number': sale.invoice_number,
-                'customer_name': sale.customer.name if sale.customer else 'Unknown',
-                'customer_currency': sale.customer.currency if sale.customer else 'CFA',
-                'quantity': float(si.quantity),
-                'unit_price': float(si.unit_price),
-                'total_price': float(si.total_price)
-            })
+    for item, lines in _last_n_sales(market_id, max_n, supplier_id, item_id):
+        averages = {}
+        for n in n_values:
+            avg_price, total_qty, total_rev = _average_of(lines[:n])
+            averages[str(n)] = {
+                'average_sale_price': round(avg_price, 2),
+                'total_quantity_sold': total_qty,
+                'total_revenue': round(total_rev, 2),
+                'sales_used': len(lines[:n])
+            }
 
-        supplier = item.supplier
         items_list.append({
-            'item_id': item.id,
+            'item_id': item.item_id,
             'item_code': item.code,
             'item_name': item.name,
-            'supplier_name': supplier.name if supplier else None,
-            'average_sale_price': round(avg_price, 2),
-            'total_quantity_sold': total_qty,
-            'total_revenue': round(total_rev, 2),
-            'sales_used': n_used,
-            'sales': sales_detail
+            'supplier_name': item.supplier_name,
+            **averages[str(max_n)],
+            'averages': averages,
+            'sales': [{
+                'date': line.date.isoformat(),
+                'invoice_number': line.invoice_number,
+                'customer_name': line.customer_name or 'Unknown',
+                'customer_currency': line.customer_currency or 'CFA',
+                'quantity': float(line.quantity),
+                'unit_price': float(line.unit_price),
+                'total_price': float(line.total_price)
+            } for line in lines]
         })
 
-    items_list.sort(key=lambda x: (x['item_code'] or '', x['item_name'] or ''))
-
     return jsonify({
         'items': items_list,
         'max_n': max_n,
+        'n_values': n_values,
         'filters': {'supplier_id': supplier_id, 'item_id': item_id}
     })
 
@@ -1771,50 +1890,35 @@ def get_average_last_n_sales():
 @login_required
 def export_average_last_n_sales():
     """Export Average of Last N Sales report to Excel"""
+    import pandas as pd
+    from openpyxl.utils import get_column_letter
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
 
     supplier_id = request.args.get('supplier_id', type=int)
     item_id = request.args.get('item_id', type=int)
-    max_n = 10
-
-    items_query = Item.query.filter_by(market_id=market_id)
-    if supplier_id:
-        items_query = items_query.filter(Item.supplier_id == supplier_id)
-    if item_id:
-        items_query = items_query.filter(Item.id == item_id)
+    try:
+        n_values = _last_n_values(request.args.get('n'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     export_data = []
-    for item in items_query.all():
-        q = db.session.query(SaleItem, Sale).join(
-            Sale, SaleItem.sale_id == Sale.id
-        ).filter(
-            Sale.market_id == market_id,
-            SaleItem.item_id == item.id
-        ).order_by(Sale.date.desc(), Sale.id.desc())
-
-        rows = q.limit(max_n).all()
-        if not rows:
-            continue
-
-        total_qty = sum(float(si.quantity) for si, _ in rows)
-        total_rev = sum(float(si.total_price) for si, _ in rows)
-        n_used = len(rows)
-        avg_price = total_rev / total_qty if total_qty > 0 else 0
-
-        supplier = item.supplier
-        export_data.append({
+    for item, lines in _last_n_sales(market_id, n_values[-1], supplier_id, item_id):
+        row = {
             'Item Code': item.code,
             'Item Name': item.name,
-            'Supplier': supplier.name if supplier else '',
-            'Sales Used (N)': n_used,
-            'Average Sale Price': round(avg_price, 2),
-            'Total Quantity': total_qty,
-            'Total Revenue': round(total_rev, 2),
-        })
-
-    export_data.sort(key=lambda x: (x['Item Code'] or '', x['Item Name'] or ''))
+            'Supplier': item.supplier_name or '',
+        }
+        for n in n_values:
+            # One column set per N; plain headers when a single N was requested
+            suffix = f' (N={n})' if len(n_values) > 1 else ''
+            avg_price, total_qty, total_rev = _average_of(lines[:n])
+            row[f'Sales Used{suffix or " (N)"}'] = len(lines[:n])
+            row[f'Average Sale Price{suffix}'] = round(avg_price, 2)
+            row[f'Total Quantity{suffix}'] = total_qty
+            row[f'Total Revenue{suffix}'] = round(total_rev, 2)
+        export_data.append(row)
 
     output = BytesIO()
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
@@ -1930,6 +2034,8 @@ def get_safe_out_report():
 @login_required
 def export_safe_out_report():
     """Export Safe Out Report to Excel"""
+    import pandas as pd
+    from openpyxl.utils import get_column_letter
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
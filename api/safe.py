@@ -3,16 +3,21 @@ Safe (Cashbox) API endpoints
 """
 from flask import Blueprint, request, jsonify, session, send_file
 from flask_login import login_required
-from models import db, SafeTransaction, Market, Payment, Sale, Company
+from models import db, SafeTransaction, SafeDailyBalance, Market, Payment, Sale, Company
+from api.pagination import page_args, fetch_page, text_search
 from decimal import Decimal
 from datetime import datetime
-import pandas as pd
 from io import BytesIO
+from sqlalchemy import event, inspect, select, func, case, text
+from sqlalchemy.orm import aliased
+from metrics import timed
 
 bp = Blueprint('safe', __name__)
 
+@timed('safe_recalc_duration_seconds', operation='full')
 def recalc_safe_balances(market_id):
     """Recalculate balance_after for all safe transactions in order."""
+    lock_safe_ledger(market_id)
     txns = SafeTransaction.query.filter_by(market_id=market_id).order_by(
         SafeTransaction.date.asc(), SafeTransaction.id.asc()
     ).all()
@@ -25,6 +30,234 @@ def recalc_safe_balances(market_id):
         t.balance_after = balance
     db.session.commit()
 
+@timed('safe_recalc_duration_seconds', operation='from_date')
+def recalc_safe_balances_from(market_id, from_date):
+    """Recalculate balance_after only for safe transactions dated on or after from_date.
+
+    Rows before from_date are untouched; the pass is seeded with the closing balance of the last
+    earlier day in safe_daily_balances (get_safe_balance_before). Commits.
+    """
+    lock_safe_ledger(market_id)
+    # A missing snapshot set is rebuilt without committing, so the lock is held for the whole pass
+    balance = get_safe_balance_before(market_id, from_date, commit=False)
+
+    txns = SafeTransaction.query.filter(
+        SafeTransaction.market_id == market_id,
+        SafeTransaction.date >= from_date
+    ).order_by(SafeTransaction.date.asc(), SafeTransaction.id.asc()).all()
+    for t in txns:
+        if t.transaction_type in ['Opening', 'Inflow']:
+            balance += t.amount_base_currency
+        elif t.transaction_type == 'Outflow':
+            balance -= t.amount_base_currency
+        t.balance_after = balance
+    db.session.commit()
+
+def get_safe_balance_before(market_id, date, commit=True):
+    """Safe balance at the start of date: closing balance of the last earlier day in safe_daily_balances.
+
+    If the snapshots were never built they are rebuilt first; commit=False leaves the rebuild in the
+    caller's transaction. Read-only requests pass commit=False, so they never commit: the rebuild
+    is kept by the next write (or run `flask rebuild-safe-balances`).
+    """
+    _refresh_pending_safe_daily_balances(db.session())
+    previous = SafeDailyBalance.query.filter(
+        SafeDailyBalance.market_id == market_id,
+        SafeDailyBalance.date < date
+    ).order_by(SafeDailyBalance.date.desc()).first()
+    if previous:
+        return previous.closing_balance
+    
+    # No snapshot yet: either nothing happened before date, or the snapshots were never built
+    has_earlier = SafeTransaction.query.filter(
+        SafeTransaction.market_id == market_id,
+        SafeTransaction.date < date
+    ).first()
+    if not has_earlier:
+        return Decimal('0')
+    rebuild_safe_daily_balances(market_id, commit=commit)
+    previous = SafeDailyBalance.query.filter(
+        SafeDailyBalance.market_id == market_id,
+        SafeDailyBalance.date < date
+    ).order_by(SafeDailyBalance.date.desc()).first()
+    return previous.closing_balance if previous else Decimal('0')
+
+# First key of the two-key PostgreSQL advisory lock; the market id is the second
+SAFE_LEDGER_LOCK_SPACE = 0x5AFE
+
+def lock_safe_ledger(market_id):
+    """Serialize safe ledger writers of a market until the current transaction ends.
+
+    PostgreSQL takes a transaction-level advisory lock on (SAFE_LEDGER_LOCK_SPACE, market_id), so
+    markets do not wait for each other. SQLite has a single writer: the transaction is started with
+    BEGIN IMMEDIATE, taking the write lock before the last balance is read (a transaction that
+    has already written holds it).
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:space, :market_id)'),
+                           {'space': SAFE_LEDGER_LOCK_SPACE, 'market_id': market_id})
+    elif connection.dialect.name == 'sqlite':
+        if not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+def _signed_amount(transaction):
+    if transaction.transaction_type in ['Opening', 'Inflow']:
+        return transaction.amount_base_currency
+    if transaction.transaction_type == 'Outflow':
+        return -transaction.amount_base_currency
+    return Decimal('0')
+
+def post_safe_transaction(transaction):
+    """Add a new safe transaction with its balance_after, under the market's ledger lock.
+
+    The balance is read inside the lock from the last row on or before the transaction date. A
+    back-dated transaction shifts balance_after of the later rows by its amount with one UPDATE
+    instead of recalculating the history. Does not commit: the lock is held until the caller does.
+    """
+    market_id = transaction.market_id
+    lock_safe_ledger(market_id)
+    
+    previous = SafeTransaction.query.filter(
+        SafeTransaction.market_id == market_id,
+        SafeTransaction.date <= transaction.date
+    ).order_by(SafeTransaction.date.desc(), SafeTransaction.id.desc()).first()
+    balance_before = previous.balance_after if previous else Decimal('0')
+    
+    signed_amount = _signed_amount(transaction)
+    transaction.balance_after = balance_before + signed_amount
+    db.session.add(transaction)
+    
+    # New rows get the highest id, so only later dates come after it in ledger order
+    if signed_amount:
+        SafeTransaction.query.filter(
+            SafeTransaction.market_id == market_id,
+            SafeTransaction.date > transaction.date
+        ).update({SafeTransaction.balance_after: SafeTransaction.balance_after + signed_amount},
+                 synchronize_session=False)
+    return transaction
+
+@timed('safe_recalc_duration_seconds', operation='daily_balances')
+def refresh_safe_daily_balances(connection, market_id, from_date=None):
+    """Rewrite safe_daily_balances rows of a market from from_date onwards.
+    
+    Totals are aggregated from safe_transactions (base currency amounts), and the running
+    balance is seeded from the closing balance of the last day before from_date. Without an
+    earlier snapshot the whole market is rebuilt.
+    """
+    txn = SafeTransaction.__table__
+    daily = SafeDailyBalance.__table__
+    
+    opening = None
+    if from_date is not None:
+        opening = connection.execute(
+            select(daily.c.closing_balance)
+            .where(daily.c.market_id == market_id, daily.c.date < from_date)
+            .order_by(daily.c.date.desc())
+            .limit(1)
+        ).scalar()
+        if opening is None:
+            from_date = None
+    balance = Decimal(str(opening)) if opening is not None else Decimal('0')
+    
+    delete_stmt = daily.delete().where(daily.c.market_id == market_id)
+    if from_date is not None:
+        delete_stmt = delete_stmt.where(daily.c.date >= from_date)
+    connection.execute(delete_stmt)
+    
+    amount_base = func.coalesce(txn.c.amount_base_currency_stored, txn.c.amount * txn.c.exchange_rate)
+    totals = select(
+        txn.c.date,
+        func.sum(case((txn.c.transaction_type.in_(['Opening', 'Inflow']), amount_base), else_=0)).label('total_in'),
+        func.sum(case((txn.c.transaction_type == 'Outflow', amount_base), else_=0)).label('total_out')
+    ).where(txn.c.market_id == market_id)
+    if from_date is not None:
+        totals = totals.where(txn.c.date >= from_date)
+    totals = totals.group_by(txn.c.date).order_by(txn.c.date)
+    
+    rows = []
+    for day in connection.execute(totals):
+        total_in = Decimal(str(day.total_in or 0))
+        total_out = Decimal(str(day.total_out or 0))
+        balance += total_in - total_out
+        rows.append({
+            'market_id': market_id,
+            'date': day.date,
+            'total_in': total_in,
+            'total_out': total_out,
+            'closing_balance': balance
+        })
+    if rows:
+        connection.execute(daily.insert(), rows)
+
+@timed('safe_recalc_duration_seconds', operation='rebuild_daily_balances')
+def rebuild_safe_daily_balances(market_id=None, commit=True):
+    """Rebuild safe_daily_balances from scratch for one market (or all markets) and commit
+    (unless commit is False)."""
+    if market_id is None:
+        market_ids = [m.id for m in Market.query.all()]
+    else:
+        market_ids = [market_id]
+    connection = db.session.connection()
+    for mid in market_ids:
+        refresh_safe_daily_balances(connection, mid)
+    if commit:
+        db.session.commit()
+    return len(market_ids)
+
+# Changes to these columns move money in or out of a day
+_SAFE_BALANCE_FIELDS = ('market_id', 'date', 'transaction_type', 'amount', 'exchange_rate', 'amount_base_currency_stored')
+
+# session.info key: {market_id: earliest date} touched by flushes not yet reflected in the snapshots
+_PENDING_DAILY_BALANCES = 'pending_safe_daily_balances'
+
+@event.listens_for(db.session, 'after_flush')
+def _track_safe_daily_balances_after_flush(flush_session, flush_context):
+    """Record the earliest date each flushed safe transaction change touches, per market.
+
+    The snapshots are refreshed once from there before commit (or before a snapshot read), not
+    on every flush, so a batched import does not rebuild the same tail once per batch.
+    """
+    earliest = flush_session.info.setdefault(_PENDING_DAILY_BALANCES, {})
+    
+    def touch(market_id, date):
+        if market_id is None or date is None:
+            return
+        if market_id not in earliest or date < earliest[market_id]:
+            earliest[market_id] = date
+    
+    for obj in list(flush_session.new) + list(flush_session.deleted):
+        if isinstance(obj, SafeTransaction):
+            touch(obj.market_id, obj.date)
+    for obj in flush_session.dirty:
+        if not isinstance(obj, SafeTransaction):
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[field].history.has_changes() for field in _SAFE_BALANCE_FIELDS):
+            continue
+        touch(obj.market_id, obj.date)
+        for old_date in state.attrs['date'].history.deleted:
+            touch(obj.market_id, old_date)
+        for old_market in state.attrs['market_id'].history.deleted:
+            touch(old_market, obj.date)
+
+def _refresh_pending_safe_daily_balances(target_session):
+    """Flush, then bring safe_daily_balances up to date with the changes recorded so far."""
+    target_session.flush()
+    earliest = target_session.info.pop(_PENDING_DAILY_BALANCES, None)
+    if earliest:
+        connection = target_session.connection()
+        for market_id, from_date in earliest.items():
+            refresh_safe_daily_balances(connection, market_id, from_date)
+
+@event.listens_for(db.session, 'before_commit')
+def _refresh_safe_daily_balances_before_commit(commit_session):
+    _refresh_pending_safe_daily_balances(commit_session)
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_pending_safe_daily_balances(rollback_session):
+    rollback_session.info.pop(_PENDING_DAILY_BALANCES, None)
+
 @bp.route('/transactions', methods=['GET'])
 @login_required
 def get_transactions():
@@ -35,6 +268,14 @@ def get_transactions():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     transaction_type = request.args.get('transaction_type')  # Opening, Inflow, Outflow
+    # Manual entries only (not created by a payment, sale or expense)
+    manual = request.args.get('manual', '').lower() in ('1', 'true', 'yes')
+    search = request.args.get('q', '').strip()
+    
+    try:
+        page = page_args({'date': SafeTransaction.date, 'amount': SafeTransaction.amount}, 'date')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     query = SafeTransaction.query.filter_by(market_id=market_id)
     
@@ -44,10 +285,15 @@ def get_transactions():
         query = query.filter(SafeTransaction.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
     if end_date:
         query = query.filter(SafeTransaction.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    if manual:
+        query = query.filter(SafeTransaction.payment_id.is_(None), SafeTransaction.sale_id.is_(None),
+                             SafeTransaction.general_expense_id.is_(None))
+    if search:
+        query = query.filter(text_search(search, SafeTransaction.description))
     
-    transactions = query.order_by(SafeTransaction.date.desc(), SafeTransaction.id.desc()).all()
+    transactions, next_cursor = fetch_page(query, page, SafeTransaction.id)
     
-    return jsonify([{
+    rows = [{
         'id': t.id,
         'transaction_type': t.transaction_type,
         'amount': float(t.amount),
@@ -58,8 +304,24 @@ def get_transactions():
         'description': t.description,
         'balance_after': float(t.balance_after),
         'payment_id': t.payment_id,
-        'sale_id': t.sale_id
-    } for t in transactions])
+        'sale_id': t.sale_id,
+        'general_expense_id': t.general_expense_id
+    } for t in transactions]
+    if not page.limit:
+        return jsonify(rows)
+    
+    result = {'transactions': rows, 'next_cursor': next_cursor}
+    if not page.cursor:
+        base_amount = func.coalesce(SafeTransaction.amount_base_currency_stored,
+                                    SafeTransaction.amount * SafeTransaction.exchange_rate)
+        outflow = SafeTransaction.transaction_type == 'Outflow'
+        count, total_in, total_out = query.with_entities(
+            func.count(SafeTransaction.id),
+            func.coalesce(func.sum(case((outflow, 0), else_=base_amount)), 0),
+            func.coalesce(func.sum(case((outflow, base_amount), else_=0)), 0),
+        ).one()
+        result.update(count=count, total_in_base_currency=float(total_in), total_out_base_currency=float(total_out))
+    return jsonify(result)
 
 @bp.route('/balance', methods=['GET'])
 @login_required
@@ -106,18 +368,6 @@ def create_adjustment():
     # Calculate exact base currency amount
     exact_base_amount = amount * exchange_rate
     
-    # Get last safe balance
-    last_transaction = SafeTransaction.query.filter_by(market_id=market_id).order_by(
-        SafeTransaction.date.desc(), SafeTransaction.id.desc()
-    ).first()
-    
-    balance_before = last_transaction.balance_after if last_transaction else Decimal('0')
-    
-    if transaction_type == 'Inflow':
-        balance_after = balance_before + exact_base_amount
-    else:  # Outflow
-        balance_after = balance_before - exact_base_amount
-    
     description = data.get('description', f'Manual Adjustment - {transaction_type}')
     
     transaction = SafeTransaction(
@@ -128,16 +378,12 @@ def create_adjustment():
         exchange_rate=exchange_rate,
         amount_base_currency_stored=exact_base_amount,
         date=datetime.strptime(data['date'], '%Y-%m-%d').date(),
-        description=description,
-        balance_after=balance_after
+        description=description
     )
     
-    db.session.add(transaction)
+    post_safe_transaction(transaction)
     db.session.commit()
     
-    # Recalculate all balances to ensure consistency
-    recalc_safe_balances(market_id)
-    
     return jsonify({
         'id': transaction.id,
         'transaction_type': transaction.transaction_type,
@@ -217,6 +463,11 @@ def update_adjustment(transaction_id):
     
     # Calculate exact base currency amount
     exact_base_amount = amount * exchange_rate
+    new_date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+    
+    # Serialize with the other safe writers; balances move from the earlier of the two dates
+    lock_safe_ledger(market_id)
+    from_date = min(transaction.date, new_date)
     
     # Update transaction
     transaction.transaction_type = transaction_type
@@ -224,13 +475,11 @@ def update_adjustment(transaction_id):
     transaction.currency = currency
     transaction.exchange_rate = exchange_rate
     transaction.amount_base_currency_stored = exact_base_amount
-    transaction.date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+    transaction.date = new_date
     transaction.description = data.get('description', f'Manual Adjustment - {transaction_type}')
     
-    db.session.commit()
-    
-    # Recalculate all balances to ensure consistency
-    recalc_safe_balances(market_id)
+    # Recalculate balances from the earliest affected date and commit with the edit
+    recalc_safe_balances_from(market_id, from_date)
     
     # Refresh transaction to get updated balance_after
     db.session.refresh(transaction)
@@ -267,11 +516,13 @@ def delete_adjustment(transaction_id):
     if transaction.payment_id or transaction.sale_id or transaction.general_expense_id:
         return jsonify({'error': 'This transaction cannot be deleted (it is linked to a payment, sale, or expense)'}), 400
     
+    # Serialize with the other safe writers
+    lock_safe_ledger(market_id)
+    from_date = transaction.date
     db.session.delete(transaction)
-    db.session.commit()
     
-    # Recalculate all balances to ensure consistency
-    recalc_safe_balances(market_id)
+    # Recalculate balances from the deleted row's date and commit with the delete
+    recalc_safe_balances_from(market_id, from_date)
     
     return jsonify({'success': True})
 
@@ -284,7 +535,8 @@ def set_opening_balance():
     
     data = request.json
     
-    # Check if opening balance already exists
+    # Check if opening balance already exists (under the lock, so two requests cannot both add one)
+    lock_safe_ledger(market_id)
     existing = SafeTransaction.query.filter_by(
         market_id=market_id,
         transaction_type='Opening'
@@ -307,11 +559,10 @@ def set_opening_balance():
         exchange_rate=exchange_rate,
         amount_base_currency_stored=exact_base_amount,  # Store exact value directly
         date=datetime.strptime(data['date'], '%Y-%m-%d').date(),
-        description='Opening Balance',
-        balance_after=exact_base_amount
+        description='Opening Balance'
     )
     
-    db.session.add(transaction)
+    post_safe_transaction(transaction)
     db.session.commit()
     
     return jsonify({
@@ -355,11 +606,7 @@ def get_movement_report():
     
     # Get opening balance before start date
     if start_date:
-        opening_query = SafeTransaction.query.filter_by(market_id=market_id).filter(
-            SafeTransaction.date < datetime.strptime(start_date, '%Y-%m-%d').date()
-        ).order_by(SafeTransaction.date.desc(), SafeTransaction.id.desc())
-        opening_transaction = opening_query.first()
-        opening_balance = opening_transaction.balance_after if opening_transaction else Decimal('0')
+        opening_balance = get_safe_balance_before(market_id, datetime.strptime(start_date, '%Y-%m-%d').date(), commit=False)
     else:
         opening_balance = Decimal('0')
     
@@ -385,6 +632,7 @@ def get_movement_report():
 @bp.route('/movement-report/export', methods=['GET'])
 @login_required
 def export_safe_report():
+    import pandas as pd
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -401,11 +649,7 @@ def export_safe_report():
     transactions = query.order_by(SafeTransaction.date.asc(), SafeTransaction.id.asc()).all()
     
     if start_date:
-        opening_query = SafeTransaction.query.filter_by(market_id=market_id).filter(
-            SafeTransaction.date < datetime.strptime(start_date, '%Y-%m-%d').date()
-        ).order_by(SafeTransaction.date.desc(), SafeTransaction.id.desc())
-        opening_transaction = opening_query.first()
-        opening_balance = opening_transaction.balance_after if opening_transaction else Decimal('0')
+        opening_balance = get_safe_balance_before(market_id, datetime.strptime(start_date, '%Y-%m-%d').date(), commit=False)
     else:
         opening_balance = Decimal('0')
     
@@ -440,6 +684,96 @@ def export_safe_report():
     return send_file(output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
                     as_attachment=True, download_name=filename)
 
+def _collected_money_dataset(market_id, start_date=None, end_date=None):
+    """Load inflow transactions with their payment/sale/company details in one query.
+
+    Returns a columnar dict (one list per field) plus the Decimal amounts, so
+    the JSON report and the Excel export share the same dataset.
+    """
+    payment_company = aliased(Company)
+    sale_customer = aliased(Company)
+    # A payment-backed transaction takes its invoice from the payment's sale;
+    # only transactions without a payment fall back to their own sale_id.
+    sale_id = case(
+        (SafeTransaction.payment_id.isnot(None), Payment.sale_id),
+        else_=SafeTransaction.sale_id
+    )
+    amount = func.coalesce(
+        SafeTransaction.amount_base_currency_stored,
+        SafeTransaction.amount * SafeTransaction.exchange_rate
+    )
+
+    query = db.session.query(
+        SafeTransaction.date,
+        SafeTransaction.description,
+        SafeTransaction.currency,
+        SafeTransaction.exchange_rate,
+        amount.label('amount'),
+        Payment.id.label('payment_id'),
+        Payment.loan,
+        payment_company.name.label('payment_company'),
+        Sale.id.label('sale_id'),
+        Sale.invoice_number,
+        sale_customer.name.label('customer_name'),
+    ).select_from(SafeTransaction).outerjoin(
+        Payment, Payment.id == SafeTransaction.payment_id
+    ).outerjoin(
+        payment_company, payment_company.id == Payment.company_id
+    ).outerjoin(
+        Sale, Sale.id == sale_id
+    ).outerjoin(
+        sale_customer, sale_customer.id == Sale.customer_id
+    ).filter(
+        SafeTransaction.market_id == market_id,
+        SafeTransaction.transaction_type == 'Inflow'
+    )
+
+    if start_date:
+        query = query.filter(SafeTransaction.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+    if end_date:
+        query = query.filter(SafeTransaction.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+
+    columns = {name: [] for name in (
+        'date', 'source_type', 'source_name', 'customer_name', 'invoice_number',
+        'description', 'amount', 'currency', 'exchange_rate'
+    )}
+    amounts = []
+
+    for row in query.order_by(SafeTransaction.date.asc(), SafeTransaction.id.asc()):
+        source_type = 'Other'
+        source_name = None
+        invoice_number = None
+        customer_name = None
+
+        if row.payment_id is not None:
+            source_name = row.payment_company or 'Unknown'
+            if row.loan:
+                source_type = 'Loan'
+            else:
+                source_type = 'Payment'
+                if row.sale_id is not None:
+                    invoice_number = row.invoice_number
+                    customer_name = row.customer_name
+        elif row.sale_id is not None:
+            source_type = 'Cash Sale'
+            source_name = row.customer_name or 'Unknown'
+            invoice_number = row.invoice_number
+            customer_name = row.customer_name
+
+        txn_amount = Decimal(str(row.amount or 0))
+        amounts.append(txn_amount)
+        columns['date'].append(row.date.isoformat())
+        columns['source_type'].append(source_type)
+        columns['source_name'].append(source_name or 'Unknown')
+        columns['customer_name'].append(customer_name)
+        columns['invoice_number'].append(invoice_number)
+        columns['description'].append(row.description or '')
+        columns['amount'].append(float(txn_amount))
+        columns['currency'].append(row.currency)
+        columns['exchange_rate'].append(float(row.exchange_rate))
+
+    return columns, amounts
+
 @bp.route('/collected-money-report', methods=['GET'])
 @login_required
 def get_collected_money_report():
@@ -452,212 +786,91 @@ def get_collected_money_report():
     end_date = request.args.get('end_date')
     group_by = request.args.get('group_by', 'date')  # 'date', 'customer', or 'none'
     
-    # Get all inflow transactions
-    query = SafeTransaction.query.filter_by(
-        market_id=market_id,
-        transaction_type='Inflow'
-    )
-    
-    if start_date:
-        query = query.filter(SafeTransaction.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-    if end_date:
-        query = query.filter(SafeTransaction.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-    
-    transactions = query.order_by(SafeTransaction.date.asc(), SafeTransaction.id.asc()).all()
+    columns, amounts = _collected_money_dataset(market_id, start_date, end_date)
+    names = list(columns.keys())
     
-    # Build detailed transaction list
+    # Build items, the total and the requested grouping in a single pass
     collected_money = []
     total_collected = Decimal('0')
+    grouped = {}
     
-    for txn in transactions:
-        source_type = 'Other'
-        source_name = None
-        invoice_number = None
-        customer_name = None
-        
-        # Determine source
-        if txn.payment_id:
-            payment = Payment.query.get(txn.payment_id)
-            if payment:
-                if payment.loan:
-                    source_type = 'Loan'
-                    source_name = payment.company.name if payment.company else 'Unknown'
-                else:
-                    source_type = 'Payment'
-                    source_name = payment.company.name if payment.company else 'Unknown'
-                    if payment.sale_id:
-                        sale = Sale.query.get(payment.sale_id)
-                        if sale:
-                            invoice_number = sale.invoice_number
-                            customer_name = sale.customer.name if sale.customer else None
-        
-        elif txn.sale_id:
-            sale = Sale.query.get(txn.sale_id)
-            if sale:
-                source_type = 'Cash Sale'
-                source_name = sale.customer.name if sale.customer else 'Unknown'
-                invoice_number = sale.invoice_number
-                customer_name = sale.customer.name if sale.customer else None
-        
-        amount = txn.amount_base_currency_stored if txn.amount_base_currency_stored else txn.amount_base_currency
+    for values, amount in zip(zip(*columns.values()), amounts):
+        item = dict(zip(names, values))
+        collected_money.append(item)
         total_collected += amount
         
-        collected_money.append({
-            'date': txn.date.isoformat(),
-            'source_type': source_type,
-            'source_name': source_name or 'Unknown',
-            'customer_name': customer_name,
-            'invoice_number': invoice_number,
-            'description': txn.description or '',
-            'amount': float(amount),
-            'currency': txn.currency,
-            'exchange_rate': float(txn.exchange_rate)
-        })
-    
-    # Group if requested
-    if group_by == 'date':
-        grouped = {}
-        for item in collected_money:
-            date = item['date']
-            if date not in grouped:
-                grouped[date] = {
-                    'date': date,
-                    'items': [],
-                    'total': Decimal('0')
-                }
-            grouped[date]['items'].append(item)
-            grouped[date]['total'] += Decimal(str(item['amount']))
-        
-        grouped_list = []
-        for date in sorted(grouped.keys()):
-            data = grouped[date]
-            grouped_list.append({
-                'date': data['date'],
-                'total': float(data['total']),
-                'items': data['items']
-            })
+        if group_by == 'date':
+            key = item['date']
+        elif group_by == 'customer':
+            key = item['customer_name'] or item['source_name'] or 'Unknown'
+        else:
+            continue
         
+        group = grouped.get(key)
+        if group is None:
+            group = grouped[key] = {'items': [], 'total': Decimal('0')}
+        group['items'].append(item)
+        group['total'] += amount
+    
+    if group_by in ('date', 'customer'):
+        key_name = 'date' if group_by == 'date' else 'customer_name'
+        grouped_list = [
+            {
+                key_name: key,
+                'total': float(grouped[key]['total']),
+                'items': grouped[key]['items']
+            }
+            for key in sorted(grouped.keys())
+        ]
         return jsonify({
             'total_collected': float(total_collected),
-            'grouped_by': 'date',
+            'grouped_by': group_by,
             'data': grouped_list
         })
     
-    elif group_by == 'customer':
-        grouped = {}
-        for item in collected_money:
-            customer = item['customer_name'] or item['source_name'] or 'Unknown'
-            if customer not in grouped:
-                grouped[customer] = {
-                    'customer_name': customer,
-                    'items': [],
-                    'total': Decimal('0')
-                }
-            grouped[customer]['items'].append(item)
-            grouped[customer]['total'] += Decimal(str(item['amount']))
-        
-        grouped_list = []
-        for customer in sorted(grouped.keys()):
-            data = grouped[customer]
-            grouped_list.append({
-                'customer_name': data['customer_name'],
-                'total': float(data['total']),
-                'items': data['items']
-            })
-        
-        return jsonify({
-            'total_collected': float(total_collected),
-            'grouped_by': 'customer',
-            'data': grouped_list
-        })
-    
-    else:
-        # No grouping
-        return jsonify({
-            'total_collected': float(total_collected),
-            'grouped_by': 'none',
-            'data': collected_money
-        })
+    # No grouping
+    return jsonify({
+        'total_collected': float(total_collected),
+        'grouped_by': 'none',
+        'data': collected_money
+    })
 
 @bp.route('/collected-money-report/export', methods=['GET'])
 @login_required
 def export_collected_money_report():
     """Export collected money report to Excel"""
+    import pandas as pd
+    from openpyxl.utils import get_column_letter
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
     
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    group_by = request.args.get('group_by', 'date')
     
-    # Get data using the same logic as the report endpoint
-    query = SafeTransaction.query.filter_by(
-        market_id=market_id,
-        transaction_type='Inflow'
-    )
-    
-    if start_date:
-        query = query.filter(SafeTransaction.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
-    if end_date:
-        query = query.filter(SafeTransaction.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-    
-    transactions = query.order_by(SafeTransaction.date.asc(), SafeTransaction.id.asc()).all()
-    
-    # Build export data
-    export_data = []
-    for txn in transactions:
-        source_type = 'Other'
-        source_name = None
-        invoice_number = None
-        customer_name = None
-        
-        if txn.payment_id:
-            payment = Payment.query.get(txn.payment_id)
-            if payment:
-                if payment.loan:
-                    source_type = 'Loan'
-                    source_name = payment.company.name if payment.company else 'Unknown'
-                else:
-                    source_type = 'Payment'
-                    source_name = payment.company.name if payment.company else 'Unknown'
-                    if payment.sale_id:
-                        sale = Sale.query.get(payment.sale_id)
-                        if sale:
-                            invoice_number = sale.invoice_number
-                            customer_name = sale.customer.name if sale.customer else None
-        elif txn.sale_id:
-            sale = Sale.query.get(txn.sale_id)
-            if sale:
-                source_type = 'Cash Sale'
-                source_name = sale.customer.name if sale.customer else 'Unknown'
-                invoice_number = sale.invoice_number
-                customer_name = sale.customer.name if sale.customer else None
-        
-        amount = txn.amount_base_currency_stored if txn.amount_base_currency_stored else txn.amount_base_currency
-        
-        export_data.append({
-            'Date': txn.date.isoformat(),
-            'Source Type': source_type,
-            'Source/Customer': source_name or customer_name or 'Unknown',
-            'Invoice Number': invoice_number or '',
-            'Description': txn.description or '',
-            'Amount': float(amount),
-            'Currency': txn.currency,
-            'Exchange Rate': float(txn.exchange_rate)
-        })
+    # Same dataset as the report endpoint, already columnar
+    columns, _ = _collected_money_dataset(market_id, start_date, end_date)
+    df = pd.DataFrame({
+        'Date': columns['date'],
+        'Source Type': columns['source_type'],
+        'Source/Customer': columns['source_name'],
+        'Invoice Number': [number or '' for number in columns['invoice_number']],
+        'Description': columns['description'],
+        'Amount': columns['amount'],
+        'Currency': columns['currency'],
+        'Exchange Rate': columns['exchange_rate']
+    })
     
     # Create Excel file
     output = BytesIO()
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df = pd.DataFrame(export_data)
         df.to_excel(writer, index=False, sheet_name='Collected Money')
         
         # Auto-adjust column widths
         worksheet = writer.sheets['Collected Money']
         for idx, col in enumerate(df.columns):
             max_length = max(
-                df[col].astype(str).apply(len).max(),
+                df[col].astype(str).apply(len).max() if len(df) else 0,
                 len(str(col))
             )
             worksheet.column_dimensions[get_column_letter(idx + 1)].width = min(max_length + 2, 50)
@@ -4,10 +4,13 @@ Sales API endpoints
 from flask import Blueprint, request, jsonify, session
 from flask_login import login_required
 from models import db, Sale, SaleItem, Item, Company, Market, SafeTransaction, Payment
+from api.pagination import page_args, fetch_page, text_search
+from api.safe import post_safe_transaction
+from sqlalchemy import func, or_
+from sqlalchemy.orm import joinedload
 from decimal import Decimal
 from datetime import datetime
 import random
-import pandas as pd
 from io import BytesIO
 
 bp = Blueprint('sales', __name__)
@@ -38,6 +41,20 @@ def get_sales():
     supplier_id = request.args.get('supplier_id', type=int)
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    status = request.args.get('status')
+    payment_type = request.args.get('payment_type')
+    search = request.args.get('q', '').strip()
+    
+    try:
+        # By date, newest invoice first within a day (id only breaks remaining ties)
+        page = page_args({
+            'date': (Sale.date, Sale.invoice_number),
+            'invoice_number': Sale.invoice_number,
+            'total_amount': Sale.total_amount,
+            'balance': Sale.balance,
+        }, 'date')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     query = Sale.query.filter_by(market_id=market_id)
     
@@ -49,15 +66,31 @@ def get_sales():
         query = query.filter(Sale.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
     if end_date:
         query = query.filter(Sale.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
-    
-    sales = query.order_by(Sale.date.desc(), Sale.invoice_number.desc()).all()
-    
-    # Get supplier names in bulk
-    supplier_ids = [s.supplier_id for s in sales if s.supplier_id]
-    suppliers = {sup.id: sup.name for sup in Company.query.filter(Company.id.in_(supplier_ids)).all()} if supplier_ids else {}
-    
-    # Calculate total amount of filtered sales
-    total_amount = sum(s.total_amount for s in sales)
+    if status:
+        query = query.filter(Sale.status == status)
+    if payment_type:
+        query = query.filter(Sale.payment_type == payment_type)
+    if search:
+        matching_customers = db.select(Company.id).where(text_search(search, Company.name))
+        query = query.filter(or_(text_search(search, Sale.invoice_number, Sale.notes),
+                                 Sale.customer_id.in_(matching_customers)))
+    
+    # Totals of all matching sales, on every page
+    count, total_amount, total_balance = query.with_entities(
+        func.count(Sale.id),
+        func.coalesce(func.sum(Sale.total_amount), 0),
+        func.coalesce(func.sum(Sale.balance), 0),
+    ).one()
+    totals = {'total_amount': float(total_amount), 'total_balance': float(total_balance), 'count': count}
+    
+    # Customer and supplier names come in the same query (no lazy load per row)
+    sales, next_cursor = fetch_page(query.options(
+        joinedload(Sale.customer).load_only(Company.name),
+        joinedload(Sale.supplier).load_only(Company.name),
+    ), page, Sale.id)
+    # next_cursor only when paging, so unpaged callers get the response they always did
+    if page.limit:
+        totals['next_cursor'] = next_cursor
     
     return jsonify({
         'sales': [{
@@ -67,7 +100,7 @@ def get_sales():
             'customer_id': s.customer_id,
             'customer_name': s.customer.name,
             'supplier_id': s.supplier_id,
-            'supplier_name': suppliers.get(s.supplier_id) if s.supplier_id else None,
+            'supplier_name': s.supplier.name if s.supplier else None,
             'total_amount': float(s.total_amount),
             'paid_amount': float(s.paid_amount),
             'balance': float(s.balance),
@@ -75,8 +108,7 @@ def get_sales():
             'status': s.status,
             'notes': s.notes
         } for s in sales],
-        'total_amount': float(total_amount),
-        'count': len(sales)
+        **totals
     })
 
 @bp.route('', methods=['POST'])
@@ -163,26 +195,55 @@ def create_sale():
         db.session.add(sale)
         db.session.flush()
         
-        # Add items
+        # Validate items exist in this market (one query for all lines)
+        line_item_ids = []
         for item_data in data['items']:
             if 'item_id' not in item_data:
                 db.session.rollback()
                 return jsonify({'error': 'Each item must have item_id'}), 400
-            
-            # Validate item exists
-            item = Item.query.get(item_data['item_id'])
-            if not item:
+            try:
+                line_item_ids.append(int(item_data['item_id']))
+            except (TypeError, ValueError):
                 db.session.rollback()
-                return jsonify({'error': f'Item with id {item_data["item_id"]} not found'}), 404
+                return jsonify({'error': f'Invalid item_id: {item_data["item_id"]}'}), 400
+        found_ids = {item_id for item_id, in db.session.query(Item.id).filter(
+            Item.market_id == market_id,
+            Item.id.in_(set(line_item_ids))
+        )}
+        
+        # Add items
+        sale_items = []
+        for item_id, item_data in zip(line_item_ids, data['items']):
+            if item_id not in found_ids:
+                db.session.rollback()
+                return jsonify({'error': f'Item with id {item_id} not found'}), 404
             
             sale_item = SaleItem(
                 sale_id=sale.id,
-                item_id=item_data['item_id'],
+                item_id=item_id,
                 quantity=Decimal(str(item_data['quantity'])),
                 unit_price=Decimal(str(item_data['unit_price'])),
                 total_price=Decimal(str(item_data['quantity'])) * Decimal(str(item_data['unit_price']))
             )
             db.session.add(sale_item)
+            sale_items.append(sale_item)
+        
+        # Allocate batches if FIFO is active, in the same transaction as the sale
+        market = Market.query.get(market_id)
+        if not market:
+            db.session.rollback()
+            return jsonify({'error': 'Market not found'}), 404
+        if getattr(market, 'calculation_method', 'Average') == 'FIFO':
+            from api.fifo_calculations import allocate_sale_items_fifo, InsufficientInventoryError
+            db.session.flush()
+            try:
+                allocate_sale_items_fifo(market_id, sale_items)
+            except InsufficientInventoryError as e:
+                db.session.rollback()
+                item = Item.query.get(e.item_id)
+                item_label = f'{item.code} - {item.name}' if item else f'id {e.item_id}'
+                return jsonify({'error': f'Insufficient inventory for item {item_label}. '
+                                         f'Needed: {e.needed}, Available: {e.available}'}), 400
         
         # Create a Payment record for any initial payment (paid_amount > 0)
         # For cash sales, this ensures the payment appears in the customer statement
@@ -192,11 +253,6 @@ def create_sale():
             # If it's a cash sale but paid_amount is somehow 0, use total_amount
             payment_amount = paid_amount if paid_amount > 0 else total_amount
             
-            market = Market.query.get(market_id)
-            if not market:
-                db.session.rollback()
-                return jsonify({'error': 'Market not found'}), 404
-            
             # Determine payment currency and exchange rate
             payment_currency = customer.currency or market.base_currency
             # If customer currency matches market base currency, rate is 1
@@ -235,14 +291,6 @@ def create_sale():
             # If cash sale, also record in safe (only the paid_amount, not the total_amount)
             # The balance (total_amount - paid_amount) remains as receivable and doesn't go into safe
             if payment_type == 'Cash':
-                # Get last safe balance
-                last_transaction = SafeTransaction.query.filter_by(market_id=market_id).order_by(
-                    SafeTransaction.date.desc(), SafeTransaction.id.desc()
-                ).first()
-                
-                balance_before = last_transaction.balance_after if last_transaction else Decimal('0')
-                balance_after = balance_before + amount_base_currency
-                
                 safe_transaction = SafeTransaction(
                     market_id=market_id,
                     transaction_type='Inflow',
@@ -253,24 +301,12 @@ def create_sale():
                     date=sale.date,
                     description=f'Sale {invoice_number} (Collected: {payment_amount}, Balance: {total_amount - payment_amount})',
                     sale_id=sale.id,
-                    payment_id=payment.id,  # Link to the payment record
-                    balance_after=balance_after
+                    payment_id=payment.id  # Link to the payment record
                 )
-                db.session.add(safe_transaction)
+                post_safe_transaction(safe_transaction)
         
         db.session.commit()
         
-        # Allocate batches if FIFO is active
-        market = Market.query.get(market_id)
-        if market and getattr(market, 'calculation_method', 'Average') == 'FIFO':
-            from api.fifo_calculations import allocate_sale_item_fifo
-            for sale_item in sale.items:
-                try:
-                    allocate_sale_item_fifo(sale_item)
-                except Exception as e:
-                    # Log error but don't fail the sale creation
-                    print(f"Warning: Could not allocate FIFO for sale item {sale_item.id}: {e}")
-        
         # Get supplier name safely
         supplier_name = None
         if sale.supplier_id:
@@ -428,7 +464,8 @@ def update_sale(sale_id):
         elif initial_payment:
             # If paid_amount is now 0, delete the initial payment
             # Also delete associated safe transaction if exists
-            SafeTransaction.query.filter_by(payment_id=initial_payment.id).delete()
+            for safe_txn in SafeTransaction.query.filter_by(payment_id=initial_payment.id).all():
+                db.session.delete(safe_txn)
             db.session.delete(initial_payment)
     
     # Add new items if items were updated
@@ -531,7 +568,8 @@ def delete_sale(sale_id):
         return jsonify({'error': 'Cannot delete sale with existing payments'}), 400
     
     # Delete related safe transaction if cash sale
-    SafeTransaction.query.filter_by(sale_id=sale_id).delete()
+    for safe_txn in SafeTransaction.query.filter_by(sale_id=sale_id).all():
+        db.session.delete(safe_txn)
     
     db.session.delete(sale)
     db.session.commit()
@@ -549,8 +587,18 @@ def get_sales_by_item():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    query = db.session.query(SaleItem, Sale).join(
+    # Plain columns of the lines with their sale, customer and item: one query, no entities
+    query = db.session.query(
+        Sale.date, Sale.invoice_number, Company.name.label('customer_name'),
+        Item.code.label('item_code'), Item.name.label('item_name'),
+        SaleItem.quantity, SaleItem.unit_price, SaleItem.total_price,
+        Sale.payment_type, Sale.status
+    ).select_from(SaleItem).join(
         Sale, SaleItem.sale_id == Sale.id
+    ).join(
+        Company, Sale.customer_id == Company.id
+    ).join(
+        Item, SaleItem.item_id == Item.id
     ).filter(Sale.market_id == market_id)
     
     if item_id:
@@ -563,17 +611,17 @@ def get_sales_by_item():
     results = query.order_by(Sale.date.desc(), Sale.id.desc()).all()
     
     return jsonify([{
-        'date': sale.date.isoformat(),
-        'invoice_number': sale.invoice_number,
-        'customer_name': sale.customer.name,
-        'item_code': item.item.code,
-        'item_name': item.item.name,
-        'quantity': float(item.quantity),
-        'unit_price': float(item.unit_price),
-        'total_price': float(item.total_price),
-        'payment_type': sale.payment_type,
-        'status': sale.status
-    } for item, sale in results])
+        'date': row.date.isoformat(),
+        'invoice_number': row.invoice_number,
+        'customer_name': row.customer_name,
+        'item_code': row.item_code,
+        'item_name': row.item_name,
+        'quantity': float(row.quantity),
+        'unit_price': float(row.unit_price),
+        'total_price': float(row.total_price),
+        'payment_type': row.payment_type,
+        'status': row.status
+    } for row in results])
 
 @bp.route('/import', methods=['POST'])
 @login_required
@@ -591,6 +639,7 @@ def import_sales():
     Sales are grouped by Date, Customer, and Supplier.
     All items must belong to the specified supplier.
     """
+    import pandas as pd
     market_id = session.get('current_market_id')
     if not market_id:
         return jsonify({'error': 'No market selected'}), 400
@@ -809,15 +858,6 @@ def import_sales():
             # If cash sale, record in safe (only the paid_amount, not the total_amount)
             # The balance (total_amount - paid_amount) remains as receivable and doesn't go into safe
             if payment_type == 'Cash' and paid_amount > 0:
-                market = Market.query.get(market_id)
-                # Get last safe balance
-                last_transaction = SafeTransaction.query.filter_by(market_id=market_id).order_by(
-                    SafeTransaction.date.desc(), SafeTransaction.id.desc()
-                ).first()
-                
-                balance_before = last_transaction.balance_after if last_transaction else Decimal('0')
-                balance_after = balance_before + paid_amount
-                
                 # Calculate exact base currency amount (same as paid_amount for same currency)
                 exact_base_amount = paid_amount
                 
@@ -830,10 +870,9 @@ def import_sales():
                     amount_base_currency_stored=exact_base_amount,  # Store exact value directly
                     date=sale.date,
                     description=f'Sale {invoice_number} (Collected: {paid_amount}, Balance: {balance})',
-                    sale_id=sale.id,
-                    balance_after=balance_after
+                    sale_id=sale.id
                 )
-                db.session.add(safe_transaction)
+                post_safe_transaction(safe_transaction)
 
         db.session.commit()
 
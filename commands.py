@@ -0,0 +1,45 @@
+"""
+Flask CLI commands (flask --app app <command>)
+"""
+import click
+from flask.cli import with_appcontext
+from models import db
+
+@click.command('migrate')
+@with_appcontext
+def migrate_command():
+    """Apply pending schema migrations. Run once per deploy, before starting workers."""
+    from migrations import upgrade
+    applied = upgrade(db.engine, log=click.echo)
+    click.echo(f'Applied {len(applied)} migration(s)' if applied else 'Database is up to date')
+
+@click.command('migration-status')
+@with_appcontext
+def migration_status_command():
+    """List known migrations and whether they have been applied."""
+    from migrations import status
+    for version, name, applied in status(db.engine):
+        click.echo(f"{version} {name}: {'applied' if applied else 'pending'}")
+
+@click.command('rebuild-safe-balances')
+@click.option('--market-id', type=int, default=None, help='Only rebuild this market')
+@with_appcontext
+def rebuild_safe_balances_command(market_id):
+    """Rebuild the safe_daily_balances snapshots from safe transactions."""
+    from api.safe import rebuild_safe_daily_balances
+    count = rebuild_safe_daily_balances(market_id)
+    click.echo(f'Rebuilt daily safe balances for {count} market(s)')
+
+@click.command('rebuild-container-totals')
+@with_appcontext
+def rebuild_container_totals_command():
+    """Recompute the stored purchase container totals from purchase items."""
+    from api.purchases import refresh_container_totals
+    with db.engine.begin() as connection:
+        count = refresh_container_totals(connection)
+    click.echo(f'Recomputed totals for {count} container(s)')
+
+def register_commands(app):
+    for command in (migrate_command, migration_status_command,
+                    rebuild_safe_balances_command, rebuild_container_totals_command):
+        app.cli.add_command(command)
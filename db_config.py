@@ -0,0 +1,82 @@
+"""
+Database engine configuration per backend, driven by environment variables.
+
+SQLite (set as PRAGMAs on every new connection):
+  SQLITE_JOURNAL_MODE      default WAL, so report reads do not block the writer
+  SQLITE_SYNCHRONOUS       default NORMAL (safe with WAL)
+  SQLITE_BUSY_TIMEOUT_MS   default 5000, wait for the write lock instead of failing
+  SQLITE_MMAP_SIZE         default 268435456 (256 MB of memory-mapped reads)
+  SQLITE_CACHE_SIZE_KB     default 20000
+
+PostgreSQL (pool and session settings):
+  DB_POOL_SIZE             default 5 connections per worker process
+  DB_MAX_OVERFLOW          default 10
+  DB_POOL_TIMEOUT          default 30 seconds to wait for a pooled connection
+  DB_POOL_RECYCLE          default 1800 seconds
+  DB_POOL_PRE_PING         default true, drops connections closed by the server
+  DB_STATEMENT_TIMEOUT_MS  default 60000, 0 disables
+"""
+import os
+from sqlalchemy import event
+
+def _env(env, name, default):
+    value = env.get(name)
+    return value if value not in (None, '') else default
+
+def _env_int(env, name, default):
+    return int(_env(env, name, default))
+
+def _env_bool(env, name, default):
+    return str(_env(env, name, default)).lower() in ('1', 'true', 'yes', 'on')
+
+def engine_options(database_uri, env=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for the given database URI."""
+    if database_uri.startswith('postgresql'):
+        options = {
+            'pool_size': _env_int(env, 'DB_POOL_SIZE', 5),
+            'max_overflow': _env_int(env, 'DB_MAX_OVERFLOW', 10),
+            'pool_timeout': _env_int(env, 'DB_POOL_TIMEOUT', 30),
+            'pool_recycle': _env_int(env, 'DB_POOL_RECYCLE', 1800),
+            'pool_pre_ping': _env_bool(env, 'DB_POOL_PRE_PING', True),
+        }
+        statement_timeout = _env_int(env, 'DB_STATEMENT_TIMEOUT_MS', 60000)
+        if statement_timeout:
+            options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+        return options
+    return {}
+
+def sqlite_pragmas(env=os.environ):
+    """PRAGMA statements applied to each new SQLite connection, in order."""
+    return [
+        ('journal_mode', _env(env, 'SQLITE_JOURNAL_MODE', 'WAL')),
+        ('synchronous', _env(env, 'SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('busy_timeout', _env_int(env, 'SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        ('mmap_size', _env_int(env, 'SQLITE_MMAP_SIZE', 268435456)),
+        ('cache_size', -_env_int(env, 'SQLITE_CACHE_SIZE_KB', 20000)),  # negative = KiB
+    ]
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run the PRAGMAs on every connection the engine opens (no-op for other backends)."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+def init_app(app, db):
+    """Configure the engine options before db.init_app and install the SQLite PRAGMAs after it.
+    Explicit SQLALCHEMY_ENGINE_OPTIONS in the app config take precedence."""
+    options = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    db.init_app(app)
+
+    pragmas = sqlite_pragmas()
+    with app.app_context():
+        for engine in db.engines.values():
+            apply_sqlite_pragmas(engine, pragmas)
@@ -0,0 +1,611 @@
+"""
+Seeded synthetic data generator for development and benchmarking.
+
+Builds complete markets: suppliers in several currencies, service companies, cash and credit
+customers, thousands of items, purchase containers with expense 1/2/3 in mixed currencies,
+sales drawn from the stock actually received, customer and supplier payments, general expenses,
+the safe ledger with running balances and, for FIFO markets, inventory batches and sale
+allocations. The same --seed and --end-date always produce the same data.
+
+Rows are written with bulk INSERTs one simulated day at a time, so the ORM flush listeners
+(container totals, safe daily balances) do not run; the stored totals are computed here and
+the daily balance snapshots are rebuilt at the end.
+
+Run:
+  python generate_test_data.py                            # one year, defaults below
+  python generate_test_data.py --scale 0.05               # quick small dataset
+  python generate_test_data.py --database-url sqlite:///bench.db --markets 2 --seed 7
+
+New markets are appended; existing data is left alone. Log in as admin / admin123.
+"""
+import argparse
+import random
+import sys
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import insert, update
+
+from app import create_app
+from models import (db, Market, Company, Item, PurchaseContainer, PurchaseItem, Sale, SaleItem,
+                    Payment, SafeTransaction, GeneralExpense, InventoryBatch, SaleItemAllocation)
+
+BASE_CURRENCY = 'FCFA'
+# Supplier currencies and their rate to FCFA; EUR is pegged, the others drift per container
+CURRENCIES = {'USD': Decimal('600'), 'EUR': Decimal('655.957'), 'GBP': Decimal('760'), 'CNY': Decimal('84')}
+FLOATING = {'USD', 'GBP', 'CNY'}
+
+GRADES = ['A', 'B', 'C', 'Cream']
+CATEGORIES = {
+    'Men': ['Shirts', 'Trousers', 'Jackets', 'Shoes'],
+    'Women': ['Dresses', 'Blouses', 'Skirts', 'Shoes'],
+    'Children': ['Mixed', 'Shoes', 'Uniforms'],
+    'Household': ['Curtains', 'Bedding', 'Towels'],
+}
+BALE_WEIGHTS = [Decimal('25'), Decimal('45'), Decimal('55'), Decimal('100')]
+EXPENSE_CATEGORIES = ['Rent', 'Salaries', 'Electricity', 'Transport', 'Security', 'Taxes', 'Maintenance']
+
+# Cash above this is banked at the end of the day, down to SAFE_TARGET
+OPENING_BALANCE = Decimal('10000000')
+SAFE_CEILING = Decimal('40000000')
+SAFE_TARGET = Decimal('10000000')
+
+CHUNK = 5000
+CENT = Decimal('0.01')
+
+def money(value):
+    return Decimal(value).quantize(CENT)
+
+def insert_returning_ids(model, rows):
+    """Bulk INSERT, returning the new primary keys in the order of rows."""
+    ids = []
+    for start in range(0, len(rows), CHUNK):
+        ids.extend(db.session.scalars(
+            insert(model).returning(model.id, sort_by_parameter_order=True),
+            rows[start:start + CHUNK]
+        ).all())
+    return ids
+
+def insert_rows(model, rows):
+    for start in range(0, len(rows), CHUNK):
+        db.session.execute(insert(model), rows[start:start + CHUNK])
+
+class StockPool:
+    """In-stock item ids per supplier with O(1) random pick and removal."""
+    def __init__(self):
+        self.items = {}
+        self.positions = {}
+
+    def add(self, supplier_id, item_id):
+        if item_id in self.positions:
+            return
+        bucket = self.items.setdefault(supplier_id, [])
+        self.positions[item_id] = (supplier_id, len(bucket))
+        bucket.append(item_id)
+
+    def remove(self, item_id):
+        supplier_id, index = self.positions.pop(item_id)
+        bucket = self.items[supplier_id]
+        last = bucket.pop()
+        if last != item_id:
+            bucket[index] = last
+            self.positions[last] = (supplier_id, index)
+
+    def suppliers(self):
+        return [s for s, bucket in self.items.items() if bucket]
+
+class MarketGenerator:
+    def __init__(self, rng, args, number, end_date):
+        self.rng = rng
+        self.args = args
+        self.number = number
+        self.end_date = end_date
+        self.start_date = end_date - timedelta(days=args.days - 1)
+        self.fifo = args.calculation_method == 'FIFO'
+        self.counts = {}
+
+    def count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def scaled(self, value, minimum=1):
+        return max(minimum, int(round(value * self.args.scale)))
+
+    def run(self):
+        self.market_id = insert_returning_ids(Market, [{
+            'name': f'Test Market {self.number}',
+            'address': f'Stall {self.number}, Central Market',
+            'base_currency': BASE_CURRENCY,
+            'calculation_method': self.args.calculation_method,
+        }])[0]
+
+        self.create_companies()
+        self.create_items()
+        self.plan_containers()
+
+        self.safe_balance = Decimal('0')
+        self.stock = StockPool()
+        self.batches = {}          # item_id -> deque of [batch_id or None, remaining, base cost]
+        self.batch_remaining = {}  # batch_id -> available quantity
+        self.item_cost = {}        # item_id -> latest landed cost per unit in base currency
+        self.receivables = {c['id']: Decimal('0') for c in self.customers if c['payment_type'] == 'Credit'}
+        self.invoice_seq = 0
+
+        total_sales = self.scaled(self.args.sales)
+        total_payments = self.scaled(self.args.payments)
+        total_expenses = self.scaled(self.args.expenses)
+        days = self.args.days
+
+        for offset in range(days):
+            day = self.start_date + timedelta(days=offset)
+            safe_rows = []
+            if offset == 0:
+                safe_rows.append(self.safe_row('Opening', OPENING_BALANCE, day, 'Opening balance'))
+            self.receive_containers(day, safe_rows)
+            self.create_sales(day, self.day_share(total_sales, offset, days), safe_rows)
+            self.create_payments(day, self.day_share(total_payments, offset, days), safe_rows)
+            self.create_expenses(day, self.day_share(total_expenses, offset, days), safe_rows)
+            if self.safe_balance > SAFE_CEILING:
+                safe_rows.append(self.safe_row('Outflow', self.safe_balance - SAFE_TARGET, day, 'Bank deposit'))
+            insert_rows(SafeTransaction, safe_rows)
+            self.count('safe_transactions', len(safe_rows))
+            db.session.commit()
+
+        if self.fifo and self.batch_remaining:
+            db.session.execute(update(InventoryBatch), [
+                {'id': batch_id, 'available_quantity': remaining}
+                for batch_id, remaining in self.batch_remaining.items()
+            ])
+        from api.safe import rebuild_safe_daily_balances
+        db.session.commit()
+        rebuild_safe_daily_balances(self.market_id)
+        return self.counts
+
+    def day_share(self, total, offset, days):
+        """Even split of total over the days, exact over the whole period."""
+        return total * (offset + 1) // days - total * offset // days
+
+    def create_companies(self):
+        rng = self.rng
+        currencies = list(CURRENCIES)
+        suppliers = [{
+            'market_id': self.market_id,
+            'name': f'Supplier {self.number}-{n + 1:02d}',
+            'address': f'Warehouse {n + 1}',
+            'category': 'Supplier',
+            'currency': currencies[n % len(currencies)],
+        } for n in range(self.scaled(self.args.suppliers, 2))]
+        services = [{
+            'market_id': self.market_id,
+            'name': f'Clearing Agent {self.number}-{n + 1:02d}',
+            'address': 'Port',
+            'category': 'Service Company',
+            'currency': BASE_CURRENCY,
+        } for n in range(self.scaled(self.args.service_companies))]
+        customers = [{
+            'market_id': self.market_id,
+            'name': f'Customer {self.number}-{n + 1:04d}',
+            'address': f'Shop {n + 1}',
+            'category': 'Customer',
+            'payment_type': 'Cash' if rng.random() < 0.6 else 'Credit',
+            'currency': BASE_CURRENCY,
+        } for n in range(self.scaled(self.args.customers, 2))]
+
+        for rows in (suppliers, services, customers):
+            for row, company_id in zip(rows, insert_returning_ids(Company, rows)):
+                row['id'] = company_id
+        self.suppliers, self.services, self.customers = suppliers, services, customers
+        self.count('companies', len(suppliers) + len(services) + len(customers))
+
+    def create_items(self):
+        rng = self.rng
+        rows = []
+        for n in range(self.scaled(self.args.items, len(self.suppliers))):
+            supplier = self.suppliers[n % len(self.suppliers)]
+            category1 = rng.choice(list(CATEGORIES))
+            category2 = rng.choice(CATEGORIES[category1])
+            grade = rng.choice(GRADES)
+            rows.append({
+                'market_id': self.market_id,
+                'supplier_id': supplier['id'],
+                'code': f'M{self.number}-{n + 1:05d}',
+                'name': f'{category1} {category2} grade {grade} #{n + 1}',
+                'weight': rng.choice(BALE_WEIGHTS),
+                'grade': grade,
+                'category1': category1,
+                'category2': category2,
+            })
+        for row, item_id in zip(rows, insert_returning_ids(Item, rows)):
+            row['id'] = item_id
+        self.items = {row['id']: row for row in rows}
+        self.items_by_supplier = {}
+        for row in rows:
+            self.items_by_supplier.setdefault(row['supplier_id'], []).append(row['id'])
+        self.count('items', len(rows))
+
+    def plan_containers(self):
+        """Container dates: a tenth arrive on day one to stock the market, the rest spread out."""
+        total = self.scaled(self.args.containers, len(self.suppliers))
+        opening = max(1, total // 10)
+        self.container_days = {}
+        for n in range(total):
+            offset = 0 if n < opening else self.rng.randint(0, self.args.days - 1)
+            self.container_days.setdefault(offset, 0)
+            self.container_days[offset] += 1
+
+    def rate_for(self, currency):
+        if currency == BASE_CURRENCY:
+            return Decimal('1')
+        rate = CURRENCIES[currency]
+        if currency in FLOATING:
+            rate *= Decimal(str(1 + self.rng.uniform(-0.05, 0.05)))
+        return rate.quantize(Decimal('0.0001'))
+
+    def receive_containers(self, day, safe_rows):
+        from api.fifo_calculations import calculate_landed_costs
+        rng = self.rng
+        n = self.container_days.get((day - self.start_date).days, 0)
+        if not n:
+            return
+
+        containers, lines_per_container = [], []
+        for _ in range(n):
+            supplier = rng.choice(self.suppliers)
+            currency = supplier['currency']
+            rate = self.rate_for(currency)
+            candidates = self.items_by_supplier.get(supplier['id'], [])
+            item_ids = rng.sample(candidates, min(len(candidates), rng.randint(15, 45)))
+            lines = [(item_id, Decimal(rng.randint(50, 400)), money(rng.uniform(5, 80))) for item_id in item_ids]
+            items_total = sum(qty * price for _, qty, price in lines)
+
+            service = rng.choice(self.services)
+            expense2_currency = rng.choice([BASE_CURRENCY, currency])
+            expense3_currency = rng.choice([BASE_CURRENCY, BASE_CURRENCY, currency])
+            clearing = items_total * Decimal(str(rng.uniform(0.02, 0.05)))
+            container = {
+                'market_id': self.market_id,
+                'container_number': f'CNT-{self.number}-{day:%Y%m%d}-{len(containers) + 1:02d}-{rng.randint(1000, 9999)}',
+                'supplier_id': supplier['id'],
+                'currency': currency,
+                'exchange_rate': rate,
+                'date': day,
+                'notes': '',
+                # Freight billed by the supplier, clearing by an agent, cash handling at the port
+                'expense1_amount': money(items_total * Decimal(str(rng.uniform(0.03, 0.08)))),
+                'expense1_currency': currency,
+                'expense1_exchange_rate': rate,
+                'expense2_amount': money(clearing if expense2_currency == currency else clearing * rate),
+                'expense2_service_company_id': service['id'],
+                'expense2_currency': expense2_currency,
+                'expense2_exchange_rate': rate if expense2_currency == currency else Decimal('1'),
+                'expense3_amount': money(rng.uniform(50000, 400000) / float(rate if expense3_currency == currency else 1)),
+                'expense3_currency': expense3_currency,
+                'expense3_exchange_rate': rate if expense3_currency == currency else Decimal('1'),
+                'items_total': money(items_total),
+                'items_total_base_currency': money(items_total * rate),
+            }
+            containers.append(container)
+            lines_per_container.append(lines)
+
+        container_ids = insert_returning_ids(PurchaseContainer, containers)
+        self.count('containers', len(containers))
+
+        purchase_rows = []
+        for container, container_id, lines in zip(containers, container_ids, lines_per_container):
+            container['id'] = container_id
+            for item_id, qty, price in lines:
+                purchase_rows.append({
+                    'container_id': container_id,
+                    'item_id': item_id,
+                    'quantity': qty,
+                    'unit_price': price,
+                    'total_price': money(qty * price),
+                })
+            base_amount = money(container['expense3_amount'] * container['expense3_exchange_rate'])
+            safe_rows.append(self.safe_row(
+                'Outflow', base_amount, day,
+                f"Container {container['container_number']} - Expense 3 (Cash Expense)",
+                amount=container['expense3_amount'], currency=container['expense3_currency'],
+                exchange_rate=container['expense3_exchange_rate']
+            ))
+        purchase_ids = insert_returning_ids(PurchaseItem, purchase_rows)
+        self.count('purchase_items', len(purchase_rows))
+
+        batch_rows = []
+        row_index = 0
+        for container, lines in zip(containers, lines_per_container):
+            costs = calculate_landed_costs(PurchaseContainer(**container), [
+                (qty, price, self.items[item_id]['weight']) for item_id, qty, price in lines
+            ])
+            for (item_id, qty, price), (cog_per_unit, cost_per_unit) in zip(lines, costs):
+                base_cost = money(cost_per_unit * container['exchange_rate'])
+                self.item_cost[item_id] = base_cost
+                batch_rows.append({
+                    'market_id': self.market_id,
+                    'item_id': item_id,
+                    'purchase_item_id': purchase_ids[row_index],
+                    'container_id': container['id'],
+                    'purchase_date': day,
+                    'original_quantity': qty,
+                    'available_quantity': qty,
+                    'unit_price': price,
+                    'cog_per_unit': money(cog_per_unit),
+                    'cost_per_unit': money(cost_per_unit),
+                    'currency': container['currency'],
+                    'exchange_rate': container['exchange_rate'],
+                })
+                row_index += 1
+
+        batch_ids = insert_returning_ids(InventoryBatch, batch_rows) if self.fifo else [None] * len(batch_rows)
+        self.count('inventory_batches', len(batch_rows) if self.fifo else 0)
+        for row, batch_id in zip(batch_rows, batch_ids):
+            item_id = row['item_id']
+            self.batches.setdefault(item_id, deque()).append(
+                [batch_id, row['original_quantity'], money(row['cost_per_unit'] * row['exchange_rate'])]
+            )
+            self.stock.add(self.items[item_id]['supplier_id'], item_id)
+
+    def take_stock(self, item_id, quantity):
+        """Consume quantity from the item's oldest batches; returns [(batch_id, qty, base cost)]."""
+        taken = []
+        batches = self.batches[item_id]
+        while quantity > 0 and batches:
+            batch = batches[0]
+            qty = min(quantity, batch[1])
+            taken.append((batch[0], qty, batch[2]))
+            batch[1] -= qty
+            quantity -= qty
+            if batch[0] is not None:
+                self.batch_remaining[batch[0]] = batch[1]
+            if batch[1] <= 0:
+                batches.popleft()
+        if not batches:
+            self.stock.remove(item_id)
+        return taken
+
+    def create_sales(self, day, n, safe_rows):
+        rng = self.rng
+        sales, sale_lines = [], []
+        for _ in range(n):
+            suppliers = self.stock.suppliers()
+            if not suppliers:
+                break
+            supplier_id = rng.choice(suppliers)
+            customer = rng.choice(self.customers)
+            lines = []
+            for _ in range(rng.randint(1, 6)):
+                bucket = self.stock.items.get(supplier_id)
+                if not bucket:
+                    break
+                item_id = rng.choice(bucket)
+                available = sum(batch[1] for batch in self.batches[item_id])
+                qty = min(Decimal(rng.randint(1, 10)), available)
+                taken = self.take_stock(item_id, qty)
+                price = (self.item_cost[item_id] * Decimal(str(rng.uniform(1.15, 1.45)))).quantize(Decimal('1'))
+                lines.append((item_id, qty, price, taken))
+            if not lines:
+                continue
+
+            total = money(sum(qty * price for _, qty, price, _ in lines))
+            if customer['payment_type'] == 'Cash':
+                paid = total
+            elif rng.random() < 0.3:
+                paid = money(total * Decimal(str(rng.uniform(0.2, 0.8))))
+            else:
+                paid = Decimal('0')
+            self.invoice_seq += 1
+            sales.append({
+                'market_id': self.market_id,
+                'invoice_number': f'SAL-{day:%Y%m%d}-M{self.market_id}-{self.invoice_seq:06d}',
+                'customer_id': customer['id'],
+                'supplier_id': supplier_id,
+                'date': day,
+                'total_amount': total,
+                'paid_amount': paid,
+                'balance': total - paid,
+                'payment_type': customer['payment_type'],
+                'status': 'Paid' if paid >= total else ('Partial' if paid > 0 else 'Unpaid'),
+                'notes': '',
+            })
+            sale_lines.append(lines)
+            if customer['id'] in self.receivables:
+                self.receivables[customer['id']] += total - paid
+        if not sales:
+            return
+
+        sale_ids = insert_returning_ids(Sale, sales)
+        item_rows, allocations_per_row, payments = [], [], []
+        for sale, sale_id, lines in zip(sales, sale_ids, sale_lines):
+            sale['id'] = sale_id
+            for item_id, qty, price, taken in lines:
+                item_rows.append({
+                    'sale_id': sale_id,
+                    'item_id': item_id,
+                    'quantity': qty,
+                    'unit_price': price,
+                    'total_price': money(qty * price),
+                })
+                allocations_per_row.append(taken)
+            if sale['paid_amount'] > 0:
+                payments.append({
+                    'market_id': self.market_id,
+                    'company_id': sale['customer_id'],
+                    'sale_id': sale_id,
+                    'payment_type': 'In',
+                    'amount': sale['paid_amount'],
+                    'currency': BASE_CURRENCY,
+                    'exchange_rate': Decimal('1'),
+                    'amount_base_currency_stored': sale['paid_amount'],
+                    'date': day,
+                    'notes': f"Initial payment for invoice {sale['invoice_number']}",
+                    'loan': False,
+                })
+        sale_item_ids = insert_returning_ids(SaleItem, item_rows)
+        self.count('sales', len(sales))
+        self.count('sale_items', len(item_rows))
+
+        if self.fifo:
+            allocations = [{
+                'sale_item_id': sale_item_id,
+                'batch_id': batch_id,
+                'quantity': qty,
+                'cost_per_unit': cost,
+                'total_cost': money(cost * qty),
+            } for sale_item_id, taken in zip(sale_item_ids, allocations_per_row) for batch_id, qty, cost in taken]
+            insert_rows(SaleItemAllocation, allocations)
+            self.count('sale_item_allocations', len(allocations))
+
+        payment_ids = insert_returning_ids(Payment, payments)
+        self.count('payments', len(payments))
+        sales_by_id = {sale['id']: sale for sale in sales}
+        for payment, payment_id in zip(payments, payment_ids):
+            sale = sales_by_id[payment['sale_id']]
+            # Only cash sales put their initial payment in the safe (as create_sale does)
+            if sale['payment_type'] == 'Cash':
+                safe_rows.append(self.safe_row(
+                    'Inflow', payment['amount'], day,
+                    f"Sale {sale['invoice_number']} (Collected: {payment['amount']}, Balance: {sale['balance']})",
+                    sale_id=sale['id'], payment_id=payment_id
+                ))
+
+    def create_payments(self, day, n, safe_rows):
+        rng = self.rng
+        cash = self.safe_balance
+        payments = []
+        for _ in range(n):
+            roll = rng.random()
+            if roll < 0.7:
+                debtors = [cid for cid, owed in self.receivables.items() if owed > 0]
+                if not debtors:
+                    continue
+                customer_id = rng.choice(debtors)
+                amount = money(self.receivables[customer_id] * Decimal(str(rng.uniform(0.2, 1))))
+                if amount <= 0:
+                    continue
+                self.receivables[customer_id] -= amount
+                company, payment_type, currency, rate = customer_id, 'In', BASE_CURRENCY, Decimal('1')
+            else:
+                if roll < 0.95:
+                    supplier = rng.choice(self.suppliers)
+                    company, currency = supplier['id'], supplier['currency']
+                else:
+                    company, currency = rng.choice(self.services)['id'], BASE_CURRENCY
+                rate = self.rate_for(currency)
+                # Suppliers and agents are only paid from cash actually in the safe
+                budget = cash - SAFE_TARGET / 4
+                if budget <= 0:
+                    continue
+                amount = money(min(budget, Decimal(rng.randint(500000, 5000000))) / rate)
+                if amount <= 0:
+                    continue
+                payment_type = 'Out'
+            base_amount = money(amount * rate)
+            cash += base_amount if payment_type == 'In' else -base_amount
+            payments.append({
+                'market_id': self.market_id,
+                'company_id': company,
+                'sale_id': None,
+                'payment_type': payment_type,
+                'amount': amount,
+                'currency': currency,
+                'exchange_rate': rate,
+                'amount_base_currency_stored': base_amount,
+                'date': day,
+                'notes': '',
+                'loan': False,
+            })
+        if not payments:
+            return
+
+        names = {c['id']: c['name'] for c in self.suppliers + self.services + self.customers}
+        for payment, payment_id in zip(payments, insert_returning_ids(Payment, payments)):
+            incoming = payment['payment_type'] == 'In'
+            safe_rows.append(self.safe_row(
+                'Inflow' if incoming else 'Outflow', payment['amount_base_currency_stored'], day,
+                f"Payment {'from' if incoming else 'to'} {names[payment['company_id']]}",
+                amount=payment['amount'], currency=payment['currency'],
+                exchange_rate=payment['exchange_rate'], payment_id=payment_id
+            ))
+        self.count('payments', len(payments))
+
+    def create_expenses(self, day, n, safe_rows):
+        rng = self.rng
+        expenses = [{
+            'market_id': self.market_id,
+            'date': day,
+            'description': f'{category} {day:%B}',
+            'category': category,
+            'amount': money(rng.uniform(5000, 250000)),
+            'currency': BASE_CURRENCY,
+            'exchange_rate': Decimal('1'),
+        } for category in (rng.choice(EXPENSE_CATEGORIES) for _ in range(n))]
+        if not expenses:
+            return
+        for expense, expense_id in zip(expenses, insert_returning_ids(GeneralExpense, expenses)):
+            safe_rows.append(self.safe_row(
+                'Outflow', expense['amount'], day,
+                f"General Expense - {expense['category']}: {expense['description']}",
+                general_expense_id=expense_id
+            ))
+        self.count('general_expenses', len(expenses))
+
+    def safe_row(self, transaction_type, base_amount, day, description, amount=None,
+                 currency=BASE_CURRENCY, exchange_rate=Decimal('1'), **links):
+        """Safe ledger row; rows are inserted in the order they are created, so the running
+        balance here matches the (date, id) order used by recalc_safe_balances."""
+        if transaction_type == 'Outflow':
+            self.safe_balance -= base_amount
+        else:
+            self.safe_balance += base_amount
+        return {
+            'market_id': self.market_id,
+            'transaction_type': transaction_type,
+            'amount': base_amount if amount is None else amount,
+            'currency': currency,
+            'exchange_rate': exchange_rate,
+            'amount_base_currency_stored': base_amount,
+            'date': day,
+            'description': description,
+            'payment_id': links.get('payment_id'),
+            'sale_id': links.get('sale_id'),
+            'general_expense_id': links.get('general_expense_id'),
+            'balance_after': self.safe_balance,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate seeded synthetic markets')
+    parser.add_argument('--database-url', help='Default: DATABASE_URL or sqlite:///accounting.db')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--end-date', help='Last day of generated data, YYYY-MM-DD (default: today)')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--markets', type=int, default=1)
+    parser.add_argument('--calculation-method', choices=['FIFO', 'Average'], default='FIFO')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier for every count below')
+    parser.add_argument('--suppliers', type=int, default=12)
+    parser.add_argument('--service-companies', type=int, default=4)
+    parser.add_argument('--customers', type=int, default=300)
+    parser.add_argument('--items', type=int, default=3000)
+    parser.add_argument('--containers', type=int, default=600)
+    parser.add_argument('--sales', type=int, default=200000)
+    parser.add_argument('--payments', type=int, default=100000, help='Payments besides those made at sale time')
+    parser.add_argument('--expenses', type=int, default=5000)
+    args = parser.parse_args()
+
+    end_date = datetime.strptime(args.end_date, '%Y-%m-%d').date() if args.end_date else date.today()
+    config = {'SQLALCHEMY_DATABASE_URI': args.database_url} if args.database_url else None
+    app = create_app(config)
+
+    with app.app_context():
+        from migrations import upgrade
+        upgrade(db.engine, log=lambda message: print(message, file=sys.stderr))
+
+        rng = random.Random(args.seed)
+        for number in range(1, args.markets + 1):
+            started = time.perf_counter()
+            counts = MarketGenerator(rng, args, number, end_date).run()
+            summary = ', '.join(f'{n} {name}' for name, n in counts.items())
+            print(f'Test Market {number}: {summary} in {time.perf_counter() - started:.1f}s')
+
+if __name__ == '__main__':
+    main()
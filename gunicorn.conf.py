@@ -0,0 +1,47 @@
+"""
+Gunicorn configuration, loaded automatically from the working directory (or with -c gunicorn.conf.py).
+
+Every setting can be overridden through the environment:
+  WEB_CONCURRENCY            worker processes (default: 2 x CPU cores + 1)
+  GUNICORN_THREADS           threads per worker; more than 1 uses the gthread worker (default: 4)
+  GUNICORN_WORKER_CLASS      explicit worker class (default: gthread when threaded, else sync)
+  GUNICORN_TIMEOUT           seconds before a silent worker is restarted (default: 120, for Excel imports)
+  GUNICORN_GRACEFUL_TIMEOUT  seconds to finish requests on restart (default: 30)
+  GUNICORN_KEEPALIVE         keep-alive seconds (default: 5)
+  GUNICORN_MAX_REQUESTS      recycle a worker after this many requests, 0 = never (default: 1000)
+  GUNICORN_PRELOAD           load the app once in the master and fork it (default: true)
+  PORT                       bind port (default: 5000)
+"""
+import multiprocessing
+import os
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+workers = _env_int('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)
+threads = _env_int('GUNICORN_THREADS', 4)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread' if threads > 1 else 'sync')
+
+timeout = _env_int('GUNICORN_TIMEOUT', 120)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = max_requests // 10
+
+# Importing the app has no database side effects, so it can be loaded once and shared by the forks
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+accesslog = '-'
+errorlog = '-'
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master: each worker opens its own."""
+    from app import app
+    from models import db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
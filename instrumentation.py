@@ -0,0 +1,125 @@
+"""
+Per-request SQL instrumentation on SQLAlchemy engine events.
+
+For every request it records the query count, total DB time and how often each statement
+fingerprint (the SQL with literals and IN-lists collapsed) ran. The totals are sent in a
+Server-Timing header and kept for the last requests of this worker (see /api/debug/sql,
+administrators only). A warning is logged when one fingerprint repeats more than
+SQL_REPEAT_WARNING_THRESHOLD times, which is the signature of an N+1 lazy load inside a loop.
+
+Settings (app config or environment):
+  SQL_INSTRUMENTATION            default true
+  SQL_REPEAT_WARNING_THRESHOLD   default 10
+  SQL_RECENT_REQUESTS            requests kept for the debug endpoint, default 100
+"""
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+_recent = deque(maxlen=100)
+_recent_lock = threading.Lock()
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*[?%\w():$]+\s*,)*\s*[?%\w():$]+\s*\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+def fingerprint(statement):
+    """Normalize a SQL statement so repeated executions with different values compare equal."""
+    text = _WHITESPACE.sub(' ', statement).strip()
+    text = _STRING.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    return _IN_LIST.sub('IN (...)', text)
+
+def _request_stats():
+    if not has_request_context():
+        return None
+    return g.get('sql_stats')
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _request_stats() is not None:
+        conn.info.setdefault('sql_query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats()
+    if stats is None or not conn.info.get('sql_query_start'):
+        return
+    elapsed = time.perf_counter() - conn.info['sql_query_start'].pop()
+    stats['count'] += 1
+    stats['seconds'] += elapsed
+    stats['fingerprints'][fingerprint(statement)] += 1
+
+def _start_request():
+    g.sql_stats = {'count': 0, 'seconds': 0.0, 'fingerprints': Counter()}
+    g.request_started = time.perf_counter()
+
+def init_app(app, db):
+    """Install the engine listeners and the request hooks (after db.init_app)."""
+    app.config.setdefault('SQL_INSTRUMENTATION',
+                          os.environ.get('SQL_INSTRUMENTATION', 'true').lower() in ('1', 'true', 'yes'))
+    app.config.setdefault('SQL_REPEAT_WARNING_THRESHOLD',
+                          int(os.environ.get('SQL_REPEAT_WARNING_THRESHOLD', 10)))
+    app.config.setdefault('SQL_RECENT_REQUESTS', int(os.environ.get('SQL_RECENT_REQUESTS', 100)))
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+
+    global _recent
+    if _recent.maxlen != app.config['SQL_RECENT_REQUESTS']:
+        _recent = deque(_recent, maxlen=app.config['SQL_RECENT_REQUESTS'])
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+                event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def _instrument_request():
+        if request.endpoint != 'static':
+            _start_request()
+
+    @app.after_request
+    def _report_request(response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+        total_ms = (time.perf_counter() - g.pop('request_started')) * 1000
+        db_ms = stats['seconds'] * 1000
+
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={db_ms:.1f};desc="{stats["count"]} queries", app;dur={total_ms - db_ms:.1f}, total;dur={total_ms:.1f}'
+        )
+
+        threshold = app.config['SQL_REPEAT_WARNING_THRESHOLD']
+        repeated = [(sql, n) for sql, n in stats['fingerprints'].most_common() if n > threshold]
+        for sql, n in repeated:
+            app.logger.warning('Possible N+1: %s %s ran the same statement %d times: %s',
+                               request.method, request.path, n, sql[:300])
+
+        with _recent_lock:
+            _recent.append({
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 1),
+                'db_ms': round(db_ms, 1),
+                'queries': stats['count'],
+                'distinct_statements': len(stats['fingerprints']),
+                'repeated': [{'count': n, 'statement': sql} for sql, n in repeated],
+                'top_statements': [{'count': n, 'statement': sql}
+                                   for sql, n in stats['fingerprints'].most_common(5)],
+                'at': time.time(),
+            })
+        return response
+
+def recent_requests():
+    """Instrumented requests of this worker process, newest first."""
+    with _recent_lock:
+        return list(reversed(_recent))
@@ -0,0 +1,294 @@
+"""
+Prometheus metrics, shared across gunicorn workers, exposed at /metrics.
+
+Each worker process keeps its counters and histograms in memory and writes them to its own file
+in METRICS_DIR (atomically, at most every METRICS_FLUSH_SECONDS); /metrics adds up the files of
+all workers. Files of workers that have exited are folded into an archive file so totals survive
+worker recycling (max_requests).
+
+Recorded:
+  http_requests_total                 per blueprint, route, method and status
+  http_request_duration_seconds       latency histogram per blueprint, route and method
+  http_request_db_seconds             DB time per request (needs SQL_INSTRUMENTATION)
+  http_request_db_queries_total       queries issued
+  http_response_rows                  records in JSON list responses
+  export_file_bytes                   size of downloaded files (Excel exports)
+  fifo_allocation_duration_seconds    FIFO batch creation and allocation, per operation
+  safe_recalc_duration_seconds        safe balance recalculations, per operation
+
+Settings (app config or environment):
+  METRICS_ENABLED         default true
+  METRICS_DIR             default <instance folder>/metrics
+  METRICS_FLUSH_SECONDS   default 5
+  METRICS_TOKEN           when set, /metrics requires "Authorization: Bearer <token>"
+"""
+import atexit
+import functools
+import glob
+import json
+import os
+import threading
+import time
+
+from flask import Response, current_app, g, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, archiving is best effort
+    fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+BYTE_BUCKETS = (10 * 1024, 100 * 1024, 512 * 1024, 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2, 50 * 1024 ** 2)
+JOB_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests served', None),
+    'http_request_duration_seconds': ('histogram', 'Request latency', LATENCY_BUCKETS),
+    'http_request_db_seconds': ('histogram', 'Database time per request', LATENCY_BUCKETS),
+    'http_request_db_queries_total': ('counter', 'SQL statements issued by requests', None),
+    'http_response_rows': ('histogram', 'Records returned in JSON list responses', ROW_BUCKETS),
+    'export_file_bytes': ('histogram', 'Size of downloaded export files', BYTE_BUCKETS),
+    'fifo_allocation_duration_seconds': ('histogram', 'FIFO batch creation and allocation time', JOB_BUCKETS),
+    'safe_recalc_duration_seconds': ('histogram', 'Safe balance recalculation time', JOB_BUCKETS),
+}
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_values = {}  # (name, sorted label items) -> float, or [bucket counts..., sum, count] for histograms
+_store_dir = None
+_flush_seconds = 5
+_process = (None, None)  # (pid, file) of this process
+_last_flush = 0.0
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0) + amount
+
+def observe(name, value, **labels):
+    buckets = METRICS[name][2]
+    key = _key(name, labels)
+    with _lock:
+        entry = _values.get(key)
+        if entry is None:
+            entry = _values[key] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                entry[i] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+def timed(name, **labels):
+    """Decorator recording the call duration in the histogram name."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+def _count_rows(obj):
+    """Records in a JSON payload: a top-level list, or the largest list in a top-level dict."""
+    if isinstance(obj, list):
+        return len(obj)
+    if isinstance(obj, dict):
+        sizes = [len(v) for v in obj.values() if isinstance(v, list)]
+        if sizes:
+            return max(sizes)
+    return None
+
+class RowCountingJSONProvider(DefaultJSONProvider):
+    """Counts the records of each JSON response before it is serialized (no re-parsing)."""
+    def response(self, *args, **kwargs):
+        obj = args[0] if len(args) == 1 else (args or kwargs)
+        g.response_rows = _count_rows(obj)
+        return super().response(*args, **kwargs)
+
+def _process_file():
+    """This process's file. Resolved lazily: with preload_app the workers are forks of the master."""
+    global _process
+    pid = os.getpid()
+    if _process[0] != pid:
+        _process = (pid, os.path.join(_store_dir, f'process_{pid}_{int(time.time())}.json'))
+    return _process[1]
+
+def flush(force=False):
+    """Write this process's metrics to its file in the store directory."""
+    global _last_flush
+    if _store_dir is None or not _values:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < _flush_seconds:
+        return
+    _last_flush = now
+    with _lock:
+        data = [[name, dict(labels), value] for (name, labels), value in _values.items()]
+    path = _process_file()
+    os.makedirs(_store_dir, exist_ok=True)
+    with _flush_lock:
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+def _merge(totals, data):
+    for name, labels, value in data:
+        if name not in METRICS:
+            continue
+        key = _key(name, labels)
+        if isinstance(value, list):
+            current = totals.get(key)
+            totals[key] = value[:] if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists but belongs to someone else
+    return True
+
+def _archive_dead_workers():
+    """Fold the files of exited worker processes into the archive file."""
+    os.makedirs(_store_dir, exist_ok=True)
+    archive = os.path.join(_store_dir, 'archive.json')
+    lock_path = os.path.join(_store_dir, 'archive.lock')
+    with open(lock_path, 'a') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            dead = [path for path in glob.glob(os.path.join(_store_dir, 'process_*.json'))
+                    if not _pid_alive(int(os.path.basename(path).split('_')[1]))]
+            if not dead:
+                return
+            totals = {}
+            _merge(totals, _read(archive))
+            for path in dead:
+                _merge(totals, _read(path))
+            tmp = f'{archive}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump([[name, dict(labels), value] for (name, labels), value in totals.items()], f)
+            os.replace(tmp, archive)
+            for path in dead:
+                os.remove(path)
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+def collect():
+    """Totals of every worker process (live files plus the archive)."""
+    flush(force=True)
+    _archive_dead_workers()
+    totals = {}
+    for path in glob.glob(os.path.join(_store_dir, '*.json')):
+        _merge(totals, _read(path))
+    return totals
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels_text(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+def render(totals):
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = sorted((labels, value) for (metric, labels), value in totals.items() if metric == name)
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind == 'counter':
+                lines.append(f'{name}{_labels_text(labels)} {_number(value)}')
+                continue
+            for bound, count in zip(buckets, value):
+                lines.append(f'{name}_bucket{_labels_text(labels, [("le", _number(bound))])} {count}')
+            lines.append(f'{name}_bucket{_labels_text(labels, [("le", "+Inf")])} {value[-1]}')
+            lines.append(f'{name}_sum{_labels_text(labels)} {_number(value[-2])}')
+            lines.append(f'{name}_count{_labels_text(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(render(collect()), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+def init_app(app):
+    """Install the request hooks and the /metrics endpoint (after instrumentation.init_app)."""
+    global _store_dir, _flush_seconds
+    app.config.setdefault('METRICS_ENABLED',
+                          os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes'))
+    app.config.setdefault('METRICS_DIR', os.environ.get('METRICS_DIR') or os.path.join(app.instance_path, 'metrics'))
+    app.config.setdefault('METRICS_FLUSH_SECONDS', float(os.environ.get('METRICS_FLUSH_SECONDS', 5)))
+    app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    _store_dir = app.config['METRICS_DIR']
+    _flush_seconds = app.config['METRICS_FLUSH_SECONDS']
+    app.json = RowCountingJSONProvider(app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        # Runs before instrumentation's after_request (registered earlier), so g.sql_stats is still set
+        started = g.pop('metrics_started', None)
+        if started is None or request.endpoint in ('static', 'metrics'):
+            return response
+        labels = {
+            'blueprint': request.blueprint or 'app',
+            'route': request.url_rule.rule if request.url_rule else 'unmatched',
+            'method': request.method,
+        }
+        inc('http_requests_total', status=response.status_code, **labels)
+        observe('http_request_duration_seconds', time.perf_counter() - started, **labels)
+
+        stats = g.get('sql_stats')
+        if stats is not None:
+            observe('http_request_db_seconds', stats['seconds'], **labels)
+            inc('http_request_db_queries_total', stats['count'], **labels)
+        rows = g.pop('response_rows', None)
+        if rows is not None:
+            observe('http_response_rows', rows, **labels)
+        if response.headers.get('Content-Disposition', '').startswith('attachment') and response.content_length:
+            observe('export_file_bytes', response.content_length,
+                    blueprint=labels['blueprint'], route=labels['route'])
+
+        flush()
+        return response
+
+    # CLI commands (e.g. flask rebuild-safe-balances) record their durations too
+    atexit.register(flush, force=True)
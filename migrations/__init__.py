@@ -0,0 +1,79 @@
+"""
+Versioned schema migrations.
+
+Each module in migrations/versions is named <version>_<name>.py and defines
+upgrade(connection). Applied versions are recorded in schema_migrations.
+Migrations run once per deploy (flask --app app migrate), not on worker startup.
+
+Version 0001 is a frozen snapshot of the baseline schema; every later change
+to the models gets its own version. Versions still check before altering, so
+databases created by the earlier create_all baseline upgrade cleanly.
+"""
+import importlib
+import pkgutil
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select, text
+
+from migrations import versions
+
+# Arbitrary key for pg_advisory_lock so concurrent deploys migrate one at a time
+MIGRATION_LOCK_KEY = 7245001
+
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', String(20), primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+def available_migrations():
+    """All migration modules as (version, name, module), oldest first."""
+    found = []
+    for info in pkgutil.iter_modules(versions.__path__):
+        version, _, name = info.name.partition('_')
+        if not version.isdigit():
+            continue
+        module = importlib.import_module(f'{versions.__name__}.{info.name}')
+        found.append((version, name, module))
+    return sorted(found, key=lambda migration: migration[0])
+
+def applied_versions(connection):
+    if not inspect(connection).has_table('schema_migrations'):
+        return set()
+    return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+def upgrade(engine, log=print):
+    """Apply pending migrations in order, each in its own transaction.
+    Returns the versions applied by this call."""
+    applied = []
+    is_postgresql = engine.dialect.name == 'postgresql'
+    with engine.connect() as lock_connection:
+        if is_postgresql:
+            lock_connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+            lock_connection.commit()
+        try:
+            with engine.begin() as connection:
+                _metadata.create_all(connection)
+            for version, name, module in available_migrations():
+                with engine.begin() as connection:
+                    if version in applied_versions(connection):
+                        continue
+                    log(f'Applying migration {version} {name}')
+                    module.upgrade(connection)
+                    connection.execute(schema_migrations.insert().values(
+                        version=version, name=name, applied_at=datetime.utcnow()
+                    ))
+                applied.append(version)
+        finally:
+            if is_postgresql:
+                lock_connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+                lock_connection.commit()
+    return applied
+
+def status(engine):
+    """[(version, name, applied)] for every known migration."""
+    with engine.connect() as connection:
+        done = applied_versions(connection)
+    return [(version, name, version in done) for version, name, _ in available_migrations()]
@@ -0,0 +1,222 @@
+"""
+Baseline schema: the tables as they were before versioned migrations, frozen here so later
+model changes are only ever applied by their own migration. Tables that already exist are
+left alone.
+"""
+from sqlalchemy import (Boolean, Column, Date, DateTime, ForeignKey, Index, Integer, MetaData,
+                        Numeric, String, Table, Text, UniqueConstraint)
+
+metadata = MetaData()
+
+Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(80), unique=True, nullable=False),
+    Column('password_hash', String(255), nullable=False),
+    Column('full_name', String(200)),
+    Column('created_at', DateTime),
+)
+
+Table(
+    'markets', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('address', Text),
+    Column('base_currency', String(10), nullable=False),
+    Column('calculation_method', String(20), nullable=False),
+    Column('created_at', DateTime),
+)
+
+Table(
+    'companies', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('market_id', Integer, ForeignKey('markets.id'), nullable=False),
+    Column('name', String(200), nullable=False),
+    Column('address', Text),
+    Column('category', String(50), nullable=False),
+    Column('payment_type', String(20)),
+    Column('currency', String(10), nullable=False),
+    Column('created_at', DateTime),
+)
+
+Table(
+    'items', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('market_id', Integer, ForeignKey('markets.id'), nullable=False),
+    Column('supplier_id', Integer, ForeignKey('companies.id'), nullable=True),
+    Column('code', String(100), nullable=False),
+    Column('name', String(200), nullable=False),
+    Column('weight', Numeric(10, 2), nullable=False),
+    Column('grade', String(50)),
+    Column('category1', String(100)),
+    Column('category2', String(100)),
+    Column('created_at', DateTime),
+    UniqueConstraint('market_id', 'supplier_id', 'code', name='unique_item_code_per_supplier'),
+)
+
+Table(
+    'purchase_containers', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('market_id', Integer, ForeignKey('markets.id'), nullable=False),
+    Column('container_number', String(100), nullable=False),
+    Column('supplier_id', Integer, ForeignKey('companies.id'), nullable=False),
+    Column('currency', String(10), nullable=False),
+    Column('exchange_rate', Numeric(10, 4), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('notes', Text),
+    Column('expense1_amount', Numeric(10, 2)),
+    Column('expense1_currency', String(10)),
+    Column('expense1_exchange_rate', Numeric(10, 4)),
+    Column('expense2_amount', Numeric(10, 2)),
+    Column('expense2_service_company_id', Integer, ForeignKey('companies.id'), nullable=True),
+    Column('expense2_currency', String(10)),
+    Column('expense2_exchange_rate', Numeric(10, 4)),
+    Column('expense3_amount', Numeric(10, 2)),
+    Column('expense3_currency', String(10)),
+    Column('expense3_exchange_rate', Numeric(10, 4)),
+    Column('created_at', DateTime),
+)
+
+Table(
+    'purchase_items', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('container_id', Integer, ForeignKey('purchase_containers.id'), nullable=False),
+    Column('item_id', Integer, ForeignKey('items.id'), nullable=False),
+    Column('quantity', Numeric(10, 2), nullable=False),
+    Column('unit_price', Numeric(10, 2), nullable=False),
+    Column('total_price', Numeric(10, 2), nullable=False),
+)
+
+Table(
+    'sales', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('market_id', Integer, ForeignKey('markets.id'), nullable=False),
+    Column('invoice_number', String(100), unique=True, nullable=False),
+    Column('customer_id', Integer, ForeignKey('companies.id'), nullable=False),
+    Column('supplier_id', Integer, ForeignKey('companies.id'), nullable=True),
+    Column('date', Date, nullable=False),
+    Column('total_amount', Numeric(10, 2), nullable=False),
+    Column('paid_amount', Numeric(10, 2)),
+    Column('balance', Numeric(10, 2), nullable=False),
+    Column('payment_type', String(20), nullable=False),
+    Column('status', String(20)),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+)
+
+Table(
+    'sale_items', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('sale_id', Integer, ForeignKey('sales.id'), nullable=False),
+    Column('item_id', Integer, ForeignKey('items.id'), nullable=False),
+    Column('quantity', Numeric(10, 2), nullable=False),
+    Column('unit_price', Numeric(10, 2), nullable=False),
+    Column('total_price', Numeric(10, 2), nullable=False),
+)
+
+Table(
+    'payments', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('market_id', Integer, ForeignKey('markets.id'), nullable=False),
+    Column('company_id', Integer, ForeignKey('companies.id'), nullable=False),
+    Column('sale_id', Integer, ForeignKey('sales.id'), nullable=True),
+    Column('payment_type', String(20), nullable=False),
+    Column('amount', Numeric(10, 2), nullable=False),
+    Column('currency', String(10), nullable=False),
+    Column('exchange_rate', Numeric(10, 4), nullable=False),
+    Column('amount_base_currency_stored', Numeric(10, 2), nullable=True),
+    Column('date', Date, nullable=False),
+    Column('notes', Text),
+    Column('loan', Boolean),
+    Column('created_at', DateTime),
+)
+
+Table(
+    'general_expenses', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('market_id', Integer, ForeignKey('markets.id'), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('description', Text, nullable=False),
+    Column('category', String(100), nullable=False),
+    Column('amount', Numeric(10, 2), nullable=False),
+    Column('currency', String(10), nullable=False),
+    Column('exchange_rate', Numeric(10, 4), nullable=False),
+    Column('created_at', DateTime),
+)
+
+Table(
+    'safe_transactions', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('market_id', Integer, ForeignKey('markets.id'), nullable=False),
+    Column('transaction_type', String(20), nullable=False),
+    Column('amount', Numeric(10, 2), nullable=False),
+    Column('currency', String(10), nullable=False),
+    Column('exchange_rate', Numeric(10, 4), nullable=False),
+    Column('amount_base_currency_stored', Numeric(10, 2), nullable=True),
+    Column('date', Date, nullable=False),
+    Column('description', Text),
+    Column('payment_id', Integer, ForeignKey('payments.id'), nullable=True),
+    Column('sale_id', Integer, ForeignKey('sales.id'), nullable=True),
+    Column('general_expense_id', Integer, ForeignKey('general_expenses.id'), nullable=True),
+    Column('created_at', DateTime),
+    Column('balance_after', Numeric(10, 2), nullable=False),
+)
+
+Table(
+    'safe_statement_real_balances', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('market_id', Integer, ForeignKey('markets.id'), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('real_balance', Numeric(10, 2), nullable=True),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    UniqueConstraint('market_id', 'date', name='unique_market_date'),
+)
+
+Table(
+    'inventory_adjustments', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('market_id', Integer, ForeignKey('markets.id'), nullable=False),
+    Column('item_id', Integer, ForeignKey('items.id'), nullable=False),
+    Column('adjustment_type', String(20), nullable=False),
+    Column('quantity', Numeric(10, 2), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('reason', String(500)),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+Table(
+    'inventory_batches', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('market_id', Integer, ForeignKey('markets.id'), nullable=False),
+    Column('item_id', Integer, ForeignKey('items.id'), nullable=False),
+    Column('purchase_item_id', Integer, ForeignKey('purchase_items.id'), nullable=False),
+    Column('container_id', Integer, ForeignKey('purchase_containers.id'), nullable=False),
+    Column('purchase_date', Date, nullable=False),
+    Column('original_quantity', Numeric(10, 2), nullable=False),
+    Column('available_quantity', Numeric(10, 2), nullable=False),
+    Column('unit_price', Numeric(10, 2), nullable=False),
+    Column('cog_per_unit', Numeric(10, 2), nullable=False),
+    Column('cost_per_unit', Numeric(10, 2), nullable=False),
+    Column('currency', String(10), nullable=False),
+    Column('exchange_rate', Numeric(10, 4), nullable=False),
+    Column('created_at', DateTime),
+    Index('idx_batch_item_date', 'item_id', 'purchase_date'),
+    Index('idx_batch_available', 'item_id', 'available_quantity'),
+)
+
+Table(
+    'sale_item_allocations', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('sale_item_id', Integer, ForeignKey('sale_items.id'), nullable=False),
+    Column('batch_id', Integer, ForeignKey('inventory_batches.id'), nullable=False),
+    Column('quantity', Numeric(10, 2), nullable=False),
+    Column('cost_per_unit', Numeric(10, 2), nullable=False),
+    Column('total_cost', Numeric(10, 2), nullable=False),
+    Column('created_at', DateTime),
+)
+
+def upgrade(connection):
+    metadata.create_all(connection)
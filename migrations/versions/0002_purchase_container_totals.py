@@ -0,0 +1,16 @@
+"""
+Stored purchase container totals (items_total, items_total_base_currency), backfilled from purchase_items.
+"""
+from sqlalchemy import inspect, text
+
+def upgrade(connection):
+    columns = {c['name'] for c in inspect(connection).get_columns('purchase_containers')}
+    if 'items_total' in columns and 'items_total_base_currency' in columns:
+        return
+    if 'items_total' not in columns:
+        connection.execute(text('ALTER TABLE purchase_containers ADD COLUMN items_total NUMERIC(14, 2) NOT NULL DEFAULT 0'))
+    if 'items_total_base_currency' not in columns:
+        connection.execute(text('ALTER TABLE purchase_containers ADD COLUMN items_total_base_currency NUMERIC(18, 2) NOT NULL DEFAULT 0'))
+    
+    from api.purchases import refresh_container_totals
+    refresh_container_totals(connection)
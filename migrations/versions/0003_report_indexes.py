@@ -0,0 +1,26 @@
+"""
+Composite indexes for the hot report filters on databases created before they were declared.
+"""
+from sqlalchemy import inspect
+from models import db
+
+INDEXES = {
+    'sales': ['idx_sale_market_date', 'idx_sale_customer_date'],
+    'sale_items': ['idx_sale_item_sale', 'idx_sale_item_item'],
+    'payments': ['idx_payment_market_company_date', 'idx_payment_market_date', 'idx_payment_sale'],
+    'safe_transactions': ['idx_safe_txn_market_date', 'idx_safe_txn_payment', 'idx_safe_txn_sale', 'idx_safe_txn_expense'],
+    'purchase_items': ['idx_purchase_item_container', 'idx_purchase_item_item'],
+    'purchase_containers': ['idx_container_market_supplier_date', 'idx_container_market_date', 'idx_container_service_company'],
+    'general_expenses': ['idx_expense_market_date'],
+    'inventory_adjustments': ['idx_adjustment_market_item_date'],
+    'sale_item_allocations': ['idx_allocation_sale_item', 'idx_allocation_batch'],
+}
+
+def upgrade(connection):
+    inspector = inspect(connection)
+    for table_name, index_names in INDEXES.items():
+        existing = {ix['name'] for ix in inspector.get_indexes(table_name)}
+        declared = {ix.name: ix for ix in db.metadata.tables[table_name].indexes}
+        for name in index_names:
+            if name not in existing:
+                declared[name].create(connection)
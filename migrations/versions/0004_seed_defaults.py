@@ -0,0 +1,24 @@
+"""
+Default admin user and, on a fresh deploy, a default market.
+"""
+from sqlalchemy import select
+from werkzeug.security import generate_password_hash
+from models import db
+
+def upgrade(connection):
+    users = db.metadata.tables['users']
+    markets = db.metadata.tables['markets']
+    
+    if connection.execute(select(users.c.id).where(users.c.username == 'admin')).first() is None:
+        connection.execute(users.insert().values(
+            username='admin',
+            password_hash=generate_password_hash('admin123'),
+            full_name='Administrator'
+        ))
+    
+    if connection.execute(select(markets.c.id).limit(1)).first() is None:
+        connection.execute(markets.insert().values(
+            name='Default Market',
+            address='',
+            base_currency='FCFA'
+        ))
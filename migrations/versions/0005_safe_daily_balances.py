@@ -0,0 +1,31 @@
+"""
+Per-day safe totals and closing balance (safe_daily_balances), backfilled from safe_transactions.
+"""
+from sqlalchemy import (Column, Date, ForeignKey, Integer, MetaData, Numeric, Table,
+                        UniqueConstraint, select)
+
+metadata = MetaData()
+
+safe_daily_balances = Table(
+    'safe_daily_balances', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('market_id', Integer, ForeignKey('markets.id'), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('total_in', Numeric(10, 2), nullable=False),
+    Column('total_out', Numeric(10, 2), nullable=False),
+    Column('closing_balance', Numeric(10, 2), nullable=False),
+    UniqueConstraint('market_id', 'date', name='unique_safe_daily_balance'),
+)
+
+def upgrade(connection):
+    # Databases built by the old create_all baseline already have the (possibly empty) table
+    safe_daily_balances.create(connection, checkfirst=True)
+    if connection.execute(select(safe_daily_balances.c.id).limit(1)).first() is not None:
+        return
+
+    from models import db
+    from api.safe import refresh_safe_daily_balances
+    safe_transactions = db.metadata.tables['safe_transactions']
+    market_ids = connection.execute(select(safe_transactions.c.market_id).distinct()).scalars().all()
+    for market_id in market_ids:
+        refresh_safe_daily_balances(connection, market_id)
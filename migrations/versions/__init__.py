@@ -0,0 +1,3 @@
+"""
+Migration scripts, applied in version order by migrations.upgrade()
+"""
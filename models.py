@@ -4,7 +4,7 @@ Database models for the accounting system
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from decimal import Decimal
-from sqlalchemy import or_
+from sqlalchemy import or_, func, case
 
 db = SQLAlchemy()
 
@@ -72,12 +72,17 @@ class Company(db.Model):
         # Base currency is only used for safe movements, not for company statement balance
         if self.category == 'Supplier':
             # Total amount (items only) + expense1 separately
-            purchases = PurchaseContainer.query.filter_by(
-                market_id=market_id, supplier_id=self.id
-            ).all()
-            total_debit = sum(p.total_amount for p in purchases)  # Items only (excludes expense1)
-            # Expense1 is always in container currency (same as supplier currency), use amount directly
-            total_debit += sum(p.expense1_amount for p in purchases if p.expense1_amount and p.expense1_amount > 0)
+            items_total, expense1_total = db.session.query(
+                func.coalesce(func.sum(PurchaseContainer.items_total), 0),  # Items only (excludes expense1)
+                # Expense1 is always in container currency (same as supplier currency), use amount directly
+                func.coalesce(func.sum(case(
+                    (PurchaseContainer.expense1_amount > 0, PurchaseContainer.expense1_amount), else_=0
+                )), 0)
+            ).filter(
+                PurchaseContainer.market_id == market_id,
+                PurchaseContainer.supplier_id == self.id
+            ).one()
+            total_debit = Decimal(str(items_total)) + Decimal(str(expense1_total))
             # Add loans as debit (money borrowed from supplier) - use original currency amount
             # IMPORTANT: Loan payments have payment_type='In' but should be included as debit
             all_payments = Payment.query.filter_by(
@@ -169,16 +174,29 @@ class PurchaseContainer(db.Model):
     expense3_amount = db.Column(db.Numeric(10, 2), default=0)  # Cash expense (shown in safe)
     expense3_currency = db.Column(db.String(10))
     expense3_exchange_rate = db.Column(db.Numeric(10, 4))
+    # Sum of purchase_items.total_price, kept up to date on flush (see api/purchases.py).
+    # Wider than the line amounts since they add up per container.
+    items_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    items_total_base_currency = db.Column(db.Numeric(18, 2), nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     items = db.relationship('PurchaseItem', backref='container', lazy=True, cascade='all, delete-orphan')
     
+    # Indexes for performance
+    __table_args__ = (
+        db.Index('idx_container_market_supplier_date', 'market_id', 'supplier_id', 'date'),
+        db.Index('idx_container_market_date', 'market_id', 'date'),
+        db.Index('idx_container_service_company', 'expense2_service_company_id', 'date'),
+    )
+    
     @property
     def total_amount(self):
         """Total amount of items only (excludes expense1, which is shown separately)"""
-        items_total = sum(item.total_price for item in self.items)
-        return items_total
+        if self.items_total is None:
+            # Not flushed yet
+            return sum(item.total_price for item in self.items)
+        return self.items_total
     
     @property
     def expense1_base_currency(self):
@@ -210,6 +228,12 @@ class PurchaseItem(db.Model):
     unit_price = db.Column(db.Numeric(10, 2), nullable=False)
     total_price = db.Column(db.Numeric(10, 2), nullable=False)
     
+    # Indexes for performance
+    __table_args__ = (
+        db.Index('idx_purchase_item_container', 'container_id'),
+        db.Index('idx_purchase_item_item', 'item_id'),
+    )
+    
     @property
     def total_price_base_currency(self):
         """Convert to market base currency"""
@@ -235,6 +259,12 @@ class Sale(db.Model):
     items = db.relationship('SaleItem', backref='sale', lazy=True, cascade='all, delete-orphan')
     payments = db.relationship('Payment', backref='sale', lazy=True)
     
+    # Indexes for performance
+    __table_args__ = (
+        db.Index('idx_sale_market_date', 'market_id', 'date'),
+        db.Index('idx_sale_customer_date', 'customer_id', 'date'),
+    )
+    
     def update_status(self):
         """Update payment status based on paid_amount"""
         if self.paid_amount >= self.total_amount:
@@ -253,6 +283,12 @@ class SaleItem(db.Model):
     quantity = db.Column(db.Numeric(10, 2), nullable=False)
     unit_price = db.Column(db.Numeric(10, 2), nullable=False)
     total_price = db.Column(db.Numeric(10, 2), nullable=False)
+    
+    # Indexes for performance
+    __table_args__ = (
+        db.Index('idx_sale_item_sale', 'sale_id'),
+        db.Index('idx_sale_item_item', 'item_id'),
+    )
 
 class Payment(db.Model):
     __tablename__ = 'payments'
@@ -270,6 +306,13 @@ class Payment(db.Model):
     loan = db.Column(db.Boolean, default=False)  # True if this is a loan/borrowing transaction
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Indexes for performance
+    __table_args__ = (
+        db.Index('idx_payment_market_company_date', 'market_id', 'company_id', 'date'),
+        db.Index('idx_payment_market_date', 'market_id', 'date'),
+        db.Index('idx_payment_sale', 'sale_id'),
+    )
+    
     @property
     def amount_base_currency(self):
         """Get base currency amount - use stored value if available, otherwise calculate"""
@@ -301,6 +344,14 @@ class SafeTransaction(db.Model):
     # Calculated balance after this transaction
     balance_after = db.Column(db.Numeric(10, 2), nullable=False)
     
+    # Indexes for performance
+    __table_args__ = (
+        db.Index('idx_safe_txn_market_date', 'market_id', 'date', 'id'),
+        db.Index('idx_safe_txn_payment', 'payment_id'),
+        db.Index('idx_safe_txn_sale', 'sale_id'),
+        db.Index('idx_safe_txn_expense', 'general_expense_id'),
+    )
+    
     @property
     def amount_base_currency(self):
         """Convert to market base currency - use stored value if available, otherwise calculate"""
@@ -325,6 +376,11 @@ class GeneralExpense(db.Model):
     # Relationship
     safe_transaction = db.relationship('SafeTransaction', backref='general_expense', uselist=False)
     
+    # Indexes for performance
+    __table_args__ = (
+        db.Index('idx_expense_market_date', 'market_id', 'date'),
+    )
+    
     @property
     def amount_base_currency(self):
         """Convert to market base currency"""
@@ -342,6 +398,18 @@ class SafeStatementRealBalance(db.Model):
     
     __table_args__ = (db.UniqueConstraint('market_id', 'date', name='unique_market_date'),)
 
+class SafeDailyBalance(db.Model):
+    """Per-day safe totals and closing balance, maintained from safe_transactions on every write"""
+    __tablename__ = 'safe_daily_balances'
+    id = db.Column(db.Integer, primary_key=True)
+    market_id = db.Column(db.Integer, db.ForeignKey('markets.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    total_in = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    total_out = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    closing_balance = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    
+    __table_args__ = (db.UniqueConstraint('market_id', 'date', name='unique_safe_daily_balance'),)
+
 class InventoryAdjustment(db.Model):
     """Store inventory quantity adjustments that don't affect COG or financial calculations"""
     __tablename__ = 'inventory_adjustments'
@@ -359,6 +427,11 @@ class InventoryAdjustment(db.Model):
     # Relationships
     item = db.relationship('Item', backref='inventory_adjustments')
     market = db.relationship('Market', backref='inventory_adjustments')
+    
+    # Indexes for performance
+    __table_args__ = (
+        db.Index('idx_adjustment_market_item_date', 'market_id', 'item_id', 'date'),
+    )
 
 class InventoryBatch(db.Model):
     """Tracks available inventory from each purchase batch for FIFO calculation"""
@@ -408,4 +481,9 @@ class SaleItemAllocation(db.Model):
     # Relationships
     sale_item = db.relationship('SaleItem', backref='allocations')
     batch = db.relationship('InventoryBatch', backref='allocations')
-
+    
+    # Indexes for performance
+    __table_args__ = (
+        db.Index('idx_allocation_sale_item', 'sale_item_id'),
+        db.Index('idx_allocation_batch', 'batch_id'),
+    )
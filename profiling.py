@@ -0,0 +1,227 @@
+"""
+On-demand profiling of a single request, for administrators.
+
+Add ?_profile=1 (or the header X-Profile: 1) to any request made as an administrator and it runs
+under pyinstrument when that is installed (sampling, readable call tree) or cProfile otherwise.
+The call tree, the SQL timeline (offset, duration and statement of every query) and the raw
+profiler output are saved under an id returned in the X-Profile-Id header. Profiles are files,
+so every worker process sees them; list and download them on the Administration page
+(/api/debug/profiles).
+
+Settings (app config or environment):
+  PROFILING_ENABLED   default true
+  PROFILING_ADMINS    usernames allowed to profile and read /api/debug, comma separated, default admin
+  PROFILER            auto (default), pyinstrument or cprofile
+  PROFILE_DIR         default <instance folder>/profiles
+  PROFILE_KEEP        newest profiles kept, default 50
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+
+from flask import current_app, g, request
+from flask_login import current_user
+from sqlalchemy import event
+
+_PROFILE_ID = re.compile(r'^[0-9a-f]+-[0-9a-f]{12}$')
+_MAX_STATEMENT = 2000
+
+def is_profiling_admin(user=None):
+    user = user if user is not None else current_user
+    if not getattr(user, 'is_authenticated', False):
+        return False
+    return user.username in current_app.config['PROFILING_ADMINS']
+
+def _profile_requested():
+    flag = request.args.get('_profile') or request.headers.get('X-Profile')
+    return flag not in (None, '', '0', 'false')
+
+def _profile_dir():
+    return current_app.config['PROFILE_DIR']
+
+def _path(profile_id, extension):
+    return os.path.join(_profile_dir(), f'{profile_id}.{extension}')
+
+def _start_profiler(kind):
+    if kind in ('auto', 'pyinstrument'):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            if kind == 'pyinstrument':
+                current_app.logger.warning('PROFILER=pyinstrument but pyinstrument is not installed; using cProfile')
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return 'pyinstrument', profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return 'cprofile', profiler
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if g.get('profile') is not None:
+        conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = g.get('profile')
+    if profile is None or not conn.info.get('profile_query_start'):
+        return
+    started = conn.info['profile_query_start'].pop()
+    profile['sql'].append({
+        'start_ms': round((started - profile['started']) * 1000, 2),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+        'rows': cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None,
+        'statement': statement[:_MAX_STATEMENT],
+    })
+
+def _stop(profile):
+    """Stop the profiler and return its call tree as text."""
+    profiler = profile['profiler']
+    if profile['kind'] == 'pyinstrument':
+        profiler.stop()
+        return profiler.output_text(unicode=True, color=False)
+    profiler.disable()
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(80)
+    return stream.getvalue()
+
+def _save(profile, response):
+    call_tree = _stop(profile)
+    profile_id = f"{int(time.time()):x}-{uuid.uuid4().hex[:12]}"
+    os.makedirs(_profile_dir(), exist_ok=True)
+
+    # Raw output: pyinstrument's interactive HTML, or a pstats file for snakeviz/pstats
+    if profile['kind'] == 'pyinstrument':
+        download = f'{profile_id}.html'
+        with open(os.path.join(_profile_dir(), download), 'w', encoding='utf-8') as f:
+            f.write(profile['profiler'].output_html())
+    else:
+        download = f'{profile_id}.prof'
+        profile['profiler'].dump_stats(os.path.join(_profile_dir(), download))
+
+    sql = profile['sql']
+    record = {
+        'id': profile_id,
+        'at': time.time(),
+        'user': current_user.username,
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': round((time.perf_counter() - profile['started']) * 1000, 1),
+        'profiler': profile['kind'],
+        'sql_count': len(sql),
+        'sql_ms': round(sum(q['duration_ms'] for q in sql), 1),
+        'download': download,
+        'call_tree': call_tree,
+        'sql': sql,
+    }
+    # Written last: a profile is listed once its JSON exists
+    with open(_path(profile_id, 'json'), 'w') as f:
+        json.dump(record, f)
+    _prune()
+    return profile_id
+
+def _prune():
+    keep = current_app.config['PROFILE_KEEP']
+    ids = sorted(name[:-5] for name in os.listdir(_profile_dir()) if name.endswith('.json'))
+    for profile_id in ids[:-keep] if keep else ids:
+        delete_profile(profile_id)
+
+def list_profiles():
+    """Saved profiles, newest first, without the call tree and SQL timeline."""
+    directory = _profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue  # being written or pruned by another worker
+        record.pop('call_tree', None)
+        record.pop('sql', None)
+        profiles.append(record)
+    return profiles
+
+def load_profile(profile_id):
+    if not _PROFILE_ID.match(profile_id or ''):
+        return None
+    try:
+        with open(_path(profile_id, 'json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def profile_download_path(profile_id):
+    """Path of the raw pyinstrument HTML / cProfile pstats file of a profile, or None."""
+    record = load_profile(profile_id)
+    if record is None:
+        return None
+    path = os.path.join(_profile_dir(), record['download'])
+    return path if os.path.exists(path) else None
+
+def delete_profile(profile_id):
+    if not _PROFILE_ID.match(profile_id or ''):
+        return False
+    deleted = False
+    for extension in ('json', 'html', 'prof'):
+        try:
+            os.remove(_path(profile_id, extension))
+            deleted = True
+        except FileNotFoundError:
+            pass
+    return deleted
+
+def init_app(app, db):
+    """Install the request hooks and the SQL timeline listeners (after db.init_app)."""
+    app.config.setdefault('PROFILING_ENABLED',
+                          os.environ.get('PROFILING_ENABLED', 'true').lower() in ('1', 'true', 'yes'))
+    admins = app.config.get('PROFILING_ADMINS', os.environ.get('PROFILING_ADMINS', 'admin'))
+    if isinstance(admins, str):
+        admins = [name.strip() for name in admins.split(',') if name.strip()]
+    app.config['PROFILING_ADMINS'] = set(admins)
+    app.config.setdefault('PROFILER', os.environ.get('PROFILER', 'auto').lower())
+    app.config.setdefault('PROFILE_DIR', os.environ.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles'))
+    app.config.setdefault('PROFILE_KEEP', int(os.environ.get('PROFILE_KEEP', 50)))
+    if not app.config['PROFILING_ENABLED']:
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+                event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def _start_profile():
+        if request.endpoint == 'static' or not _profile_requested() or not is_profiling_admin():
+            return
+        try:
+            kind, profiler = _start_profiler(app.config['PROFILER'])
+        except ValueError as e:
+            # Another profiler is already active in this thread (e.g. a development tool)
+            app.logger.warning('Could not start profiler: %s', e)
+            return
+        g.profile = {'kind': kind, 'profiler': profiler, 'started': time.perf_counter(), 'sql': []}
+
+    @app.after_request
+    def _save_profile(response):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            response.headers['X-Profile-Id'] = _save(profile, response)
+        return response
+
+    @app.teardown_request
+    def _discard_profile(exc):
+        # after_request does not run for unhandled exceptions; never leave a profiler running
+        profile = g.pop('profile', None)
+        if profile is not None:
+            _stop(profile)
@@ -1,7 +1,8 @@
 """
 Simple script to run the application
 """
-from app import app
+from app import app, db
+from migrations import upgrade
 
 if __name__ == '__main__':
     print("=" * 60)
@@ -14,5 +15,9 @@ if __name__ == '__main__':
     print("=" * 60)
     print()
     
+    # Bring the database schema up to date before serving
+    with app.app_context():
+        upgrade(db.engine)
+    
     app.run(debug=True, host='0.0.0.0', port=5000)
 
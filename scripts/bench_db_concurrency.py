@@ -0,0 +1,176 @@
+"""
+Concurrent read/write benchmark for the database engine configuration (db_config.py).
+
+Readers run a report-style aggregate while writers insert rows in short transactions, the way
+report requests and data entry overlap in production. Uses its own bench_ledger table.
+Run:
+  python scripts/bench_db_concurrency.py                       # scratch SQLite file, tuned settings
+  python scripts/bench_db_concurrency.py --baseline            # same, default engine settings
+  python scripts/bench_db_concurrency.py --database-url postgresql://...  # drops bench_ledger afterwards
+
+Prints JSON: reads/s, writes/s, p50/p95 latency of each, and lock/timeout errors.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import (Column, Date, Integer, MetaData, Numeric, Table, create_engine, func,
+                        insert, select)
+from sqlalchemy.exc import OperationalError
+
+import db_config
+
+metadata = MetaData()
+bench_ledger = Table(
+    'bench_ledger', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('market_id', Integer, nullable=False, index=True),
+    Column('date', Date, nullable=False),
+    Column('amount', Numeric(10, 2), nullable=False),
+)
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def make_engine(url, baseline):
+    if baseline:
+        return create_engine(url)
+    engine = create_engine(url, **db_config.engine_options(url))
+    db_config.apply_sqlite_pragmas(engine, db_config.sqlite_pragmas())
+    return engine
+
+def seed(engine, rows, rng):
+    start = date.today() - timedelta(days=365)
+    with engine.begin() as connection:
+        batch = []
+        for _ in range(rows):
+            batch.append({
+                'market_id': rng.randint(1, 3),
+                'date': start + timedelta(days=rng.randint(0, 364)),
+                'amount': round(rng.uniform(1, 5000), 2),
+            })
+            if len(batch) == 5000:
+                connection.execute(insert(bench_ledger), batch)
+                batch = []
+        if batch:
+            connection.execute(insert(bench_ledger), batch)
+
+def run(engine, readers, writers, duration, seed_value):
+    stats = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    report = select(
+        bench_ledger.c.market_id, bench_ledger.c.date, func.sum(bench_ledger.c.amount)
+    ).group_by(bench_ledger.c.market_id, bench_ledger.c.date)
+
+    def record(kind, elapsed, ok):
+        with lock:
+            if ok:
+                stats[kind].append(elapsed)
+            else:
+                errors[kind] += 1
+
+    def reader():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                with engine.connect() as connection:
+                    connection.execute(report).fetchall()
+                record('read', time.perf_counter() - start, True)
+            except OperationalError:
+                record('read', 0, False)
+
+    def writer(seed_offset):
+        rng = random.Random(seed_value + seed_offset)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(bench_ledger), [{
+                        'market_id': rng.randint(1, 3),
+                        'date': date.today(),
+                        'amount': round(rng.uniform(1, 5000), 2),
+                    } for _ in range(5)])
+                record('write', time.perf_counter() - start, True)
+            except OperationalError:
+                record('write', 0, False)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    result = {}
+    for kind in ('read', 'write'):
+        result[f'{kind}s_per_second'] = len(stats[kind]) / wall
+        result[f'{kind}_p50_ms'] = (percentile(stats[kind], 50) or 0) * 1000
+        result[f'{kind}_p95_ms'] = (percentile(stats[kind], 95) or 0) * 1000
+        result[f'{kind}_errors'] = errors[kind]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent read/write database benchmark')
+    parser.add_argument('--database-url', help='Default: a scratch SQLite file in the temp directory')
+    parser.add_argument('--baseline', action='store_true', help='Use default engine settings')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--rows', type=int, default=200000, help='Rows seeded before the run')
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Also write the JSON result to this file')
+    args = parser.parse_args()
+
+    scratch = None
+    url = args.database_url
+    if not url:
+        scratch = tempfile.mkdtemp(prefix='bench_db_')
+        url = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+
+    engine = make_engine(url, args.baseline)
+    try:
+        metadata.drop_all(engine)
+        metadata.create_all(engine)
+        seed(engine, args.rows, random.Random(args.seed))
+        result = run(engine, args.readers, args.writers, args.duration, args.seed)
+    finally:
+        metadata.drop_all(engine)
+        engine.dispose()
+        if scratch:
+            for name in os.listdir(scratch):
+                os.remove(os.path.join(scratch, name))
+            os.rmdir(scratch)
+
+    summary = {
+        'backend': engine.dialect.name,
+        'baseline': args.baseline,
+        'readers': args.readers,
+        'writers': args.writers,
+        'rows': args.rows,
+        'duration': args.duration,
+        **result,
+    }
+    text = json.dumps(summary, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark worker boot: time to import the app module (create_app) and the resident memory after it.
+Run: python scripts/bench_startup.py [--runs 5] [--eager] [--output startup.json]
+
+Each run is a fresh interpreter, like a gunicorn worker cold start. --eager also imports
+pandas/openpyxl up front to show what the lazy Excel imports save.
+Prints a JSON summary (median/min/max seconds and RSS in MB, heavy modules loaded).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Executed in the child interpreter
+PROBE = r'''
+import json, sys, time
+start = time.perf_counter()
+if EAGER:
+    import pandas, openpyxl
+import app
+elapsed = time.perf_counter() - start
+
+rss_kb = None
+try:
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+except OSError:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss_kb //= 1024
+
+print(json.dumps({
+    'seconds': elapsed,
+    'rss_mb': rss_kb / 1024 if rss_kb else None,
+    'heavy_modules': sorted(m for m in ('pandas', 'numpy', 'openpyxl') if m in sys.modules),
+}))
+'''
+
+def run_once(eager):
+    code = PROBE.replace('EAGER', 'True' if eager else 'False')
+    result = subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def summarize(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--eager', action='store_true', help='Import pandas/openpyxl before the app')
+    parser.add_argument('--output', help='Also write the JSON summary to this file')
+    args = parser.parse_args()
+
+    samples = [run_once(args.eager) for _ in range(args.runs)]
+    summary = {
+        'runs': args.runs,
+        'eager': args.eager,
+        'python': sys.version.split()[0],
+        'import_seconds': summarize([s['seconds'] for s in samples]),
+        'rss_mb': summarize([s['rss_mb'] for s in samples]),
+        'heavy_modules': samples[-1]['heavy_modules'],
+    }
+
+    text = json.dumps(summary, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+if __name__ == '__main__':
+    main()
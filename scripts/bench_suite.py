@@ -0,0 +1,458 @@
+"""
+Repeatable endpoint benchmark: drives the Flask test client against the report, list, export,
+import and write endpoints of one market and records, per endpoint, p50/p95 latency, query
+count and DB time (from the Server-Timing header added by instrumentation.py) and the peak
+Python memory of one traced run.
+
+Generate a dataset first, then benchmark it:
+  python generate_test_data.py --database-url sqlite:///bench.db --end-date 2026-06-30
+  python scripts/bench_suite.py --database-url sqlite:///bench.db --output before.json
+  ... change code ...
+  python scripts/bench_suite.py --database-url sqlite:///bench.db --compare before.json
+
+SQLite databases are copied to a scratch file first, so write and import endpoints never change
+the original and every run starts from the same data. Other backends run read endpoints only
+unless --allow-writes is given. --compare exits with status 1 when an endpoint's p50 grew by
+more than --threshold or it issues more queries than in the baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+_SERVER_TIMING_DB = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def read_endpoints(ctx):
+    """(name, path) of the GET endpoints; month = last 30 days of data, year = everything."""
+    month = f"start_date={ctx['month_start']}&end_date={ctx['end']}"
+    year = f"start_date={ctx['year_start']}&end_date={ctx['end']}"
+    return [
+        ('dashboard', '/dashboard'),
+        ('daily_report', f"/api/daily-report?date={ctx['end']}"),
+        ('stock_by_supplier', '/api/stock-by-supplier'),
+        ('reports.daily_sales', f'/api/reports/daily-sales?{month}'),
+        ('reports.daily_sales_summary', f'/api/reports/daily-sales?summary=true&{year}'),
+        ('reports.safe_statement', f'/api/reports/safe-statement?{month}&limit=200'),
+        ('reports.profit_loss', f'/api/reports/profit-loss?{year}'),
+        ('reports.customer_receivables', '/api/reports/customer-receivables'),
+        ('reports.supplier_payables', '/api/reports/supplier-payables'),
+        ('reports.sales', f'/api/reports/sales?{month}'),
+        ('reports.sales_export', f'/api/reports/sales/export?{month}'),
+        ('reports.inventory_stock', '/api/reports/inventory-stock'),
+        ('reports.inventory_snapshot', '/api/reports/inventory-snapshot'),
+        ('reports.container_report', f"/api/reports/container-report?container_id={ctx['container_id']}"),
+        ('reports.stock_value_details', '/api/reports/stock-value-details'),
+        ('reports.stock_value_details_export', '/api/reports/stock-value-details/export'),
+        ('reports.average_sale_price', f'/api/reports/average-sale-price?{year}'),
+        ('reports.average_sale_price_export', f'/api/reports/average-sale-price/export?{year}'),
+        ('reports.last_purchase_price', '/api/reports/last-purchase-price'),
+        ('reports.last_purchase_price_export', '/api/reports/last-purchase-price/export'),
+        ('reports.average_last_n_sales', '/api/reports/average-last-n-sales'),
+        ('reports.average_last_n_sales_compare', '/api/reports/average-last-n-sales?n=5,10,20'),
+        ('reports.average_last_n_sales_export', '/api/reports/average-last-n-sales/export'),
+        ('reports.safe_out', f'/api/reports/safe-out?{month}'),
+        ('reports.safe_out_export', f'/api/reports/safe-out/export?{month}'),
+        ('safe.transactions', f'/api/safe/transactions?{month}'),
+        ('safe.balance', '/api/safe/balance'),
+        ('safe.movement_report', f'/api/safe/movement-report?{month}'),
+        ('safe.movement_report_export', f'/api/safe/movement-report/export?{month}'),
+        ('safe.collected_money_report', f'/api/safe/collected-money-report?{month}'),
+        ('safe.collected_money_report_export', f'/api/safe/collected-money-report/export?{month}'),
+        ('companies.list', '/api/companies'),
+        ('companies.supplier_statement', f"/api/companies/{ctx['supplier_id']}/statement?limit=200"),
+        ('companies.supplier_statement_export', f"/api/companies/{ctx['supplier_id']}/statement/export"),
+        ('companies.customer_statement', f"/api/companies/{ctx['customer_id']}/statement?limit=200"),
+        ('companies.customer_statement_export', f"/api/companies/{ctx['customer_id']}/statement/export"),
+        ('items.list', '/api/items'),
+        ('items.summary', '/api/items/summary'),
+        ('items.stock_movement', f"/api/items/stock-movement?item_id={ctx['item_id']}&{year}"),
+        ('items.stock_movement_export', f"/api/items/stock-movement/export?item_id={ctx['item_id']}&{year}"),
+        ('items.price_breakdown', f"/api/items/{ctx['item_id']}/price-breakdown"),
+        ('items.export', '/api/items/export'),
+        ('sales.list', f'/api/sales?{month}'),
+        ('sales.page', '/api/sales?limit=200'),
+        ('sales.page_search', '/api/sales?limit=200&q=SAL&sort=total_amount'),
+        ('sales.by_item', f"/api/sales/by-item?item_id={ctx['item_id']}"),
+        ('payments.list', f'/api/payments?{month}'),
+        ('payments.page', '/api/payments?limit=200'),
+        ('payments.export', f'/api/payments/export?{month}'),
+        ('purchases.containers', '/api/purchases/containers'),
+        ('purchases.by_supplier', f'/api/purchases/by-supplier?{year}'),
+        ('purchases.by_item', f"/api/purchases/by-item?item_id={ctx['item_id']}"),
+        ('purchases.export', '/api/purchases/export'),
+        ('expenses.list', f'/api/expenses?{month}'),
+        ('expenses.export', f'/api/expenses/export?{month}'),
+        ('inventory.adjustments', '/api/inventory/adjustments'),
+    ]
+
+def write_endpoints(ctx, rng):
+    """(name, path, payload factory) of the JSON write endpoints."""
+    def sale():
+        item = rng.choice(ctx['stocked_items'])
+        return {'customer_id': ctx['customer_id'], 'supplier_id': item['supplier_id'], 'date': ctx['end'],
+                'items': [{'item_id': item['id'], 'quantity': 1, 'unit_price': 1000}]}
+
+    def payment():
+        return {'company_id': ctx['customer_id'], 'payment_type': 'In', 'amount': rng.randint(1000, 50000),
+                'currency': ctx['base_currency'], 'exchange_rate': 1, 'date': ctx['end']}
+
+    def expense():
+        return {'date': ctx['end'], 'description': 'Benchmark', 'category': 'Transport',
+                'amount': rng.randint(1000, 50000), 'currency': ctx['base_currency'], 'exchange_rate': 1}
+
+    def container():
+        items = rng.sample(ctx['supplier_items'], min(30, len(ctx['supplier_items'])))
+        return {'container_number': f'BENCH-{rng.randint(0, 10 ** 9)}', 'supplier_id': ctx['supplier_id'],
+                'currency': ctx['supplier_currency'], 'exchange_rate': 1, 'date': ctx['end'],
+                'expense3_amount': 10000, 'expense3_currency': ctx['base_currency'], 'expense3_exchange_rate': 1,
+                'items': [{'item_id': item_id, 'quantity': 10, 'unit_price': 20} for item_id in items]}
+
+    def adjustment():
+        return {'item_id': ctx['item_id'], 'adjustment_type': 'Increase', 'quantity': 1,
+                'date': ctx['end'], 'reason': 'Benchmark'}
+
+    def safe_adjustment():
+        return {'transaction_type': 'Inflow', 'amount': rng.randint(1000, 50000),
+                'currency': ctx['base_currency'], 'exchange_rate': 1, 'date': ctx['end']}
+
+    return [
+        ('write.sale', '/api/sales', sale),
+        ('write.payment', '/api/payments', payment),
+        ('write.expense', '/api/expenses', expense),
+        ('write.container', '/api/purchases/containers', container),
+        ('write.inventory_adjustment', '/api/inventory/adjustments', adjustment),
+        ('write.safe_adjustment', '/api/safe/adjustment', safe_adjustment),
+    ]
+
+def _workbook(header, rows):
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    output = BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+def import_endpoints(ctx, rng, rows):
+    """(name, path, factory returning (xlsx bytes, extra form fields)) of the Excel imports."""
+    end = ctx['end']
+
+    def items():
+        sample = rng.sample(ctx['items'], min(rows, len(ctx['items'])))
+        return _workbook(['Code', 'Name', 'Weight', 'Supplier'],
+                         [[i['code'], i['name'], float(i['weight']), ctx['supplier_names'][i['supplier_id']]]
+                          for i in sample]), {'mode': 'upsert'}
+
+    def sales():
+        lines = []
+        for _ in range(rows):
+            item = rng.choice(ctx['stocked_items'])
+            lines.append([end, ctx['customer_name'], ctx['supplier_names'][item['supplier_id']],
+                          item['code'], 1, 1000])
+        return _workbook(['Date', 'Customer', 'Supplier', 'ItemCode', 'Quantity', 'UnitPrice'], lines), {}
+
+    def payments():
+        return _workbook(['Date', 'Company', 'PaymentType', 'Amount', 'Currency', 'AmountBaseCurrency'],
+                         [[end, ctx['customer_name'], 'In', amount, ctx['base_currency'], amount]
+                          for amount in (rng.randint(1000, 50000) for _ in range(rows))]), {}
+
+    def containers():
+        number = f'BENCH-IMP-{rng.randint(0, 10 ** 9)}'
+        codes = rng.sample(ctx['supplier_codes'], min(rows, len(ctx['supplier_codes'])))
+        return _workbook(['ContainerNumber', 'Date', 'Supplier', 'Currency', 'ExchangeRate', 'ItemCode',
+                          'Quantity', 'UnitPrice'],
+                         [[number, end, ctx['supplier_name'], ctx['supplier_currency'], 1, code, 10, 20]
+                          for code in codes]), {}
+
+    def expenses():
+        return _workbook(['Date', 'Description', 'Category', 'Amount', 'Currency', 'ExchangeRate'],
+                         [[end, 'Benchmark', 'Transport', rng.randint(1000, 50000), ctx['base_currency'], 1]
+                          for _ in range(rows)]), {}
+
+    return [
+        ('import.items', '/api/items/import', items),
+        ('import.sales', '/api/sales/import', sales),
+        ('import.payments', '/api/payments/import', payments),
+        ('import.containers', '/api/purchases/containers/import', containers),
+        ('import.expenses', '/api/expenses/import', expenses),
+    ]
+
+def load_context(market_name):
+    """Ids, names and dates of the benchmarked market, plus its row counts."""
+    from sqlalchemy import func, select
+    from models import db, Market, Company, Item, PurchaseContainer, Sale, SaleItem, Payment, SafeTransaction
+
+    market = Market.query.filter_by(name=market_name).first() if market_name else None
+    if market is None:
+        # Default to the market with the most sales
+        market_id = db.session.execute(
+            select(Sale.market_id).group_by(Sale.market_id).order_by(func.count().desc()).limit(1)
+        ).scalar()
+        market = db.session.get(Market, market_id) if market_id else None
+    if market is None:
+        raise SystemExit('No market with data found; run generate_test_data.py first')
+
+    last_sale = db.session.execute(select(func.max(Sale.date)).where(Sale.market_id == market.id)).scalar()
+    end = last_sale or datetime.utcnow().date()
+    companies = Company.query.filter_by(market_id=market.id).all()
+    suppliers = [c for c in companies if c.category == 'Supplier']
+    customers = [c for c in companies if c.category == 'Customer']
+    items = [{'id': i.id, 'code': i.code, 'name': i.name, 'weight': i.weight, 'supplier_id': i.supplier_id}
+             for i in Item.query.filter_by(market_id=market.id).filter(Item.supplier_id.isnot(None))]
+    if not suppliers or not customers or not items:
+        raise SystemExit(f'Market {market.name} has no suppliers, customers or items')
+
+    # The supplier with the most containers and the credit customer with the most sales
+    supplier_id = db.session.execute(
+        select(PurchaseContainer.supplier_id).where(PurchaseContainer.market_id == market.id)
+        .group_by(PurchaseContainer.supplier_id).order_by(func.count().desc()).limit(1)
+    ).scalar() or suppliers[0].id
+    customer_id = db.session.execute(
+        select(Sale.customer_id).where(Sale.market_id == market.id, Sale.payment_type == 'Credit')
+        .group_by(Sale.customer_id).order_by(func.count().desc()).limit(1)
+    ).scalar() or customers[0].id
+    container_id = db.session.execute(
+        select(func.max(PurchaseContainer.id)).where(PurchaseContainer.market_id == market.id)
+    ).scalar()
+    sold_item_ids = set(db.session.execute(
+        select(SaleItem.item_id).join_from(Sale, SaleItem)
+        .where(Sale.market_id == market.id, Sale.date >= end - timedelta(days=30)).distinct()
+    ).scalars())
+    stocked_items = [i for i in items if i['id'] in sold_item_ids] or items
+    supplier = next(c for c in suppliers if c.id == supplier_id)
+    customer = next(c for c in customers if c.id == customer_id)
+    supplier_items = [i for i in items if i['supplier_id'] == supplier_id] or items
+
+    counts = {}
+    for name, model in (('sales', Sale), ('payments', Payment), ('safe_transactions', SafeTransaction),
+                        ('containers', PurchaseContainer), ('items', Item)):
+        counts[name] = db.session.execute(
+            select(func.count()).select_from(model).where(model.market_id == market.id)
+        ).scalar()
+
+    ctx = {
+        'market_id': market.id,
+        'market_name': market.name,
+        'base_currency': market.base_currency,
+        'end': end.isoformat(),
+        'month_start': (end - timedelta(days=29)).isoformat(),
+        'year_start': (end - timedelta(days=364)).isoformat(),
+        'supplier_id': supplier_id,
+        'supplier_name': supplier.name,
+        'supplier_currency': supplier.currency,
+        'supplier_names': {c.id: c.name for c in suppliers},
+        'customer_id': customer_id,
+        'customer_name': customer.name,
+        'container_id': container_id,
+        'item_id': stocked_items[0]['id'],
+        'items': items,
+        'stocked_items': stocked_items,
+        'supplier_items': [i['id'] for i in supplier_items],
+        'supplier_codes': [i['code'] for i in supplier_items],
+    }
+    db.session.remove()
+    return ctx, counts
+
+class Runner:
+    def __init__(self, app, ctx, repeat, warmup):
+        self.client = app.test_client()
+        self.repeat = repeat
+        self.warmup = warmup
+        response = self.client.post('/login', data={'username': ctx['username'], 'password': ctx['password']})
+        if response.status_code != 302:
+            raise SystemExit('Login failed; check --username/--password')
+        with self.client.session_transaction() as sess:
+            sess['current_market_id'] = ctx['market_id']
+
+    def call(self, method, path, body):
+        if method == 'GET':
+            return self.client.get(path)
+        if isinstance(body, tuple):
+            content, form = body
+            data = dict(form, file=(BytesIO(content), 'benchmark.xlsx'))
+            return self.client.post(path, data=data, content_type='multipart/form-data')
+        return self.client.post(path, json=body)
+
+    def measure(self, method, path, make_body=None, repeat=None):
+        make_body = make_body or (lambda: None)
+        for _ in range(self.warmup):
+            self.call(method, path, make_body())
+
+        latencies, queries, db_ms, statuses, sizes = [], [], [], {}, []
+        for _ in range(repeat or self.repeat):
+            body = make_body()
+            started = time.perf_counter()
+            response = self.call(method, path, body)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            sizes.append(len(response.get_data()))
+            timing = _SERVER_TIMING_DB.search(response.headers.get('Server-Timing', ''))
+            if timing:
+                db_ms.append(float(timing.group(1)))
+                queries.append(int(timing.group(2)))
+
+        # One extra traced run for peak memory; tracing slows Python down, so it is not timed
+        body = make_body()
+        tracemalloc.start()
+        self.call(method, path, body)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'method': method,
+            'path': path,
+            'runs': len(latencies),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'max_ms': round(max(latencies), 1),
+            'queries': percentile(queries, 50),
+            'db_ms': round(percentile(db_ms, 50), 1) if db_ms else None,
+            'peak_memory_kb': peak // 1024,
+            'response_bytes': percentile(sizes, 50),
+            'status': {str(code): n for code, n in sorted(statuses.items())},
+        }
+
+def compare(results, baseline, threshold):
+    """Print per-endpoint changes against a baseline run; returns the names of regressions."""
+    regressions = []
+    for name, current in results['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before or not before.get('p50_ms'):
+            continue
+        ratio = current['p50_ms'] / before['p50_ms']
+        more_queries = (current['queries'] or 0) > (before['queries'] or 0)
+        regressed = ratio > threshold or more_queries
+        if regressed:
+            regressions.append(name)
+        print(f"{'REGRESSION' if regressed else '':>10} {name:<42} p50 {before['p50_ms']:>9.1f} -> "
+              f"{current['p50_ms']:>9.1f} ms ({ratio:5.2f}x)  queries {before['queries']} -> {current['queries']}",
+              file=sys.stderr)
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.join(os.path.dirname(__file__), '..')).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the API endpoints with the Flask test client')
+    parser.add_argument('--database-url', help='Default: DATABASE_URL or sqlite:///accounting.db')
+    parser.add_argument('--market', help='Market name (default: the market with the most sales)')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per read endpoint')
+    parser.add_argument('--write-repeat', type=int, default=3, help='Timed runs per write/import endpoint')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--import-rows', type=int, default=200, help='Rows per imported workbook')
+    parser.add_argument('--only', help='Only endpoints whose name contains this text')
+    parser.add_argument('--skip-writes', action='store_true', help='Skip the write and import endpoints')
+    parser.add_argument('--allow-writes', action='store_true',
+                        help='Run write/import endpoints against a non-SQLite database (changes its data)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Also write the JSON results to this file')
+    parser.add_argument('--compare', help='Baseline JSON from an earlier run')
+    parser.add_argument('--threshold', type=float, default=1.25, help='p50 ratio counted as a regression')
+    args = parser.parse_args()
+
+    url = (args.database_url or os.environ.get('DATABASE_URL', 'sqlite:///accounting.db')).replace(
+        'postgres://', 'postgresql://')
+    scratch = None
+    if url.startswith('sqlite:///'):
+        source = url[len('sqlite:///'):]
+        if not os.path.isabs(source) and not os.path.exists(source):
+            # Flask-SQLAlchemy resolves relative SQLite paths against the instance folder
+            source = os.path.join(os.path.dirname(__file__), '..', 'instance', source)
+        if not os.path.exists(source):
+            raise SystemExit(f'SQLite database not found: {source}')
+        scratch = tempfile.mkdtemp(prefix='bench_suite_')
+        copy = os.path.join(scratch, 'bench.db')
+        shutil.copyfile(source, copy)
+        url = f'sqlite:///{copy}'
+    run_writes = not args.skip_writes and (scratch is not None or args.allow_writes)
+
+    from app import create_app
+    app = create_app({'SQLALCHEMY_DATABASE_URI': url, 'SQL_INSTRUMENTATION': True, 'TESTING': True})
+    rng = random.Random(args.seed)
+
+    try:
+        with app.app_context():
+            ctx, counts = load_context(args.market)
+        ctx.update(username=args.username, password=args.password)
+        runner = Runner(app, ctx, args.repeat, args.warmup)
+
+        plan = [(name, 'GET', path, None, None) for name, path in read_endpoints(ctx)]
+        if run_writes:
+            plan += [(name, 'POST', path, factory, args.write_repeat)
+                     for name, path, factory in write_endpoints(ctx, rng)]
+            plan += [(name, 'POST', path, factory, args.write_repeat)
+                     for name, path, factory in import_endpoints(ctx, rng, args.import_rows)]
+        if args.only:
+            plan = [entry for entry in plan if args.only in entry[0]]
+
+        endpoints = {}
+        for name, method, path, factory, repeat in plan:
+            result = runner.measure(method, path, factory, repeat)
+            endpoints[name] = result
+            print(f"{name:<42} p50 {result['p50_ms']:>9.1f} ms  p95 {result['p95_ms']:>9.1f} ms  "
+                  f"{result['queries']} queries  {result['peak_memory_kb']} KB  {result['status']}",
+                  file=sys.stderr)
+    finally:
+        if scratch:
+            with app.app_context():
+                from models import db
+                for engine in db.engines.values():
+                    engine.dispose()
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    results = {
+        'meta': {
+            'at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'backend': url.split(':', 1)[0],
+            'market': ctx['market_name'],
+            'end_date': ctx['end'],
+            'dataset': counts,
+            'repeat': args.repeat,
+            'write_repeat': args.write_repeat if run_writes else 0,
+            'import_rows': args.import_rows,
+        },
+        'endpoints': endpoints,
+    }
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s): {", ".join(regressions)}', file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
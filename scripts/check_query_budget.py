@@ -0,0 +1,134 @@
+"""
+Check that the list endpoints issue a fixed number of SQL statements, however many rows they
+return (no lazy load per row).
+
+Generates two seeded datasets of different sizes in scratch SQLite files, calls each endpoint
+against both with the Flask test client and reads the query count from the Server-Timing header
+(instrumentation.py). Exits with status 1 if an endpoint goes over its budget or issues a
+different number of queries on the larger dataset.
+
+  python scripts/check_query_budget.py
+  python scripts/check_query_budget.py --small-scale 0.002 --large-scale 0.02 --keep
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_suite import _SERVER_TIMING_DB, load_context
+
+# (name, path, budget). Budgets count every statement of the request, including loading the
+# logged-in user; none of the paths filter by date, so each returns more rows on the larger dataset.
+ENDPOINTS = [
+    ('sales.list', lambda ctx: '/api/sales', 3),
+    ('sales.page', lambda ctx: '/api/sales?limit=50', 3),
+    ('sales.by_item', lambda ctx: '/api/sales/by-item', 2),
+    ('payments.list', lambda ctx: '/api/payments', 2),
+    ('payments.page', lambda ctx: '/api/payments?limit=50', 3),
+    ('items.list', lambda ctx: '/api/items', 2),
+    ('items.stock_movement', lambda ctx: '/api/items/stock-movement', 3),
+    ('items.stock_movement_item', lambda ctx: f"/api/items/stock-movement?item_id={ctx['item_id']}", 3),
+    ('purchases.containers', lambda ctx: '/api/purchases/containers', 2),
+    ('expenses.list', lambda ctx: '/api/expenses', 3),
+    ('safe.transactions', lambda ctx: '/api/safe/transactions', 2),
+    ('inventory.adjustments', lambda ctx: '/api/inventory/adjustments', 2),
+    ('reports.daily_sales', lambda ctx: '/api/reports/daily-sales', 2),
+    ('reports.daily_sales_summary', lambda ctx: '/api/reports/daily-sales?summary=true', 3),
+    ('reports.last_purchase_price', lambda ctx: '/api/reports/last-purchase-price', 2),
+    ('reports.average_last_n_sales', lambda ctx: '/api/reports/average-last-n-sales?n=5,10,20', 2),
+]
+
+def generate(path, scale, args):
+    subprocess.run([
+        sys.executable, os.path.join(ROOT, 'generate_test_data.py'),
+        '--database-url', f'sqlite:///{path}', '--seed', str(args.seed), '--end-date', args.end_date,
+        '--days', str(args.days), '--scale', str(scale),
+    ], check=True, cwd=ROOT, stdout=subprocess.DEVNULL)
+
+def count_queries(path, args):
+    """{endpoint name: (query count, status)} for the dataset at path."""
+    from app import create_app
+    from models import db
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'SQL_INSTRUMENTATION': True,
+                      'TESTING': True})
+    try:
+        with app.app_context():
+            ctx, counts = load_context(None)
+        client = app.test_client()
+        response = client.post('/login', data={'username': args.username, 'password': args.password})
+        if response.status_code != 302:
+            raise SystemExit('Login failed; check --username/--password')
+        with client.session_transaction() as sess:
+            sess['current_market_id'] = ctx['market_id']
+
+        results = {}
+        for name, make_path, _ in ENDPOINTS:
+            response = client.get(make_path(ctx))
+            timing = _SERVER_TIMING_DB.search(response.headers.get('Server-Timing', ''))
+            results[name] = (int(timing.group(2)) if timing else None, response.status_code)
+        return results, counts
+    finally:
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the per-request query budget of the list endpoints')
+    parser.add_argument('--small-scale', type=float, default=0.002)
+    parser.add_argument('--large-scale', type=float, default=0.01)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--end-date', default='2026-06-30')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated databases')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='query_budget_')
+    try:
+        runs = []
+        for label, scale in (('small', args.small_scale), ('large', args.large_scale)):
+            path = os.path.join(scratch, f'{label}.db')
+            generate(path, scale, args)
+            results, counts = count_queries(path, args)
+            print(f"{label}: {counts['sales']} sales, {counts['payments']} payments, "
+                  f"{counts['safe_transactions']} safe transactions", file=sys.stderr)
+            runs.append(results)
+    finally:
+        if args.keep:
+            print(f'Databases kept in {scratch}', file=sys.stderr)
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    small, large = runs
+    failures = []
+    for name, _, budget in ENDPOINTS:
+        (small_queries, small_status), (large_queries, large_status) = small[name], large[name]
+        problems = []
+        if small_status != 200 or large_status != 200:
+            problems.append(f'status {small_status}/{large_status}')
+        if small_queries is None or large_queries is None:
+            problems.append('no Server-Timing header')
+        else:
+            if max(small_queries, large_queries) > budget:
+                problems.append(f'over budget of {budget}')
+            if small_queries != large_queries:
+                problems.append('grows with row count')
+        if problems:
+            failures.append(name)
+        print(f"{'FAIL' if problems else 'ok':>4} {name:<30} queries {small_queries} -> {large_queries} "
+              f"(budget {budget}) {'; '.join(problems)}")
+
+    if failures:
+        print(f'{len(failures)} endpoint(s) failed: {", ".join(failures)}', file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
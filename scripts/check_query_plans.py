@@ -0,0 +1,86 @@
+"""
+Check that the hot report queries are planned as index scans.
+Run against the configured database: python scripts/check_query_plans.py
+Exits with status 1 if any query does not use its expected index.
+
+On PostgreSQL sequential scans are disabled for the check, so small tables
+still show whether the planner can use the index at all.
+"""
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import app
+from models import db
+
+# (description, expected index, SQL)
+HOT_QUERIES = [
+    ('Sales in a date range', 'idx_sale_market_date',
+     "SELECT id FROM sales WHERE market_id = :market_id AND date >= :start AND date <= :end ORDER BY date"),
+    ('Customer sales for a statement', 'idx_sale_customer_date',
+     "SELECT id FROM sales WHERE customer_id = :company_id AND date < :start"),
+    ('Lines of a sale', 'idx_sale_item_sale',
+     "SELECT id FROM sale_items WHERE sale_id = :id"),
+    ('Sales of an item', 'idx_sale_item_item',
+     "SELECT id FROM sale_items WHERE item_id = :id"),
+    ('Company payments for a statement', 'idx_payment_market_company_date',
+     "SELECT id FROM payments WHERE market_id = :market_id AND company_id = :company_id AND date >= :start"),
+    ('Payments in a date range', 'idx_payment_market_date',
+     "SELECT id FROM payments WHERE market_id = :market_id AND date >= :start AND date <= :end"),
+    ('Safe ledger in order', 'idx_safe_txn_market_date',
+     "SELECT id FROM safe_transactions WHERE market_id = :market_id AND date >= :start ORDER BY date, id"),
+    ('Safe transactions of a payment', 'idx_safe_txn_payment',
+     "SELECT id FROM safe_transactions WHERE payment_id = :id"),
+    ('Lines of a container', 'idx_purchase_item_container',
+     "SELECT id FROM purchase_items WHERE container_id = :id"),
+    ('Purchases of an item', 'idx_purchase_item_item',
+     "SELECT id FROM purchase_items WHERE item_id = :id"),
+    ('Supplier containers for a statement', 'idx_container_market_supplier_date',
+     "SELECT id FROM purchase_containers WHERE market_id = :market_id AND supplier_id = :company_id AND date < :start"),
+    ('Expenses in a date range', 'idx_expense_market_date',
+     "SELECT id FROM general_expenses WHERE market_id = :market_id AND date >= :start AND date <= :end"),
+    ('Adjustments of an item', 'idx_adjustment_market_item_date',
+     "SELECT id FROM inventory_adjustments WHERE market_id = :market_id AND item_id = :id AND date <= :end"),
+    ('Allocations of a sale line', 'idx_allocation_sale_item',
+     "SELECT id FROM sale_item_allocations WHERE sale_item_id = :id"),
+]
+
+PARAMS = {
+    'market_id': 1,
+    'company_id': 1,
+    'id': 1,
+    'start': date(2024, 1, 1),
+    'end': date(2024, 12, 31),
+}
+
+def explain(connection, sql):
+    if connection.dialect.name == 'sqlite':
+        rows = connection.execute(db.text(f'EXPLAIN QUERY PLAN {sql}'), PARAMS).fetchall()
+        return '\n'.join(str(row[-1]) for row in rows)
+    rows = connection.execute(db.text(f'EXPLAIN {sql}'), PARAMS).fetchall()
+    return '\n'.join(str(row[0]) for row in rows)
+
+def main():
+    failures = 0
+    with app.app_context():
+        with db.engine.connect() as connection:
+            if connection.dialect.name == 'postgresql':
+                connection.execute(db.text('SET enable_seqscan = off'))
+            for description, index_name, sql in HOT_QUERIES:
+                plan = explain(connection, sql)
+                ok = index_name in plan
+                failures += 0 if ok else 1
+                print(f"{'OK  ' if ok else 'FAIL'} {description} ({index_name})")
+                if not ok:
+                    print('     ' + plan.replace('\n', '\n     '))
+            connection.rollback()
+
+    if failures:
+        print(f'{failures} of {len(HOT_QUERIES)} queries do not use their index')
+        sys.exit(1)
+    print(f'All {len(HOT_QUERIES)} queries use their index')
+
+if __name__ == '__main__':
+    main()
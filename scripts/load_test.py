@@ -0,0 +1,131 @@
+"""
+Load-test profile: a weighted mix of the common page and report requests, replayed at increasing
+concurrency against a running server, to see how throughput scales with workers/threads.
+
+Run the server first, e.g. gunicorn -c gunicorn.conf.py app:app, then:
+  python scripts/load_test.py --url http://localhost:5000 --concurrency 1,2,4,8 --duration 20
+
+Each client logs in with its own session. Prints (and optionally writes) JSON with requests/s,
+p50/p95 latency and error count per concurrency level.
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+# (weight, path) - {start}/{end} cover the last 30 days
+PROFILE = [
+    (10, '/dashboard'),
+    (8, '/api/sales?start_date={start}&end_date={end}'),
+    (6, '/api/payments?start_date={start}&end_date={end}'),
+    (6, '/api/items'),
+    (5, '/api/safe/transactions?start_date={start}&end_date={end}'),
+    (4, '/api/reports/daily-sales?start_date={start}&end_date={end}'),
+    (4, '/api/reports/safe-statement?start_date={start}&end_date={end}&limit=200'),
+    (3, '/api/safe/collected-money-report?start_date={start}&end_date={end}'),
+    (3, '/api/purchases/containers'),
+    (2, '/api/daily-report?date={end}'),
+]
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+class Client:
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        body = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+        self.opener.open(f'{self.base_url}/login', data=body, timeout=30).read()
+
+    def get(self, path):
+        with self.opener.open(f'{self.base_url}{path}', timeout=60) as response:
+            response.read()
+            return response.status
+
+def run_level(args, paths, weights, concurrency):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = Client(args.url, args.username, args.password)
+        while time.perf_counter() < deadline:
+            path = rng.choices(paths, weights)[0]
+            start = time.perf_counter()
+            try:
+                ok = client.get(path) < 400
+            except (urllib.error.URLError, OSError):
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(args.seed + i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_second': len(latencies) / wall if wall else 0,
+        'p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 95) * 1000 if latencies else None,
+        'mean_ms': statistics.mean(latencies) * 1000 if latencies else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay the load-test profile at increasing concurrency')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--concurrency', default='1,2,4,8', help='Comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per concurrency level')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Also write the JSON results to this file')
+    args = parser.parse_args()
+
+    end = date.today()
+    dates = {'start': (end - timedelta(days=30)).isoformat(), 'end': end.isoformat()}
+    paths = [path.format(**dates) for _, path in PROFILE]
+    weights = [weight for weight, _ in PROFILE]
+
+    levels = []
+    for concurrency in (int(c) for c in args.concurrency.split(',')):
+        result = run_level(args, paths, weights, concurrency)
+        levels.append(result)
+        print(f"{concurrency:>3} clients: {result['requests_per_second']:.1f} req/s, "
+              f"p50 {result['p50_ms'] or 0:.0f} ms, p95 {result['p95_ms'] or 0:.0f} ms, "
+              f"{result['errors']} errors", file=sys.stderr)
+
+    text = json.dumps({'url': args.url, 'duration': args.duration, 'levels': levels}, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -400,6 +400,10 @@ function importItems() {
     
     const formData = new FormData();
     formData.append('file', file);
+    const upsertCheckbox = document.getElementById('importUpsert');
+    if (upsertCheckbox && upsertCheckbox.checked) {
+        formData.append('mode', 'upsert');
+    }
     
     // Show loading state
     const submitBtn = document.querySelector('#importForm button[type="submit"]');
@@ -424,7 +428,9 @@ function importItems() {
             alert('Error: ' + data.error);
         } else {
             let message = '';
-            if (data.imported > 0) {
+            if (data.updated !== undefined) {
+                message = `Inserted ${data.inserted}, updated ${data.updated}, unchanged ${data.unchanged} item(s)`;
+            } else if (data.imported > 0) {
                 message = `Successfully imported ${data.imported} new item(s)`;
             } else {
                 message = 'No new items were imported';
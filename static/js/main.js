@@ -386,6 +386,54 @@ function sortTable(table, columnIndex) {
     rows.forEach(row => tbody.appendChild(row));
 }
 
+// Server-side sorting for paged tables: headers with data-sort name an API sort column.
+// Returns the sort state ({sort, order}); onChange is called (to reload) when a header is clicked.
+function makeServerSortable(table, defaultSort, defaultOrder, onChange) {
+    const state = { sort: defaultSort, order: defaultOrder };
+    if (!table || !table.id) return state;
+
+    const key = `server_sort_${table.id}`;
+    try {
+        const saved = JSON.parse(localStorage.getItem(key) || 'null');
+        if (saved && table.querySelector(`th[data-sort="${saved.sort}"]`)) {
+            state.sort = saved.sort;
+            state.order = saved.order === 'asc' ? 'asc' : 'desc';
+        }
+    } catch (e) {
+        console.warn('Could not restore sort state:', e);
+    }
+
+    const headers = table.querySelectorAll('th[data-sort]');
+    const showState = () => {
+        headers.forEach(th => {
+            th.classList.remove('sort-asc', 'sort-desc');
+            if (th.dataset.sort === state.sort) {
+                th.classList.add(state.order === 'asc' ? 'sort-asc' : 'sort-desc');
+            }
+        });
+    };
+
+    headers.forEach(header => {
+        header.addEventListener('click', function() {
+            if (state.sort === header.dataset.sort) {
+                state.order = state.order === 'asc' ? 'desc' : 'asc';
+            } else {
+                state.sort = header.dataset.sort;
+                state.order = 'asc';
+            }
+            try {
+                localStorage.setItem(key, JSON.stringify(state));
+            } catch (e) {
+                console.warn('Could not save sort state:', e);
+            }
+            showState();
+            onChange();
+        });
+    });
+    showState();
+    return state;
+}
+
 // Format Currency
 function formatCurrency(amount, currency = '') {
     return `${currency} ${parseFloat(amount).toLocaleString('en-US', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}`;
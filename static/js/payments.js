@@ -3,7 +3,15 @@
 let companies = [];
 let sales = [];
 
+// Payments are loaded a page at a time, sorted and filtered by the server
+const PAYMENTS_PAGE_SIZE = 200;
+let paymentsData = [];
+let paymentsNextCursor = null;
+let paymentsSort = { sort: 'date', order: 'desc' };
+
 document.addEventListener('DOMContentLoaded', function() {
+    paymentsSort = makeServerSortable(document.getElementById('paymentsTable'), 'date', 'desc', () => loadPayments());
+    
     // Load market info to get base currency
     fetch('/api/current-market')
         .then(response => response.json())
@@ -19,7 +27,6 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     
     loadCompanies();
-    makeSortable(document.getElementById('paymentsTable'));
     
     // Form submission
     document.getElementById('paymentForm').addEventListener('submit', function(e) {
@@ -80,18 +87,36 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
-function loadPayments() {
+function loadPayments(cursor = null) {
     const companyId = document.getElementById('filterCompany')?.value || '';
+    const paymentType = document.getElementById('filterPaymentType')?.value || '';
+    const startDate = document.getElementById('filterStartDate')?.value || '';
+    const endDate = document.getElementById('filterEndDate')?.value || '';
+    const search = (document.getElementById('filterSearch')?.value || '').trim();
     
-    let url = '/api/payments';
-    if (companyId) {
-        url += `?company_id=${companyId}`;
-    }
+    let url = '/api/payments?';
+    if (companyId) url += `company_id=${companyId}&`;
+    if (paymentType) url += `payment_type=${paymentType}&`;
+    if (startDate) url += `start_date=${startDate}&`;
+    if (endDate) url += `end_date=${endDate}&`;
+    if (search) url += `q=${encodeURIComponent(search)}&`;
+    url += `limit=${PAYMENTS_PAGE_SIZE}&sort=${paymentsSort.sort}&order=${paymentsSort.order}&`;
+    if (cursor) url += `cursor=${encodeURIComponent(cursor)}&`;
     
     fetch(url)
         .then(response => response.json())
         .then(data => {
-            renderPaymentsTable(data);
+            // Later pages are appended; totals and count (of all matching payments) come with the first page
+            paymentsData = cursor ? paymentsData.concat(data.payments) : data.payments;
+            paymentsNextCursor = data.next_cursor;
+            renderPaymentsTable(paymentsData);
+            if (!cursor) {
+                document.getElementById('paymentsSummary').textContent =
+                    `${data.count} ${data.count === 1 ? 'payment' : 'payments'} · ` +
+                    `In: ${formatCurrency(data.total_in_base_currency, baseCurrency)} · ` +
+                    `Out: ${formatCurrency(data.total_out_base_currency, baseCurrency)}`;
+            }
+            document.getElementById('paymentsLoadMore').style.display = paymentsNextCursor ? 'block' : 'none';
         })
         .catch(error => {
             console.error('Error loading payments:', error);
@@ -161,14 +186,6 @@ function renderPaymentsTable(payments) {
             </td>
         </tr>
     `).join('');
-    
-    // Restore sort state after table is rendered
-    setTimeout(() => {
-        const table = document.getElementById('paymentsTable');
-        if (table) {
-            restoreTableSort(table);
-        }
-    }, 150);
 }
 
 function openAddPaymentModal() {
@@ -314,15 +331,19 @@ function closeImportModal() {
 
 function clearPaymentFilters() {
     document.getElementById('filterCompany').value = '';
+    document.getElementById('filterPaymentType').value = '';
+    document.getElementById('filterStartDate').value = '';
+    document.getElementById('filterEndDate').value = '';
+    document.getElementById('filterSearch').value = '';
     loadPayments();
 }
 
 function exportPayments() {
     // Get current filter values if any filters exist
-    const companyId = document.getElementById('paymentCompanyFilter')?.value || '';
-    const paymentType = document.getElementById('paymentTypeFilter')?.value || '';
-    const startDate = document.getElementById('paymentStartDate')?.value || '';
-    const endDate = document.getElementById('paymentEndDate')?.value || '';
+    const companyId = document.getElementById('filterCompany')?.value || '';
+    const paymentType = document.getElementById('filterPaymentType')?.value || '';
+    const startDate = document.getElementById('filterStartDate')?.value || '';
+    const endDate = document.getElementById('filterEndDate')?.value || '';
     
     let url = '/api/payments/export?';
     if (companyId) url += `company_id=${companyId}&`;
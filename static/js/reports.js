@@ -280,7 +280,7 @@ function showAverageLastNSalesReport() {
     currentReportType = 'average-last-n-sales';
     const pdfBtn = document.getElementById('exportPDFBtn');
     if (pdfBtn) pdfBtn.style.display = 'none';
-    document.getElementById('reportTitle').textContent = 'Average of Last 10 Sales';
+    document.getElementById('reportTitle').textContent = 'Average of Last N Sales';
     document.getElementById('reportFilters').style.display = 'none';
     document.getElementById('containerReportFilters').style.display = 'none';
     document.getElementById('safeReportTypeFilter').style.display = 'none';
@@ -549,7 +549,8 @@ function loadDailySalesReport() {
     const startDate = document.getElementById('reportStartDate').value;
     const endDate = document.getElementById('reportEndDate').value;
     
-    let url = '/api/reports/daily-sales?';
+    // Day totals only; the lines of a day are fetched when its invoice is opened
+    let url = '/api/reports/daily-sales?summary=true&';
     if (startDate) url += `start_date=${startDate}&`;
     if (endDate) url += `end_date=${endDate}&`;
     
@@ -601,7 +602,7 @@ function loadDailySalesReport() {
                         <td style="padding: 10px; text-align: right; border: 1px solid #ddd; color: #4caf50;">${formatCurrency(day.total_paid)}</td>
                         <td style="padding: 10px; text-align: right; border: 1px solid #ddd; color: ${day.total_balance > 0 ? '#f44336' : '#4caf50'};">${formatCurrency(day.total_balance)}</td>
                         <td style="padding: 10px; text-align: center; border: 1px solid #ddd;">
-                            <button class="btn btn-primary btn-sm" onclick="showDailyInvoice('${day.date}', ${JSON.stringify(day).replace(/'/g, "\\'").replace(/"/g, '&quot;')})">View Invoice</button>
+                            <button class="btn btn-primary btn-sm" onclick="loadDailyInvoice('${day.date}')">View Invoice</button>
                         </td>
                     </tr>
                 `;
@@ -621,6 +622,24 @@ function loadDailySalesReport() {
         });
 }
 
+function loadDailyInvoice(date) {
+    fetch(`/api/reports/daily-sales?start_date=${date}&end_date=${date}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                alert('Error: ' + data.error);
+                return;
+            }
+            if (data.length > 0) {
+                showDailyInvoice(date, data[0]);
+            }
+        })
+        .catch(error => {
+            console.error('Error loading daily invoice:', error);
+            alert('Error loading invoice');
+        });
+}
+
 function showDailyInvoice(date, dayDataStr) {
     const dayData = typeof dayDataStr === 'string' ? JSON.parse(dayDataStr.replace(/&quot;/g, '"')) : dayDataStr;
     
@@ -4023,10 +4042,12 @@ function loadAverageLastNSalesReport() {
 
     const supplierId = document.getElementById('averageLastNSalesSupplier')?.value || '';
     const itemId = document.getElementById('averageLastNSalesItem')?.value || '';
+    const n = (document.getElementById('averageLastNSalesN')?.value || '').replace(/\s/g, '');
 
     let url = '/api/reports/average-last-n-sales?';
     if (supplierId) url += `supplier_id=${supplierId}&`;
     if (itemId) url += `item_id=${itemId}&`;
+    if (n) url += `n=${encodeURIComponent(n)}&`;
 
     fetch(url)
         .then(response => response.json())
@@ -4047,6 +4068,8 @@ function renderAverageLastNSalesReport(data) {
     const content = document.getElementById('reportContent');
     const items = data.items || [];
     const maxN = data.max_n || 10;
+    // Several N requested (e.g. 5,10,20): one extra average column per smaller N
+    const otherNs = (data.n_values || [maxN]).filter(n => n !== maxN);
 
     if (items.length === 0) {
         content.innerHTML = '<p style="color: var(--text-secondary); padding: 20px; text-align: center;">No sales data found for the selected filters.</p>';
@@ -4065,7 +4088,10 @@ function renderAverageLastNSalesReport(data) {
     html += '<th style="padding: 12px; text-align: left; border: 1px solid #ddd;">Item Name</th>';
     html += '<th style="padding: 12px; text-align: left; border: 1px solid #ddd;">Supplier</th>';
     html += '<th style="padding: 12px; text-align: center; border: 1px solid #ddd;">Sales Used (N)</th>';
-    html += '<th style="padding: 12px; text-align: right; border: 1px solid #ddd;">Avg Sale Price</th>';
+    otherNs.forEach(n => {
+        html += `<th style="padding: 12px; text-align: right; border: 1px solid #ddd;">Avg Last ${n}</th>`;
+    });
+    html += `<th style="padding: 12px; text-align: right; border: 1px solid #ddd;">${otherNs.length ? `Avg Last ${maxN}` : 'Avg Sale Price'}</th>`;
     html += '<th style="padding: 12px; text-align: right; border: 1px solid #ddd;">Total Qty</th>';
     html += '<th style="padding: 12px; text-align: right; border: 1px solid #ddd;">Total Revenue</th>';
     html += '</tr></thead><tbody>';
@@ -4077,13 +4103,17 @@ function renderAverageLastNSalesReport(data) {
         html += `<td style="padding: 10px; border: 1px solid #ddd;">${escapeHtml(item.item_name)}</td>`;
         html += `<td style="padding: 10px; border: 1px solid #ddd;">${escapeHtml(item.supplier_name || 'N/A')}</td>`;
         html += `<td style="padding: 10px; border: 1px solid #ddd; text-align: center;">${item.sales_used}</td>`;
+        otherNs.forEach(n => {
+            const average = item.averages ? item.averages[n] : null;
+            html += `<td style="padding: 10px; border: 1px solid #ddd; text-align: right;">${average ? formatNumber(average.average_sale_price) : 'N/A'}</td>`;
+        });
         html += `<td style="padding: 10px; border: 1px solid #ddd; text-align: right; font-weight: bold; color: #1e3a5f;">${formatNumber(item.average_sale_price)}</td>`;
         html += `<td style="padding: 10px; border: 1px solid #ddd; text-align: right;">${formatNumber(item.total_quantity_sold)}</td>`;
         html += `<td style="padding: 10px; border: 1px solid #ddd; text-align: right;">${formatNumber(item.total_revenue)}</td>`;
         html += '</tr>';
 
         html += `<tr id="item-details-${item.item_id}" style="display: none;">`;
-        html += '<td colspan="8" style="padding: 0; border: 1px solid #ddd; background: #fff;">';
+        html += `<td colspan="${8 + otherNs.length}" style="padding: 0; border: 1px solid #ddd; background: #fff;">`;
         html += '<div style="padding: 15px; background: #f8f9fa;">';
         html += '<h4 style="margin-top: 0; color: #1e3a5f;">Calculation Details</h4>';
         html += `<p style="margin-bottom: 10px;"><strong>Formula:</strong> Average = Total Revenue ÷ Total Quantity (from last ${item.sales_used} sale(s))</p>`;
@@ -4122,6 +4152,7 @@ function renderAverageLastNSalesReport(data) {
 function clearAverageLastNSalesFilters() {
     document.getElementById('averageLastNSalesSupplier').value = '';
     document.getElementById('averageLastNSalesItem').value = '';
+    document.getElementById('averageLastNSalesN').value = '10';
     loadAverageLastNSalesReport();
 }
 
@@ -4361,6 +4392,10 @@ function renderAverageSalePriceReport(data) {
         html += `<td style="padding: 10px; border: 1px solid #ddd; font-weight: bold;">${escapeHtml(item.item_code)}</td>`;
         html += `<td style="padding: 10px; border: 1px solid #ddd;">${escapeHtml(item.item_name)}</td>`;
         html += `<td style="padding: 10px; border: 1px solid #ddd;">${escapeHtml(item.supplier_name || 'N/A')}</td>`;
+        otherNs.forEach(n => {
+            const average = item.averages ? item.averages[n] : null;
+            html += `<td style="padding: 10px; border: 1px solid #ddd; text-align: right;">${average ? formatNumber(average.average_sale_price) : 'N/A'}</td>`;
+        });
         html += `<td style="padding: 10px; border: 1px solid #ddd; text-align: right; font-weight: bold; color: #1e3a5f;">${formatNumber(item.average_sale_price)}</td>`;
         html += `<td style="padding: 10px; border: 1px solid #ddd; text-align: right;">${formatNumber(item.total_quantity_sold)}</td>`;
         html += `<td style="padding: 10px; border: 1px solid #ddd; text-align: right;">${formatNumber(item.total_revenue)}</td>`;
@@ -4515,9 +4550,12 @@ function exportAverageLastNSalesReport() {
     const supplierId = document.getElementById('averageLastNSalesSupplier')?.value || '';
     const itemId = document.getElementById('averageLastNSalesItem')?.value || '';
     
+    const n = (document.getElementById('averageLastNSalesN')?.value || '').replace(/\s/g, '');
+    
     let url = '/api/reports/average-last-n-sales/export?';
     if (supplierId) url += `supplier_id=${supplierId}&`;
     if (itemId) url += `item_id=${itemId}&`;
+    if (n) url += `n=${encodeURIComponent(n)}&`;
     
     window.location.href = url;
 }
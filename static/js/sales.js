@@ -1,6 +1,10 @@
 // Sales page JavaScript
 
+// Sales are loaded a page at a time, sorted and filtered by the server
+const SALES_PAGE_SIZE = 200;
 let salesData = [];
+let salesNextCursor = null;
+let salesSort = { sort: 'date', order: 'desc' };
 let customers = [];
 let suppliers = [];
 let items = [];
@@ -14,10 +18,10 @@ document.addEventListener('DOMContentLoaded', function() {
     document.getElementById('filterEndDate').value = today.toISOString().split('T')[0];
     
     // Load data
+    salesSort = makeServerSortable(document.getElementById('salesTable'), 'date', 'desc', () => loadSales());
     loadSales();
     loadCustomers();
     loadSuppliers();
-    makeSortable(document.getElementById('salesTable'));
     
     // Check for sale_id in URL to open sale invoice
     const urlParams = new URLSearchParams(window.location.search);
@@ -42,6 +46,9 @@ document.addEventListener('DOMContentLoaded', function() {
     document.getElementById('filterSupplier').addEventListener('change', function() {
         loadSales();
     });
+    document.getElementById('filterSearch').addEventListener('change', function() {
+        loadSales();
+    });
     
     // Form submission
     document.getElementById('saleForm').addEventListener('submit', function(e) {
@@ -62,34 +69,37 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
-function loadSales() {
+function loadSales(cursor = null) {
     const startDate = document.getElementById('filterStartDate').value;
     const endDate = document.getElementById('filterEndDate').value;
     const customerId = document.getElementById('filterCustomer').value;
     const supplierId = document.getElementById('filterSupplier').value;
+    const search = document.getElementById('filterSearch').value.trim();
     
     let url = '/api/sales?';
     if (startDate) url += `start_date=${startDate}&`;
     if (endDate) url += `end_date=${endDate}&`;
     if (customerId) url += `customer_id=${customerId}&`;
     if (supplierId) url += `supplier_id=${supplierId}&`;
+    if (search) url += `q=${encodeURIComponent(search)}&`;
+    url += `limit=${SALES_PAGE_SIZE}&sort=${salesSort.sort}&order=${salesSort.order}&`;
+    if (cursor) url += `cursor=${encodeURIComponent(cursor)}&`;
     
     fetch(url)
         .then(response => response.json())
         .then(data => {
-            // Handle both old format (array) and new format (object with sales array)
-            const sales = Array.isArray(data) ? data : data.sales;
-            const total = Array.isArray(data) ? null : data.total_amount;
-            const count = Array.isArray(data) ? data.length : data.count;
-            
-            salesData = sales;
-            renderSalesTable(sales);
-            updateSalesTotal(total, count);
+            // Later pages are appended; totals and count are of all matching sales
+            salesData = cursor ? salesData.concat(data.sales) : data.sales;
+            salesNextCursor = data.next_cursor;
+            renderSalesTable(salesData);
+            updateSalesTotal(data.total_amount, data.count);
+            document.getElementById('salesLoadMore').style.display = salesNextCursor ? 'block' : 'none';
         })
         .catch(error => {
             console.error('Error loading sales:', error);
             document.getElementById('salesTableBody').innerHTML = 
                 '<tr><td colspan="11" class="empty-state">Error loading sales</td></tr>';
+            document.getElementById('salesLoadMore').style.display = 'none';
             updateSalesTotal(null, 0);
         });
 }
@@ -238,14 +248,6 @@ function renderSalesTable(sales) {
     
     updateSelectAllCheckbox();
     updateDeleteButton();
-    
-    // Restore sort state after table is rendered
-    setTimeout(() => {
-        const table = document.getElementById('salesTable');
-        if (table) {
-            restoreTableSort(table);
-        }
-    }, 150);
 }
 
 function openAddSaleModal() {
@@ -645,6 +647,7 @@ function clearFilters() {
     document.getElementById('filterEndDate').value = '';
     document.getElementById('filterCustomer').value = '';
     document.getElementById('filterSupplier').value = '';
+    document.getElementById('filterSearch').value = '';
     loadSales();
 }
 